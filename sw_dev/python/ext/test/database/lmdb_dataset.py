@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# LMDB-backed PyTorch dataset of the tensor records in lmdb_util.
+#	- The LMDB environment is opened lazily in each process which reads samples, i.e. in each DataLoader worker after fork.
+#		LMDB environments must not be used across fork(), and an environment can be opened only once in a process.
+#		So an environment is shared by all the datasets of the same path in a process, and the one inherited from the parent process is closed and reopened.
+#	- Each dataset keeps a long-lived read transaction and a cursor.
+#	- Sequential keys are prefetched with the cursor in a window of prefetch_size records.
+#	- The key index can be split into disjoint contiguous shards, e.g. one per node.
+
+import os
+import numpy as np
+import torch
+import lmdb
+import lmdb_util
+
+_environments = dict()  # LMDB directory path -> (process ID, lmdb.Environment).
+
+def _get_environment(lmdb_dir_path):
+	pid, env = _environments.get(lmdb_dir_path, (None, None))
+	if pid != os.getpid():
+		if env is not None:
+			# Inherited from the parent process. It is opened without locks, so it can be closed in a child process.
+			env.close()
+		env = lmdb.open(lmdb_dir_path, readonly=True, lock=False, readahead=False, meminit=False)
+		_environments[lmdb_dir_path] = os.getpid(), env
+	return env
+
+def load_lmdb_keys(lmdb_dir_path):
+	# Returns all the keys in ascending order as a NumPy bytes array, which is far smaller than a list of bytes objects.
+	# NOTE [caution] >> NumPy bytes arrays strip trailing null bytes, so keys must not end with b'\x00'.
+	with _get_environment(lmdb_dir_path).begin() as txn:
+		return np.array(list(txn.cursor().iternext(keys=True, values=False)), dtype=np.bytes_)
+
+class LmdbDataset(torch.utils.data.Dataset):
+	def __init__(self, lmdb_dir_path, keys=None, shard_index=0, num_shards=1, prefetch_size=64, transform=None, target_transform=None):
+		super().__init__()
+
+		if not 0 <= shard_index < num_shards:
+			raise ValueError('Invalid shard index: {} not in [0, {}).'.format(shard_index, num_shards))
+
+		self.lmdb_dir_path = lmdb_dir_path
+		self.prefetch_size = prefetch_size
+		self.transform = transform
+		self.target_transform = target_transform
+
+		keys = load_lmdb_keys(lmdb_dir_path) if keys is None else np.asarray(keys, dtype=np.bytes_)
+		# Disjoint contiguous ranges of keys, so that each shard reads sequentially.
+		start, stop = len(keys) * shard_index // num_shards, len(keys) * (shard_index + 1) // num_shards
+		self.keys = keys[start:stop]
+
+		self._reset()
+
+	def __getstate__(self):
+		# LMDB handles are not picklable, and must be reopened in the worker processes.
+		state = self.__dict__.copy()
+		for name in ('_pid', '_txn', '_cursor', '_window_start', '_window'):
+			state.pop(name)
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._reset()
+
+	def __del__(self):
+		self.close()
+
+	def __len__(self):
+		return len(self.keys)
+
+	def __getitem__(self, idx):
+		if idx < 0:
+			idx += len(self.keys)
+		if not self._window_start <= idx < self._window_start + len(self._window):
+			# Prefetch only for sequential access, e.g. with a sequential or a block-shuffling sampler.
+			is_sequential = idx == self._window_start + len(self._window)
+			self._prefetch(idx, self.prefetch_size if is_sequential else 1)
+		x, y = self._window[idx - self._window_start]
+
+		if self.transform:
+			x = self.transform(x)
+		if self.target_transform:
+			y = self.target_transform(y)
+		return x, y
+
+	def close(self):
+		if getattr(self, '_pid', None) == os.getpid():
+			self._cursor.close()
+			self._txn.abort()
+		self._reset()
+
+	def _reset(self):
+		self._pid = None
+		self._txn, self._cursor = None, None
+		self._window_start, self._window = 0, list()
+
+	def _open(self):
+		if self._pid != os.getpid():
+			# The handles inherited from the parent process are invalidated when the environment is reopened.
+			self._reset()
+			self._txn = _get_environment(self.lmdb_dir_path).begin(buffers=True)
+			self._cursor = self._txn.cursor()
+			self._pid = os.getpid()
+
+	def _prefetch(self, idx, size):
+		# Reads the records of keys[idx:idx + size] with one cursor seek.
+		self._open()
+		window_keys = self.keys[idx:idx + size]
+		if not self._cursor.set_key(window_keys[0]):
+			raise KeyError('Key not found: {}.'.format(window_keys[0]))
+
+		window = list()
+		for key in window_keys:
+			if self._cursor.key() != key and not self._cursor.set_key(key):
+				raise KeyError('Key not found: {}.'.format(key))
+			x, y = lmdb_util.decode_tensor_record(self._cursor.value())
+			window.append((x.copy(), y))  # Copy out of the transaction's memory map.
+			self._cursor.next()
+		self._window_start, self._window = idx, window
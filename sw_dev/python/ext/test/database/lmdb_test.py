@@ -1,10 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 
-import os, json
+import os, json, time, shutil
 import numpy as np
 #os.environ['LMDB_FORCE_CFFI'] = '1'
 import lmdb
+import lmdb_util
 
 def basic_operation():
 	try:
@@ -35,7 +36,8 @@ def basic_operation():
 	except lmdb.MapFullError as ex:
 		print(f'lmdb.MapFullError raised: {ex}.')
 
-def write_to_db_example(use_caffe_datum=False):
+# record_format = {'json', 'caffe_datum', 'binary'}.
+def write_to_db_example(record_format='binary'):
 	N = 1000
 	X = np.zeros((N, 3, 32, 32), dtype=np.uint8)
 	y = np.zeros(N, dtype=np.int64)
@@ -45,7 +47,10 @@ def write_to_db_example(use_caffe_datum=False):
 		map_size = X.nbytes * 10
 		with lmdb.open(lmdb_dir_path, map_size=map_size) as env:
 			with env.begin(write=True) as txn:  # A transaction object.
-				if use_caffe_datum:
+				if 'binary' == record_format:
+					keys = ['{:08}'.format(i).encode('ascii') for i in range(N)]
+					lmdb_util.put_many(txn, keys, X, y)
+				elif 'caffe_datum' == record_format:
 					#from caffe.proto import caffe_pb2
 					import caffe_pb2
 
@@ -80,13 +85,23 @@ def write_to_db_example(use_caffe_datum=False):
 	except lmdb.MapFullError as ex:
 		print('lmdb.MapFullError raised: {}.'.format(ex))
 
-def read_from_db_example(use_caffe_datum=False):
+def read_from_db_example(record_format='binary'):
 	lmdb_dir_path = './mylmdb'
 	with lmdb.open(lmdb_dir_path, readonly=True) as env:
+		if 'binary' == record_format:
+			with env.begin(buffers=True) as txn:
+				# Zero-copy views, which are valid only in the transaction.
+				x, y = lmdb_util.decode_tensor_record(txn.get(b'00000000'))
+				print(x.shape, y)
+
+				for x, y in lmdb_util.get_many(txn, [b'00000001', b'00000002', b'00000003']):
+					print(x.shape, y)
+			return
+
 		with env.begin() as txn:
 			raw_datum = txn.get(b'00000000')
 
-	if use_caffe_datum:
+	if 'caffe_datum' == record_format:
 		#from caffe.proto import caffe_pb2
 		import caffe_pb2
 
@@ -106,12 +121,16 @@ def read_from_db_example(use_caffe_datum=False):
 
 	print(x.shape, y)
 
-def key_value_example(use_caffe_datum=False):
+def key_value_example(record_format='binary'):
 	lmdb_dir_path = './mylmdb'
 	with lmdb.open(lmdb_dir_path, readonly=True) as env:
-		with env.begin() as txn:
+		with env.begin(buffers=True) as txn:
 			cursor = txn.cursor()
-			if use_caffe_datum:
+			if 'binary' == record_format:
+				for k, v in cursor:
+					x, y = lmdb_util.decode_tensor_record(v)
+					print(bytes(k).decode(), x.shape, y)
+			elif 'caffe_datum' == record_format:
 				#from caffe.proto import caffe_pb2
 				import caffe_pb2
 
@@ -123,14 +142,87 @@ def key_value_example(use_caffe_datum=False):
 					x = np.fromstring(datum.data, dtype=np.uint8)
 					x = x.reshape(datum.channels, datum.height, datum.width)
 					y = datum.label
-					print(k.decode(), x.shape, y)
+					print(bytes(k).decode(), x.shape, y)
 			else:
 				for k, v in cursor:
-					datum = json.loads(v.decode('ascii'))
+					datum = json.loads(bytes(v).decode('ascii'))
 					x = np.array(datum['data'], dtype=np.uint8)
 					x = x.reshape(datum['channels'], datum['height'], datum['width'])
 					y = datum['label']
-					print(k.decode(), x.shape, y)
+					print(bytes(k).decode(), x.shape, y)
+
+def auto_growing_writer_example():
+	N = 100000
+	lmdb_dir_path = './mylmdb_stream'
+	shutil.rmtree(lmdb_dir_path, ignore_errors=True)
+
+	# No guessed map size: it starts at 1 MB and grows geometrically whenever lmdb.MapFullError is raised.
+	start_time = time.time()
+	with lmdb_util.LmdbWriter(lmdb_dir_path, batch_size=1000, initial_map_size=1024**2, growth_factor=2, append=True) as writer:
+		for i in range(N):
+			# Samples are streamed one by one, e.g. from a data generator.
+			x = np.random.randint(256, size=(3, 32, 32), dtype=np.uint8)
+			y = i % 10
+			# Keys are monotonically increasing, so they can be appended.
+			writer.put_tensor('{:08}'.format(i).encode('ascii'), x, y)
+		writer.flush()
+		print('{} samples written: {:.1f} samples/sec, #commits = {}, #map resizes = {}, map size = {} bytes.'.format(N, N / (time.time() - start_time), writer.num_commits, writer.num_map_resizes, writer.map_size))
+
+	with lmdb.open(lmdb_dir_path, readonly=True) as env:
+		print(env.stat())
+
+def record_format_benchmark():
+	N = 10000
+	X = np.random.randint(256, size=(N, 3, 32, 32), dtype=np.uint8)
+	y = np.random.randint(10, size=N, dtype=np.int64)
+	keys = ['{:08}'.format(i).encode('ascii') for i in range(N)]
+
+	def encode_json(x, label):
+		return json.dumps({'channels': x.shape[0], 'height': x.shape[1], 'width': x.shape[2], 'data': x.tolist(), 'label': int(label)}).encode('ascii')
+	def decode_json(v):
+		datum = json.loads(bytes(v).decode('ascii'))
+		return np.array(datum['data'], dtype=np.uint8).reshape(datum['channels'], datum['height'], datum['width']), datum['label']
+
+	codecs = {
+		'json': (encode_json, decode_json),
+		'binary': (lmdb_util.encode_tensor_record, lmdb_util.decode_tensor_record),
+	}
+	try:
+		#from caffe.proto import caffe_pb2
+		import caffe_pb2
+
+		def encode_caffe_datum(x, label):
+			datum = caffe_pb2.Datum()
+			datum.channels, datum.height, datum.width = x.shape
+			datum.data = x.tobytes()
+			datum.label = int(label)
+			return datum.SerializeToString()
+		def decode_caffe_datum(v):
+			datum = caffe_pb2.Datum()
+			datum.ParseFromString(v)
+			return np.frombuffer(datum.data, dtype=np.uint8).reshape(datum.channels, datum.height, datum.width), datum.label
+		codecs['caffe_datum'] = (encode_caffe_datum, decode_caffe_datum)
+	except ImportError:
+		print('caffe_pb2 not found: protoc --python_out=. caffe.proto')
+
+	for record_format, (encode, decode) in codecs.items():
+		lmdb_dir_path = './mylmdb_{}'.format(record_format)
+		shutil.rmtree(lmdb_dir_path, ignore_errors=True)
+		with lmdb.open(lmdb_dir_path, map_size=X.nbytes * 10) as env:
+			start_time = time.time()
+			with env.begin(write=True) as txn:
+				with txn.cursor() as cursor:
+					cursor.putmulti((key, encode(x, label)) for key, x, label in zip(keys, X, y))
+			write_time = time.time() - start_time
+
+			num_bytes = 0
+			start_time = time.time()
+			with env.begin(buffers=True) as txn:
+				for key, v in txn.cursor():
+					x, label = decode(v)
+					num_bytes += len(v)
+			read_time = time.time() - start_time
+			print('{}: {:.1f} bytes/sample (raw = {} bytes), write = {:.1f} samples/sec, decode = {:.1f} samples/sec.'.format(record_format, num_bytes / N, X[0].nbytes, N / write_time, N / read_time))
 
 def main():
 	basic_operation()
@@ -140,10 +232,13 @@ def main():
 	#	For using Caffe Datum:
 	#		protoc --python_out=. caffe.proto
 
-	use_caffe_datum = False
-	#write_to_db_example(use_caffe_datum)
-	#read_from_db_example(use_caffe_datum)
-	#key_value_example(use_caffe_datum)
+	record_format = 'binary'  # {'json', 'caffe_datum', 'binary'}.
+	#write_to_db_example(record_format)
+	#read_from_db_example(record_format)
+	#key_value_example(record_format)
+
+	#auto_growing_writer_example()
+	#record_format_benchmark()
 
 #--------------------------------------------------------------------
 
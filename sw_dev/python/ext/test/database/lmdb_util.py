@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Binary tensor records for LMDB.
+#	- A record is a fixed header followed by the raw buffer of a NumPy array.
+#		Header: magic (4 bytes), dtype string (4 bytes, e.g. b'|u1'), ndim (uint8), padding (7 bytes), label (int64), shape (ndim x uint64).
+#		The header size, 24 + 8 x ndim bytes, is a multiple of 8 bytes, so the array data is 8-byte aligned relative to the start of the record.
+#		Whether decoded arrays are aligned in memory also depends on the alignment of the value in LMDB's page, which LMDB does not guarantee.
+#	- Records are decoded without a copy by np.frombuffer() over the memoryviews returned by LMDB transactions opened with buffers=True.
+#		The decoded arrays are only valid while the transaction is alive. Copy them if they have to outlive the transaction.
+
+import math, struct, functools
+import numpy as np
+
+TENSOR_RECORD_MAGIC = b'TRC2'  # b'TRC1' records had a 20-byte header, which misaligned the data.
+_HEADER = struct.Struct('<4s4sB7xq')
+
+@functools.lru_cache(maxsize=None)
+def _get_shape_struct(ndim):
+	return struct.Struct('<{}Q'.format(ndim))
+
+@functools.lru_cache(maxsize=None)
+def _get_dtype(dtype_str):
+	return np.dtype(dtype_str.rstrip(b'\x00').decode('ascii'))
+
+def encode_tensor_record(x, label=0):
+	# Unlike np.ascontiguousarray(), which makes 0-d arrays 1-d, so that scalars round-trip with shape ().
+	x = np.asarray(x, order='C')
+	dtype_str = x.dtype.str.encode('ascii')
+	if len(dtype_str) > 4 or x.dtype.hasobject:
+		raise ValueError('Unsupported dtype: {}.'.format(x.dtype))
+	header = _HEADER.pack(TENSOR_RECORD_MAGIC, dtype_str, x.ndim, int(label)) + _get_shape_struct(x.ndim).pack(*x.shape)
+	return b''.join([header, x.data])
+
+def decode_tensor_record(buf):
+	"""Decodes a record into (x, label). x is a read-only view of buf, not a copy."""
+	magic, dtype_str, ndim, label = _HEADER.unpack_from(buf, 0)
+	if magic != TENSOR_RECORD_MAGIC:
+		raise ValueError('Invalid tensor record magic: {}.'.format(bytes(magic)))
+	shape_struct = _get_shape_struct(ndim)
+	shape = shape_struct.unpack_from(buf, _HEADER.size)
+	x = np.frombuffer(buf, dtype=_get_dtype(dtype_str), count=math.prod(shape), offset=_HEADER.size + shape_struct.size)
+	return x.reshape(shape), label
+
+def put_many(txn, keys, xs, labels=None, append=False):
+	"""Puts a batch of tensor records in one call.
+
+	append=True is a fast path for keys which are greater than all the existing keys and sorted in ascending order.
+	With append=True, LMDB skips the items whose keys break the order, and goes on with the rest, so all the items are consumed.
+	So compare #added items with the number of items to detect skipped ones.
+	Returns (#consumed items, #added items).
+	"""
+	if labels is None:
+		labels = [0] * len(keys)
+	items = ((key, encode_tensor_record(x, label)) for key, x, label in zip(keys, xs, labels))
+	with txn.cursor() as cursor:
+		return cursor.putmulti(items, dupdata=False, overwrite=True, append=append)
+
+def get_many(txn, keys):
+	"""Gets a batch of tensor records in one call.
+
+	Returns a list of (x, label), or None for a missing key.
+	With a transaction opened with buffers=True, the arrays are zero-copy views which are only valid while the transaction is alive.
+	"""
+	with txn.cursor() as cursor:
+		values = dict((bytes(key), value) for key, value in cursor.getmulti(keys))
+	return [decode_tensor_record(values[key]) if key in values else None for key in keys]
+
+def _find_unordered_key(keys, last_key=None):
+	# The first key which is not greater than the keys before it, which LMDB's append mode skips.
+	for key in keys:
+		if last_key is not None and bytes(key) <= bytes(last_key):
+			return key
+		last_key = key
+	return None
+
+class LmdbWriter(object):
+	"""Streaming LMDB writer which commits in batches and grows the map size on demand.
+
+	Items are buffered and committed every batch_size items in one write transaction.
+	When a commit raises lmdb.MapFullError, the transaction is aborted, the map size is multiplied by growth_factor, and the same batch is committed again.
+	So the map size does not have to be guessed up front.
+	append=True is a fast path for keys which are greater than all the existing keys and put in ascending order.
+	"""
+
+	def __init__(self, lmdb_dir_path, batch_size=1000, initial_map_size=64 * 1024**2, growth_factor=2, append=False, **kwargs):
+		import lmdb
+
+		if growth_factor <= 1:
+			raise ValueError('Invalid growth factor: {} <= 1.'.format(growth_factor))
+		self.env = lmdb.open(lmdb_dir_path, map_size=initial_map_size, **kwargs)
+		self.batch_size = batch_size
+		self.growth_factor = growth_factor
+		self.append = append
+		self.num_commits, self.num_map_resizes = 0, 0
+		self._batch = list()
+		self._map_full_error = lmdb.MapFullError
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	@property
+	def map_size(self):
+		return self.env.info()['map_size']
+
+	def put(self, key, value):
+		self._batch.append((key, value))
+		if len(self._batch) >= self.batch_size:
+			self.flush()
+
+	def put_tensor(self, key, x, label=0):
+		self.put(key, encode_tensor_record(x, label))
+
+	def flush(self):
+		if not self._batch:
+			return
+		while True:
+			try:
+				with self.env.begin(write=True) as txn:
+					with txn.cursor() as cursor:
+						last_key = cursor.key() if cursor.last() else None
+						consumed, added = cursor.putmulti(self._batch, dupdata=False, overwrite=True, append=self.append)
+					if self.append and added != len(self._batch):
+						# Abort the transaction, instead of committing a partial batch.
+						raise ValueError('Keys are not in ascending order in append mode: {}.'.format(_find_unordered_key((key for key, _ in self._batch), last_key)))
+				break
+			except self._map_full_error:
+				# The transaction has been aborted, but the batch is still buffered.
+				self.env.set_mapsize(int(self.map_size * self.growth_factor))
+				self.num_map_resizes += 1
+		self.num_commits += 1
+		self._batch = list()
+
+	def close(self):
+		if self.env is not None:
+			try:
+				self.flush()
+			finally:
+				self.env.close()
+				self.env = None
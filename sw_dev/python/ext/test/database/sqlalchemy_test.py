@@ -6,7 +6,7 @@ import sys
 from sqlalchemy import Column, ForeignKey, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker
 
 Base = declarative_base()
@@ -71,8 +71,53 @@ def sqlite_example():
 	address = session.query(Address).filter(Address.person == person).one()
 	print('Postal code =', address.post_code)
 
+# REF [site] >> https://docs.sqlalchemy.org/en/20/dialects/sqlite.html#threading-pooling-behavior
+def sqlite_connection_pool_example():
+	import time, statistics, concurrent.futures
+	from sqlalchemy.pool import NullPool, QueuePool
+
+	db_filepath = './sqlalchemy_pool.db'
+	num_people, num_threads, num_queries = 10000, 8, 16000
+
+	def set_pragmas(dbapi_connection, connection_record):
+		cursor = dbapi_connection.cursor()
+		cursor.execute('PRAGMA journal_mode=WAL')
+		cursor.execute('PRAGMA synchronous=NORMAL')
+		cursor.close()
+
+	engine = create_engine('sqlite:///' + db_filepath, poolclass=QueuePool, pool_size=num_threads, connect_args={'check_same_thread': False})
+	event.listen(engine, 'connect', set_pragmas)
+	Base.metadata.drop_all(engine)
+	Base.metadata.create_all(engine)
+	with engine.begin() as connection:
+		connection.execute(Person.__table__.insert(), [{'name': 'person{}'.format(idx)} for idx in range(num_people)])
+
+	# NullPool opens a new DBAPI connection on every checkout, i.e. the open-per-call pattern.
+	per_call_engine = create_engine('sqlite:///' + db_filepath, poolclass=NullPool)
+	event.listen(per_call_engine, 'connect', set_pragmas)
+
+	statement = text('SELECT name FROM person WHERE id=:id')
+	for name, eng in [('open-per-call', per_call_engine), ('pooled', engine)]:
+		def query(person_id):
+			start_time = time.perf_counter()
+			with eng.connect() as connection:
+				connection.execute(statement, {'id': person_id}).fetchall()
+			return time.perf_counter() - start_time
+
+		with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
+			latencies = list(executor.map(query, [idx % num_people + 1 for idx in range(num_queries)]))
+		percentiles = statistics.quantiles(latencies, n=100)
+		print('{}: p50 = {:.1f} usecs, p99 = {:.1f} usecs.'.format(name, percentiles[49] * 1e6, percentiles[98] * 1e6))
+
+	per_call_engine.dispose()
+	engine.dispose()
+
 def main():
 	sqlite_example()
+	#sqlite_connection_pool_example()
+
+	# Thread-local SQLite connection pool without SQLAlchemy:
+	#	REF [file] >> ./sqlite_util.py
 
 	# pandas:
 	#	REF [file] >> ${SWDT_PYTHON_HOME}/rnd/test/data_analysis/pandas/pandas_database.py
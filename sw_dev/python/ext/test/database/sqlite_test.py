@@ -2,7 +2,9 @@
 # -*- coding: UTF-8 -*-
 
 #import sys
+import os, time, random, statistics, tempfile, threading, contextlib
 import sqlite3
+import sqlite_util
 
 def check_version():
 	try:
@@ -141,6 +143,145 @@ def update_example():
 		finally:
 			cursor.close()
 
+def bulk_insert_benchmark():
+	def generate_rows(num_rows):
+		for idx in range(num_rows):
+			yield 'user{}'.format(idx), 150.0 + (idx % 500) * 0.1, idx
+
+	def insert_row_by_row(connection, sql, rows):
+		# A transaction per row.
+		cursor = connection.cursor()
+		for row in rows:
+			cursor.execute(sql, row)
+			connection.commit()
+		cursor.close()
+
+	def insert_in_one_call(connection, sql, rows):
+		# One implicit transaction over a fully materialized list.
+		connection.executemany(sql, list(rows))
+		connection.commit()
+
+	db_filepath = './sqlite_bulk.db'
+	sql = 'INSERT INTO Users(Name, Height, MyID) VALUES (?, ?, ?)'
+	methods = [
+		('row-by-row', insert_row_by_row, False, 10**4),  # Too slow for more rows.
+		('executemany', insert_in_one_call, False, 10**6),  # The list of rows is held in memory.
+		('bulk_insert', lambda connection, sql, rows: sqlite_util.bulk_insert(connection, sql, rows, batch_size=100000), False, 10**7),
+		('bulk_insert + pragmas', lambda connection, sql, rows: sqlite_util.bulk_insert(connection, sql, rows, batch_size=100000), True, 10**7),
+	]
+	for num_rows in [10**4, 10**5, 10**6, 10**7]:
+		for name, insert, is_configured, max_rows in methods:
+			if num_rows > max_rows:
+				print('{}: {} rows skipped.'.format(name, num_rows))
+				continue
+
+			for suffix in ['', '-wal', '-shm']:
+				if os.path.exists(db_filepath + suffix):
+					os.remove(db_filepath + suffix)
+			connection = sqlite3.connect(db_filepath)
+			try:
+				if is_configured:
+					sqlite_util.configure_connection(connection)
+				connection.execute('CREATE TABLE Users (Id INTEGER PRIMARY KEY, Name TEXT NOT NULL, Height REAL, MyID INT UNIQUE)')
+				connection.commit()
+
+				start_time = time.perf_counter()
+				insert(connection, sql, generate_rows(num_rows))
+				elapsed_time = time.perf_counter() - start_time
+				assert connection.execute('SELECT Count(Id) FROM Users').fetchone()[0] == num_rows
+			finally:
+				connection.close()
+			print('{}: {} rows inserted in {:.3f} secs, {:.0f} rows/sec.'.format(name, num_rows, elapsed_time, num_rows / elapsed_time))
+
+	for suffix in ['', '-wal', '-shm']:
+		if os.path.exists(db_filepath + suffix):
+			os.remove(db_filepath + suffix)
+
+def blob_streaming_example():
+	db_filepath = './sqlite_user.db'
+	with sqlite3.connect(db_filepath) as connection:  # Creates a DB file.
+		sqlite_util.configure_connection(connection)
+		connection.execute('CREATE TABLE IF NOT EXISTS Images (Id INTEGER PRIMARY KEY, Name TEXT NOT NULL, Image BLOB)')
+		connection.commit()
+
+		with tempfile.TemporaryDirectory() as tmp_dir_path:
+			# A 32 MB image file.
+			src_filepath = os.path.join(tmp_dir_path, 'src.bin')
+			with open(src_filepath, 'wb') as fd:
+				for _ in range(32):
+					fd.write(os.urandom(1024**2))
+
+			start_time = time.perf_counter()
+			row_id = sqlite_util.insert_blob_from_file(connection, 'Images', 'Image', src_filepath, values={'Name': 'random'}, chunk_size=1024**2)
+			print('Image streamed into the DB: {:.3f} secs.'.format(time.perf_counter() - start_time))
+
+			dst_filepath = os.path.join(tmp_dir_path, 'dst.bin')
+			start_time = time.perf_counter()
+			num_bytes = sqlite_util.read_blob_to_file(connection, 'Images', 'Image', row_id, dst_filepath, chunk_size=1024**2)
+			print('Image streamed out of the DB: {} bytes, {:.3f} secs.'.format(num_bytes, time.perf_counter() - start_time))
+
+			with open(src_filepath, 'rb') as fd_src, open(dst_filepath, 'rb') as fd_dst:
+				assert fd_src.read() == fd_dst.read()
+
+def connection_pool_benchmark():
+	db_filepath = './sqlite_pool.db'
+	num_rows, num_threads, num_queries_per_thread = 100000, 8, 2000
+	sql = 'SELECT Name, Height FROM Users WHERE Id=?'
+
+	for suffix in ['', '-wal', '-shm']:
+		if os.path.exists(db_filepath + suffix):
+			os.remove(db_filepath + suffix)
+
+	with sqlite_util.SqliteConnectionPool(db_filepath, num_readers=num_threads) as pool:
+		pool.execute('CREATE TABLE Users (Id INTEGER PRIMARY KEY, Name TEXT NOT NULL, Height REAL, MyID INT UNIQUE)')
+		pool.executemany('INSERT INTO Users(Name, Height, MyID) VALUES (?, ?, ?)', (('user{}'.format(idx), 150.0 + (idx % 500) * 0.1, idx) for idx in range(num_rows)))
+
+		def query_per_call(row_id):
+			# The current pattern: a connection is opened for each query.
+			with contextlib.closing(sqlite3.connect(db_filepath)) as connection:
+				return connection.execute(sql, (row_id,)).fetchall()
+
+		def query_pooled(row_id):
+			return pool.query(sql, (row_id,))
+
+		def run_concurrently(query):
+			latencies = list()
+			latencies_lock = threading.Lock()
+			def worker(seed):
+				rng = random.Random(seed)
+				local_latencies = list()
+				for _ in range(num_queries_per_thread):
+					start_time = time.perf_counter()
+					query(rng.randint(1, num_rows))
+					local_latencies.append(time.perf_counter() - start_time)
+				with latencies_lock:
+					latencies.extend(local_latencies)
+
+			threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(num_threads)]
+			start_time = time.perf_counter()
+			for thread in threads:
+				thread.start()
+			for thread in threads:
+				thread.join()
+			return latencies, time.perf_counter() - start_time
+
+		for name, query in [('open-per-call', query_per_call), ('pooled', query_pooled)]:
+			latencies, elapsed_time = run_concurrently(query)
+			percentiles = statistics.quantiles(latencies, n=100)
+			print('{}: {} threads, p50 = {:.1f} usecs, p99 = {:.1f} usecs, {:.0f} queries/sec.'.format(name, num_threads, percentiles[49] * 1e6, percentiles[98] * 1e6, len(latencies) / elapsed_time))
+
+		# Fan a batch of read queries across the reader threads.
+		queries = [(sql, (row_id,)) for row_id in random.Random(0).choices(range(1, num_rows + 1), k=num_threads * num_queries_per_thread)]
+		start_time = time.perf_counter()
+		results = pool.query_many(queries)
+		elapsed_time = time.perf_counter() - start_time
+		assert len(results) == len(queries) and all(len(rows) == 1 for rows in results)
+		print('query_many: {} queries, {:.0f} queries/sec.'.format(len(queries), len(queries) / elapsed_time))
+
+	for suffix in ['', '-wal', '-shm']:
+		if os.path.exists(db_filepath + suffix):
+			os.remove(db_filepath + suffix)
+
 def main():
 	check_version()
 
@@ -148,6 +289,11 @@ def main():
 	query_example()
 	update_example()
 
+	#--------------------
+	#bulk_insert_benchmark()
+	#blob_streaming_example()
+	#connection_pool_benchmark()
+
 #--------------------------------------------------------------------
 
 if '__main__' == __name__:
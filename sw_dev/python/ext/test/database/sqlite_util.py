@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Bulk ingestion and incremental BLOB I/O for SQLite.
+#	- Rows are streamed from any iterable, e.g. a generator, into executemany() in explicit transactions of batch_size rows.
+#		A transaction per row costs a journal sync per row, which dominates the insert time.
+#	- configure_connection() sets the pragmas for write-heavy workloads: WAL journal, synchronous=NORMAL, a large page cache, and in-memory temporary tables.
+#		With WAL and synchronous=NORMAL, a committed transaction can be lost on a power failure, but the DB is not corrupted.
+#	- Large BLOBs are written and read in chunks through Connection.blobopen() (Python 3.11+), so a multi-MB image is never held in memory as a whole.
+#		A BLOB cannot be resized by blob I/O, so a row is inserted with zeroblob(size) first and then filled in.
+#	- SqliteConnectionPool shares a DB file among threads with a single writer connection and a read-only connection per reader thread in WAL mode.
+#		In WAL mode, readers do not block the writer and the writer does not block readers.
+#		sqlite3 releases the GIL while SQLite steps a statement, so reads run concurrently in threads.
+# REF [site] >>
+#	https://www.sqlite.org/pragma.html
+#	https://www.sqlite.org/wal.html
+#	https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection.blobopen
+
+import os, itertools, threading, contextlib
+import concurrent.futures
+import sqlite3
+
+def configure_connection(connection, journal_mode='WAL', synchronous='NORMAL', cache_size=-64 * 1024, temp_store='MEMORY', mmap_size=None):
+	"""Sets the pragmas for bulk ingestion.
+
+	A negative cache_size is in KiB, i.e. -64 * 1024 is a 64 MiB page cache.
+	journal_mode is persistent in the DB file, but the other pragmas have to be set for each connection.
+	"""
+	cursor = connection.cursor()
+	try:
+		if journal_mode:
+			cursor.execute('PRAGMA journal_mode={}'.format(journal_mode))
+		if synchronous:
+			cursor.execute('PRAGMA synchronous={}'.format(synchronous))
+		if cache_size:
+			cursor.execute('PRAGMA cache_size={}'.format(int(cache_size)))
+		if temp_store:
+			cursor.execute('PRAGMA temp_store={}'.format(temp_store))
+		if mmap_size is not None:
+			cursor.execute('PRAGMA mmap_size={}'.format(int(mmap_size)))
+	finally:
+		cursor.close()
+
+def bulk_insert(connection, sql, rows, batch_size=100000):
+	"""Inserts rows from an iterable with executemany() in explicit transactions of batch_size rows.
+
+	rows is consumed lazily, one batch at a time, so a generator of any length can be ingested in bounded memory.
+	If an error occurs, the current batch is rolled back, but the batches committed before remain.
+	Returns the number of rows consumed.
+	"""
+	if batch_size <= 0:
+		raise ValueError('Invalid batch size: {} <= 0.'.format(batch_size))
+	if connection.in_transaction:
+		raise RuntimeError('A transaction is already open.')
+
+	rows = iter(rows)
+	num_rows = 0
+	cursor = connection.cursor()
+	try:
+		while True:
+			batch = list(itertools.islice(rows, batch_size))
+			if not batch:
+				break
+
+			# An explicit BEGIN, so that sqlite3 does not open a transaction implicitly (or not at all in autocommit mode).
+			cursor.execute('BEGIN')
+			try:
+				cursor.executemany(sql, batch)
+				connection.commit()
+			except BaseException:  # Also rolled back on KeyboardInterrupt, which is re-raised.
+				connection.rollback()
+				raise
+			num_rows += len(batch)
+	finally:
+		cursor.close()
+	return num_rows
+
+def insert_blob_from_file(connection, table, column, file_path, values=None, chunk_size=1024**2):
+	"""Inserts a row whose BLOB column is streamed from a file in chunks.
+
+	values is a dict of the other columns of the row.
+	Returns the row ID of the inserted row.
+	"""
+	values = dict() if values is None else dict(values)
+	blob_size = os.path.getsize(file_path)
+	columns = list(values.keys()) + [column]
+	sql = 'INSERT INTO {} ({}) VALUES ({}zeroblob(?))'.format(table, ', '.join(columns), '?, ' * len(values))
+
+	with open(file_path, 'rb') as fd:
+		with connection:  # Commits, or rolls back on an exception.
+			cursor = connection.execute(sql, list(values.values()) + [blob_size])
+			row_id = cursor.lastrowid
+			with connection.blobopen(table, column, row_id) as blob:
+				buf = bytearray(min(chunk_size, max(blob_size, 1)))
+				view = memoryview(buf)
+				while True:
+					num_bytes = fd.readinto(buf)
+					if not num_bytes:
+						break
+					blob.write(view[:num_bytes])
+	return row_id
+
+def iterate_blob_chunks(connection, table, column, row_id, chunk_size=1024**2):
+	"""Yields the BLOB of a row in chunks of bytes without loading the whole BLOB."""
+	with connection.blobopen(table, column, row_id, readonly=True) as blob:
+		while True:
+			chunk = blob.read(chunk_size)
+			if not chunk:
+				break
+			yield chunk
+
+def read_blob_to_file(connection, table, column, row_id, file_path, chunk_size=1024**2):
+	"""Streams the BLOB of a row into a file. Returns the number of bytes written."""
+	num_bytes = 0
+	with open(file_path, 'wb') as fd:
+		for chunk in iterate_blob_chunks(connection, table, column, row_id, chunk_size):
+			fd.write(chunk)
+			num_bytes += len(chunk)
+	return num_bytes
+
+class SqliteConnectionPool(object):
+	"""Connection manager for a SQLite DB file shared by many threads.
+
+	- Writes go through one writer connection, serialized by a lock.
+	- Each reader thread lazily opens its own read-only connection, which is reused for all its queries.
+	- Each connection keeps an LRU cache of up to cached_statements prepared statements (sqlite3's statement cache), so repeated SQL is not recompiled.
+		Use parameterized SQL, e.g. 'SELECT * FROM Users WHERE Id=?', so that the same statement is reused for different values.
+	- query_many() fans read queries across a thread pool of num_readers threads.
+	"""
+
+	def __init__(self, db_filepath, num_readers=4, cached_statements=256, timeout=5.0, **pragmas):
+		self.db_filepath = db_filepath
+		self.num_readers = num_readers
+		self.cached_statements = cached_statements
+		self.timeout = timeout
+
+		# The writer connection creates the DB file and switches it to WAL mode, which is persistent in the file.
+		self._writer = sqlite3.connect(db_filepath, timeout=timeout, cached_statements=cached_statements, check_same_thread=False, isolation_level=None)
+		configure_connection(self._writer, **pragmas)
+		self._write_lock = threading.Lock()
+
+		self._local = threading.local()
+		self._readers = list()
+		self._readers_lock = threading.Lock()
+		self._executor = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	@contextlib.contextmanager
+	def write_transaction(self):
+		"""Yields the writer connection in a transaction, which is committed on exit, or rolled back on an exception."""
+		with self._write_lock:
+			# BEGIN IMMEDIATE takes the write lock up front, instead of failing on the first write with SQLITE_BUSY.
+			self._writer.execute('BEGIN IMMEDIATE')
+			try:
+				yield self._writer
+			except BaseException:  # Also rolled back on KeyboardInterrupt or GeneratorExit, which are re-raised.
+				self._writer.execute('ROLLBACK')
+				raise
+			else:
+				self._writer.execute('COMMIT')
+
+	def execute(self, sql, parameters=()):
+		"""Executes a write statement in its own transaction. Returns the row ID of the last inserted row."""
+		with self.write_transaction() as connection:
+			return connection.execute(sql, parameters).lastrowid
+
+	def executemany(self, sql, seq_of_parameters):
+		"""Executes a write statement for each parameter set in one transaction. Returns the number of modified rows."""
+		with self.write_transaction() as connection:
+			return connection.executemany(sql, seq_of_parameters).rowcount
+
+	def get_reader(self):
+		"""Returns the read-only connection of the calling thread."""
+		connection = getattr(self._local, 'connection', None)
+		if connection is None:
+			connection = sqlite3.connect('file:{}?mode=ro'.format(self.db_filepath), uri=True, timeout=self.timeout, cached_statements=self.cached_statements, check_same_thread=False)
+			self._local.connection = connection
+			with self._readers_lock:
+				self._readers.append(connection)
+		return connection
+
+	def query(self, sql, parameters=()):
+		"""Runs a read query on the connection of the calling thread. Returns all the rows."""
+		cursor = self.get_reader().execute(sql, parameters)
+		try:
+			return cursor.fetchall()
+		finally:
+			cursor.close()
+
+	def query_many(self, queries):
+		"""Runs (sql, parameters) read queries concurrently in the reader threads.
+
+		Returns the lists of rows in the order of queries.
+		"""
+		if self._executor is None:
+			self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.num_readers, thread_name_prefix='sqlite_reader')
+		return list(self._executor.map(lambda query: self.query(*query), queries))
+
+	def close(self):
+		if self._executor is not None:
+			self._executor.shutdown(wait=True)
+			self._executor = None
+		with self._readers_lock:
+			# The readers are closed from this thread, which is allowed with check_same_thread=False.
+			for connection in self._readers:
+				connection.close()
+			self._readers = list()
+		self._local = threading.local()
+		if self._writer is not None:
+			self._writer.close()
+			self._writer = None
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Alignment of two sets of bounding boxes, e.g. pdfminer's text boxes and PyMuPDF's blocks of a page.
+#	- Boxes are (N, 4) arrays of (x0, y0, x1, y1).
+#	- BoxIndex bins a set of boxes into a uniform grid, and finds the box of maximum overlap for each of many query boxes at once.
+#		Candidate (query, box) pairs are generated from the grid cells which the query boxes cover, and their intersection areas are computed vectorized.
+#		So the cost grows with the number of overlapping pairs, not with the product of the numbers of boxes.
+#	- transform_bboxes() maps boxes between coordinate systems, e.g. from PDF points with the origin at the bottom-left to image pixels with the origin at the top-left.
+
+import numpy as np
+
+def transform_bboxes(bboxes, page_height=None, x_scale=1.0, y_scale=1.0):
+	"""Scales boxes, and flips them vertically first if page_height is given.
+
+	A flip maps y to page_height - y, e.g. from pdfminer's coordinates (origin at the bottom-left, +Y-axis upward) to PyMuPDF's or an image's (origin at the top-left, +Y-axis downward).
+	The flipped boxes are still (x0, y0, x1, y1) with y0 <= y1.
+	"""
+	bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+	if page_height is not None:
+		bboxes = np.stack([bboxes[:, 0], page_height - bboxes[:, 3], bboxes[:, 2], page_height - bboxes[:, 1]], axis=1)
+	return bboxes * np.array([x_scale, y_scale, x_scale, y_scale])
+
+def get_page_to_image_transform(page_bbox, image_size, flip=True):
+	"""Returns keyword arguments of transform_bboxes() which map boxes on a page of page_bbox to an image of image_size = (width, height)."""
+	page_width, page_height = page_bbox[2] - page_bbox[0], page_bbox[3] - page_bbox[1]
+	return dict(page_height=page_bbox[3] if flip else None, x_scale=image_size[0] / page_width, y_scale=image_size[1] / page_height)
+
+def compute_intersections(bboxes1, bboxes2):
+	"""Intersections of pairs of boxes. Returns (M, 4) intersections and (M,) areas, which are 0 for disjoint pairs."""
+	intersections = np.concatenate([np.maximum(bboxes1[:, :2], bboxes2[:, :2]), np.minimum(bboxes1[:, 2:], bboxes2[:, 2:])], axis=1)
+	areas = np.prod(np.maximum(intersections[:, 2:] - intersections[:, :2], 0), axis=1)
+	return intersections, areas
+
+class BoxIndex(object):
+	"""A uniform grid index over a set of boxes for maximum-overlap queries.
+
+	cell_size defaults to the median size of the boxes, so that a box covers a few cells.
+	It is floored at extent / sqrt(#boxes) per axis, so that the grid has at most about #boxes cells even if the boxes are degenerate, e.g. of zero width.
+	"""
+
+	def __init__(self, bboxes, cell_size=None):
+		self.bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+		if len(self.bboxes) == 0:
+			self._origin, self._cell_size, self._grid_shape = np.zeros(2), np.ones(2), (0, 0)
+			self._cell_offsets, self._cell_box_ids = np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+			return
+
+		if cell_size is None:
+			cell_size = np.median(self.bboxes[:, 2:] - self.bboxes[:, :2], axis=0)
+		self._origin = self.bboxes[:, :2].min(axis=0)
+		# Invalid boxes can extend to the left of or above their (x0, y0).
+		extent = np.maximum(self.bboxes[:, :2].max(axis=0), self.bboxes[:, 2:].max(axis=0)) - self._origin
+		self._cell_size = np.maximum(np.broadcast_to(np.asarray(cell_size, dtype=np.float64), (2,)), np.maximum(extent / np.sqrt(len(self.bboxes)), 1e-6))
+		cells_min = self._to_cells(self.bboxes[:, :2])
+		# Invalid boxes with x0 > x1 or y0 > y1 are put in the cell of (x0, y0).
+		cells_max = np.maximum(self._to_cells(self.bboxes[:, 2:]), cells_min)
+		self._grid_shape = tuple(int(size) for size in cells_max.max(axis=0) + 1)
+
+		# CSR arrays of cell -> box IDs.
+		box_ids, cell_ids = self._expand_cells(cells_min, cells_max)
+		order = np.argsort(cell_ids, kind='stable')
+		self._cell_box_ids = box_ids[order]
+		self._cell_offsets = np.zeros(self._grid_shape[0] * self._grid_shape[1] + 1, dtype=np.int64)
+		np.cumsum(np.bincount(cell_ids, minlength=len(self._cell_offsets) - 1), out=self._cell_offsets[1:])
+
+	def __len__(self):
+		return len(self.bboxes)
+
+	def _to_cells(self, points):
+		return np.floor((points - self._origin) / self._cell_size).astype(np.int64)
+
+	def _expand_cells(self, cells_min, cells_max):
+		# Returns (item IDs, cell IDs) of all the cells in [cells_min, cells_max] of each item.
+		counts = cells_max - cells_min + 1
+		num_cells = counts[:, 0] * counts[:, 1]
+		item_ids = np.repeat(np.arange(len(cells_min)), num_cells)
+		# The index of each cell within the cells of its item.
+		local_ids = np.arange(len(item_ids)) - np.repeat(np.cumsum(num_cells) - num_cells, num_cells)
+		cx = cells_min[item_ids, 0] + local_ids // counts[item_ids, 1]
+		cy = cells_min[item_ids, 1] + local_ids % counts[item_ids, 1]
+		return item_ids, cx * self._grid_shape[1] + cy
+
+	def query_pairs(self, query_bboxes):
+		"""Returns (query IDs, box IDs) of the unique pairs of query boxes and indexed boxes whose grid cells overlap."""
+		query_bboxes = np.asarray(query_bboxes, dtype=np.float64).reshape(-1, 4)
+		empty = np.zeros(0, dtype=np.int64)
+		if len(self.bboxes) == 0 or len(query_bboxes) == 0:
+			return empty, empty
+		# Queries outside the grid, and invalid ones, cannot overlap any box.
+		grid_max = np.array(self._grid_shape) - 1
+		cells_min, cells_max = self._to_cells(query_bboxes[:, :2]), self._to_cells(query_bboxes[:, 2:])
+		is_inside = np.all((cells_max >= 0) & (cells_min <= grid_max) & (cells_min <= cells_max), axis=1)
+		query_ids_inside = np.flatnonzero(is_inside)
+		cells_min = np.clip(cells_min[is_inside], 0, grid_max)
+		cells_max = np.clip(cells_max[is_inside], 0, grid_max)
+
+		item_ids, cell_ids = self._expand_cells(cells_min, cells_max)
+		starts, ends = self._cell_offsets[cell_ids], self._cell_offsets[cell_ids + 1]
+		num_boxes = ends - starts
+		pair_query_ids = np.repeat(query_ids_inside[item_ids], num_boxes)
+		positions = np.arange(num_boxes.sum()) - np.repeat(np.cumsum(num_boxes) - num_boxes, num_boxes) + np.repeat(starts, num_boxes)
+		pair_box_ids = self._cell_box_ids[positions]
+		# A pair is found once per shared cell.
+		pair_keys = np.unique(pair_query_ids * len(self.bboxes) + pair_box_ids)
+		return pair_keys // len(self.bboxes), pair_keys % len(self.bboxes)
+
+	def find_max_overlaps(self, query_bboxes, area_threshold=0):
+		"""Finds the indexed box of maximum intersection area for each query box.
+
+		Returns box IDs, areas, and intersections of shapes (N,), (N,), and (N, 4).
+		The box ID is -1 (and the intersection is NaN) if the maximum area is 0 or less than area_threshold.
+		Ties are broken by the smaller box ID.
+		"""
+		query_bboxes = np.asarray(query_bboxes, dtype=np.float64).reshape(-1, 4)
+		box_ids = np.full(len(query_bboxes), -1, dtype=np.int64)
+		max_areas = np.zeros(len(query_bboxes))
+		max_intersections = np.full((len(query_bboxes), 4), np.nan)
+
+		query_ids, candidate_ids = self.query_pairs(query_bboxes)
+		intersections, areas = compute_intersections(query_bboxes[query_ids], self.bboxes[candidate_ids])
+		is_valid = (areas > 0) & (areas >= area_threshold)
+		query_ids, candidate_ids, intersections, areas = query_ids[is_valid], candidate_ids[is_valid], intersections[is_valid], areas[is_valid]
+		if len(query_ids):
+			# The last pair of each query after sorting by (query ID, area, -box ID) is its best one.
+			order = np.lexsort((-candidate_ids, areas, query_ids))
+			is_last = np.ones(len(order), dtype=bool)
+			is_last[:-1] = query_ids[order[1:]] != query_ids[order[:-1]]
+			best = order[is_last]
+			box_ids[query_ids[best]] = candidate_ids[best]
+			max_areas[query_ids[best]] = areas[best]
+			max_intersections[query_ids[best]] = intersections[best]
+		return box_ids, max_areas, max_intersections
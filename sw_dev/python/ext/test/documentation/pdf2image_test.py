@@ -41,6 +41,9 @@ def basic_example():
 def main():
 	basic_example()
 
+	# Parallel rasterization into NumPy arrays by PyMuPDF.
+	# REF [function] >> parallel_rasterization_benchmark() in pymupdf_test.py.
+
 #--------------------------------------------------------------------
 
 if '__main__' == __name__:
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Page-sharded PDF text extraction in a process pool.
+#	- A document is split into shards of consecutive pages, which are extracted in worker processes.
+#		Each worker opens the document once, in its initializer, and extracts all the shards it is given from that one handle.
+#	- Records are (page_no, bbox, text) tuples, and are yielded shard by shard as soon as each shard is done.
+#		page_no is zero-based. bbox is (x0, y0, x1, y1) in PyMuPDF's page coordinates: points, origin at the top-left, +Y-axis downward.
+#	- Engines:
+#		"pymupdf": text blocks of PyMuPDF, which is fast.
+#		"pdfminer": text boxes of pdfminer's layout analysis, which is slow but groups characters into lines and boxes by itself.
+#		"auto": PyMuPDF, falling back to pdfminer for the pages on which PyMuPDF's text looks unusable (see needs_layout_analysis()).
+#	- Workers are spawned, not forked, since MuPDF's state is not safe to inherit across a fork.
+# REF [site] >>
+#	https://pymupdf.readthedocs.io/en/latest/recipes-text.html
+#	https://pdfminersix.readthedocs.io/en/latest/topic/converting_pdf_to_text.html
+
+import os, itertools, multiprocessing
+import concurrent.futures
+import fitz
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.layout import LAParams, LTTextBox
+from pdfminer.converter import PDFPageAggregator
+
+ENGINES = ('pymupdf', 'pdfminer', 'auto')
+
+def needs_layout_analysis(records, max_replacement_char_ratio=0.1):
+	"""Decides whether PyMuPDF's records of a page should be replaced by pdfminer's.
+
+	PyMuPDF finds no text on a page whose text is drawn in unusual ways, e.g. in Type3 fonts or in form XObjects of some producers,
+	and gives U+FFFD replacement characters for fonts without a usable ToUnicode map.
+	"""
+	if not records:
+		return True
+	num_chars = sum(len(text) for _, _, text in records)
+	num_replacement_chars = sum(text.count('\ufffd') for _, _, text in records)
+	return num_chars == 0 or num_replacement_chars / num_chars > max_replacement_char_ratio
+
+def get_page_shards(num_pages, pages_per_shard=16):
+	"""Splits pages [0, num_pages) into (start, end) ranges of consecutive pages."""
+	return [(start, min(start + pages_per_shard, num_pages)) for start in range(0, num_pages, pages_per_shard)]
+
+def _collect_text_boxes(elements, records, page_no, page_height):
+	for elem in elements:
+		if isinstance(elem, LTTextBox):
+			x0, y0, x1, y1 = elem.bbox
+			if x0 < x1 and y0 < y1:
+				# pdfminer's origin is at the bottom-left.
+				records.append((page_no, (x0, page_height - y1, x1, page_height - y0), elem.get_text().rstrip()))
+		elif hasattr(elem, '__iter__'):
+			_collect_text_boxes(elem, records, page_no, page_height)
+
+class PageTextExtractor(object):
+	"""Extracts the text records of the pages of one document, which is opened once."""
+
+	def __init__(self, pdf_filepath, engine='auto', laparams=None, password=''):
+		if engine not in ENGINES:
+			raise ValueError('Invalid engine: {}.'.format(engine))
+		self.pdf_filepath = pdf_filepath
+		self.engine = engine
+		self.laparams = LAParams() if laparams is None else laparams
+		self.password = password
+		self.num_pdfminer_pages = 0
+
+		self._fitz_doc = fitz.open(pdf_filepath)
+		if self._fitz_doc.needs_pass:
+			self._fitz_doc.authenticate(password)
+		self._fp = None
+		self._pdfminer_pages = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	@property
+	def page_count(self):
+		return self._fitz_doc.page_count
+
+	def _get_pdfminer_page(self, page_no):
+		if self._pdfminer_pages is None:
+			# The page tree is walked once. PDFPage.get_pages(fp, pagenos=[page_no]) would parse the document again for every page.
+			self._fp = open(self.pdf_filepath, 'rb')
+			document = PDFDocument(PDFParser(self._fp), password=self.password)
+			self._pdfminer_pages = list(PDFPage.create_pages(document))
+			rsrcmgr = PDFResourceManager(caching=True)
+			self._device = PDFPageAggregator(rsrcmgr, laparams=self.laparams)
+			self._interpreter = PDFPageInterpreter(rsrcmgr, self._device)
+		return self._pdfminer_pages[page_no]
+
+	def extract_with_pymupdf(self, page_no):
+		# Blocks: (x0, y0, x1, y1, text, block_no, block_type), where block_type is 1 for an image block and 0 for text.
+		blocks = self._fitz_doc.load_page(page_no).get_text('blocks')
+		return [(page_no, tuple(blk[:4]), blk[4].rstrip()) for blk in blocks if blk[6] == 0]
+
+	def extract_with_pdfminer(self, page_no):
+		page = self._get_pdfminer_page(page_no)
+		self._interpreter.process_page(page)
+		layout = self._device.get_result()
+		records = list()
+		_collect_text_boxes(layout, records, page_no, layout.bbox[3])
+		self.num_pdfminer_pages += 1
+		return records
+
+	def extract(self, page_no):
+		if 'pymupdf' == self.engine:
+			return self.extract_with_pymupdf(page_no)
+		elif 'pdfminer' == self.engine:
+			return self.extract_with_pdfminer(page_no)
+		records = self.extract_with_pymupdf(page_no)
+		return self.extract_with_pdfminer(page_no) if needs_layout_analysis(records) else records
+
+	def extract_range(self, start, end):
+		return list(itertools.chain.from_iterable(self.extract(page_no) for page_no in range(start, end)))
+
+	def close(self):
+		if self._fitz_doc is not None:
+			self._fitz_doc.close()
+			self._fitz_doc = None
+		if self._fp is not None:
+			self._fp.close()
+			self._fp = None
+
+_worker_extractor = None
+
+def _initialize_worker(pdf_filepath, engine, laparams, password):
+	global _worker_extractor
+	_worker_extractor = PageTextExtractor(pdf_filepath, engine, laparams, password)
+
+def _extract_shard(start, end):
+	return _worker_extractor.extract_range(start, end)
+
+def extract_text_records(pdf_filepath, engine='auto', num_workers=None, pages_per_shard=16, page_range=None, ordered=False, laparams=None, password=''):
+	"""Yields (page_no, bbox, text) records of the pages of a PDF file, extracting shards of pages in a process pool.
+
+	If ordered is False, the records of a shard are yielded as soon as the shard is done, so shards can come out of order.
+	At most two shards per worker are in flight, so memory stays bounded when the consumer is slower than the workers.
+	page_range is (start, end) of zero-based page numbers, all the pages by default.
+	"""
+	if engine not in ENGINES:
+		raise ValueError('Invalid engine: {}.'.format(engine))
+	if page_range is None:
+		with fitz.open(pdf_filepath) as doc:
+			page_range = 0, doc.page_count
+	shards = [(page_range[0] + start, page_range[0] + end) for start, end in get_page_shards(page_range[1] - page_range[0], pages_per_shard)]
+	num_workers = min(num_workers or os.cpu_count(), max(len(shards), 1))
+	max_pending_shards = 2 * num_workers
+
+	with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context('spawn'), initializer=_initialize_worker, initargs=(pdf_filepath, engine, laparams, password)) as executor:
+		shards = iter(shards)
+		pending = [executor.submit(_extract_shard, start, end) for start, end in itertools.islice(shards, max_pending_shards)]
+		if ordered:
+			while pending:
+				records = pending.pop(0).result()
+				for start, end in itertools.islice(shards, 1):
+					pending.append(executor.submit(_extract_shard, start, end))
+				yield from records
+		else:
+			pending = set(pending)
+			while pending:
+				done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+				for start, end in itertools.islice(shards, len(done)):
+					pending.add(executor.submit(_extract_shard, start, end))
+				for future in done:
+					yield from future.result()
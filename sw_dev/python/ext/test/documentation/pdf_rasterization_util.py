@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Parallel PDF rasterization with PyMuPDF into NumPy arrays.
+#	- pixmap_to_array() builds an array directly over the samples of a pixmap, without PIL.Image.frombytes() or bytes copies.
+#	- render_pages() renders shards of pages in worker processes, each of which opens the document once, and yields (page_no, array) pairs.
+#		The arrays are pickled back to the parent, which costs a copy of every page.
+#	- RasterizationService renders pages in worker processes into the slots of a shared-memory ring buffer instead,
+#		so that a consumer, e.g. an OCR stage, reads pages in place as soon as they are rendered.
+#		A slot is handed back to the producers when the consumer moves on to the next page, so at most num_slots pages are held in memory.
+#		PyMuPDF cannot render into a caller's buffer, so each page is copied once, from its pixmap into a slot.
+#	- Workers are spawned, not forked, since MuPDF's state is not safe to inherit across a fork.
+# REF [site] >>
+#	https://pymupdf.readthedocs.io/en/latest/pixmap.html
+#	https://docs.python.org/3/library/multiprocessing.shared_memory.html
+
+import os, queue, itertools, traceback, multiprocessing
+import multiprocessing.shared_memory
+import concurrent.futures
+import numpy as np
+import fitz
+
+_COLORSPACES = {'gray': 1, 'rgb': 3}
+
+def _get_colorspace(colorspace):
+	if colorspace not in _COLORSPACES:
+		raise ValueError('Invalid colorspace: {}.'.format(colorspace))
+	return fitz.csGRAY if 'gray' == colorspace else fitz.csRGB
+
+def pixmap_to_array(pix, copy=True):
+	"""Returns a (height, width, channels) uint8 array over the samples of a pixmap.
+
+	Without copy, the array refers to the memory of the pixmap, so it is only valid while the pixmap is alive.
+	"""
+	samples = np.frombuffer(pix.samples_mv, dtype=np.uint8)
+	# Rows can be padded, so that the stride is larger than width * channels.
+	array = samples.reshape(pix.height, pix.stride)[:, :pix.width * pix.n].reshape(pix.height, pix.width, pix.n)
+	return array.copy() if copy else array
+
+def render_page(page, dpi=150, colorspace='rgb', alpha=False):
+	return page.get_pixmap(dpi=dpi, colorspace=_get_colorspace(colorspace), alpha=alpha)
+
+def get_page_shape(page, dpi=150, colorspace='rgb', alpha=False):
+	"""The (height, width, channels) of a page rendered at dpi, without rendering it."""
+	# The same rounding as get_pixmap(): the bounding box of the transformed page rectangle, in integer pixels.
+	irect = (page.rect * fitz.Matrix(dpi / 72, dpi / 72)).irect
+	return irect.height, irect.width, _COLORSPACES[colorspace] + (1 if alpha else 0)
+
+_worker_doc = None
+
+def _initialize_worker(pdf_filepath):
+	global _worker_doc
+	_worker_doc = fitz.open(pdf_filepath)
+
+def _render_shard(start, end, dpi, colorspace, alpha):
+	return [(page_no, pixmap_to_array(render_page(_worker_doc.load_page(page_no), dpi, colorspace, alpha))) for page_no in range(start, end)]
+
+def _get_shards(pdf_filepath, page_range, pages_per_shard):
+	if page_range is None:
+		with fitz.open(pdf_filepath) as doc:
+			page_range = 0, doc.page_count
+	return [(start, min(start + pages_per_shard, page_range[1])) for start in range(page_range[0], page_range[1], pages_per_shard)]
+
+def render_pages(pdf_filepath, dpi=150, colorspace='rgb', alpha=False, page_range=None, num_workers=None, pages_per_shard=4):
+	"""Yields (page_no, array) of the pages of a PDF file in order, rendering shards of pages in a process pool.
+
+	At most two shards per worker are in flight.
+	"""
+	shards = _get_shards(pdf_filepath, page_range, pages_per_shard)
+	num_workers = min(num_workers or os.cpu_count(), max(len(shards), 1))
+	with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context('spawn'), initializer=_initialize_worker, initargs=(pdf_filepath,)) as executor:
+		shards = iter(shards)
+		pending = [executor.submit(_render_shard, start, end, dpi, colorspace, alpha) for start, end in itertools.islice(shards, 2 * num_workers)]
+		while pending:
+			pages = pending.pop(0).result()
+			for start, end in itertools.islice(shards, 1):
+				pending.append(executor.submit(_render_shard, start, end, dpi, colorspace, alpha))
+			yield from pages
+
+#--------------------------------------------------------------------
+
+class SharedMemoryRingBuffer(object):
+	"""Fixed-size slots of shared memory which producer processes fill and a consumer process reads.
+
+	Free slot indices and filled slot descriptions are passed through queues, so the slots themselves are never pickled.
+	It has to be created in the consumer process, and passed to producer processes as an argument of multiprocessing.Process.
+	"""
+
+	def __init__(self, num_slots, slot_size, context=None):
+		context = context or multiprocessing.get_context()
+		self.num_slots = num_slots
+		self.slot_size = slot_size
+		self._shm = multiprocessing.shared_memory.SharedMemory(create=True, size=num_slots * slot_size)
+		self._is_owner = True
+		self._free_slots = context.Queue()
+		self._filled_slots = context.Queue()
+		for slot in range(num_slots):
+			self._free_slots.put(slot)
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state['_shm'] = self._shm.name
+		state['_is_owner'] = False
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._shm = multiprocessing.shared_memory.SharedMemory(name=state['_shm'])
+
+	def _get_view(self, slot, shape):
+		return np.ndarray(shape, dtype=np.uint8, buffer=self._shm.buf, offset=slot * self.slot_size)
+
+	def put(self, key, array):
+		"""Copies a uint8 array into a free slot, waiting for one if there is none. Called by producers."""
+		if array.nbytes > self.slot_size:
+			raise ValueError('Array too large for a slot: {} > {}.'.format(array.nbytes, self.slot_size))
+		slot = self._free_slots.get()
+		np.copyto(self._get_view(slot, array.shape), array)
+		self._filled_slots.put((slot, key, array.shape))
+
+	def put_end(self, error=None):
+		"""Tells the consumer that a producer is done, or that it failed with an error message."""
+		self._filled_slots.put(error)
+
+	def get(self, timeout=None):
+		"""Returns (slot, key, array) of a filled slot, or None for the end of a producer. Called by the consumer.
+
+		The array is a view of the slot. It is valid until the slot is released by release().
+		If a producer failed, RuntimeError is raised with its error message.
+		"""
+		item = self._filled_slots.get(timeout=timeout)
+		if item is None:
+			return None
+		elif isinstance(item, str):
+			raise RuntimeError('A producer failed:\n{}'.format(item))
+		slot, key, shape = item
+		return slot, key, self._get_view(slot, shape)
+
+	def release(self, slot):
+		self._free_slots.put(slot)
+
+	def close(self):
+		if self._shm is not None:
+			self._shm.close()
+			if self._is_owner:
+				self._shm.unlink()
+			self._shm = None
+
+def _produce_pages(pdf_filepath, tasks, ring_buffer, dpi, colorspace, alpha):
+	try:
+		with fitz.open(pdf_filepath) as doc:
+			for start, end in iter(tasks.get, None):
+				for page_no in range(start, end):
+					pix = render_page(doc.load_page(page_no), dpi, colorspace, alpha)
+					ring_buffer.put(page_no, pixmap_to_array(pix, copy=False))
+					del pix
+	except BaseException:
+		# Not a normal end, so that the consumer does not stop short without an error.
+		ring_buffer.put_end(traceback.format_exc())
+		raise
+	else:
+		ring_buffer.put_end()
+	finally:
+		ring_buffer.close()
+
+class RasterizationService(object):
+	"""Renders the pages of a PDF file in worker processes into a shared-memory ring buffer.
+
+	Pages come out in the order in which they are rendered, not in page order.
+	The slots are sized for the largest page of page_range at dpi.
+	"""
+
+	def __init__(self, pdf_filepath, dpi=150, colorspace='rgb', alpha=False, page_range=None, num_workers=None, num_slots=None, pages_per_shard=4):
+		shards = _get_shards(pdf_filepath, page_range, pages_per_shard)
+		with fitz.open(pdf_filepath) as doc:
+			slot_size = max((int(np.prod(get_page_shape(doc.load_page(page_no), dpi, colorspace, alpha))) for start, end in shards for page_no in range(start, end)), default=1)
+		self.num_pages = sum(end - start for start, end in shards)
+		self.num_workers = min(num_workers or os.cpu_count(), max(len(shards), 1))
+
+		context = multiprocessing.get_context('spawn')
+		self.ring_buffer = SharedMemoryRingBuffer(num_slots or 2 * self.num_workers, slot_size, context)
+		# The queue has to outlive the start-up of the workers, which unpickle it.
+		self._tasks = context.Queue()
+		for shard in shards:
+			self._tasks.put(shard)
+		for _ in range(self.num_workers):
+			self._tasks.put(None)
+		self._workers = [context.Process(target=_produce_pages, args=(pdf_filepath, self._tasks, self.ring_buffer, dpi, colorspace, alpha), daemon=True) for _ in range(self.num_workers)]
+		for worker in self._workers:
+			worker.start()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def iterate_pages(self):
+		"""Yields (page_no, array) as the pages are rendered.
+
+		The array is a view of a slot of the ring buffer, which is released when the next page is requested. Copy it if it has to be kept.
+		RuntimeError is raised if a worker fails or dies, or if not all the pages have been rendered.
+		"""
+		num_running_workers, num_yielded_pages = self.num_workers, 0
+		while num_running_workers > 0:
+			try:
+				item = self.ring_buffer.get(timeout=1.0)
+			except queue.Empty:
+				# A worker which is killed cannot tell the end of its pages.
+				if any(worker.exitcode not in (None, 0) for worker in self._workers):
+					raise RuntimeError('A rasterization worker died: exit code = {}.'.format([worker.exitcode for worker in self._workers]))
+				continue
+			if item is None:
+				num_running_workers -= 1
+				continue
+			slot, page_no, array = item
+			try:
+				num_yielded_pages += 1
+				yield page_no, array
+			finally:
+				del array
+				self.ring_buffer.release(slot)
+
+		for worker in self._workers:
+			worker.join()
+		if any(worker.exitcode != 0 for worker in self._workers):
+			raise RuntimeError('A rasterization worker failed: exit code = {}.'.format([worker.exitcode for worker in self._workers]))
+		if num_yielded_pages != self.num_pages:
+			raise RuntimeError('Not all the pages have been rendered: {} != {}.'.format(num_yielded_pages, self.num_pages))
+
+	def close(self):
+		for worker in self._workers:
+			if worker.is_alive():
+				worker.terminate()
+			worker.join()
+		self._workers = list()
+		self.ring_buffer.close()
@@ -404,6 +404,7 @@ def table_of_contents_example():
 def intersection_of_pdfminer_and_pymupdf():
 	import fitz
 	from PIL import Image, ImageDraw
+	import box_alignment_util
 	import matplotlib.pyplot as plt
 	
 	pdf_filepath = '/path/to/sample.pdf'
@@ -429,10 +430,9 @@ def intersection_of_pdfminer_and_pymupdf():
 		device = PDFPageAggregator(rsrcmgr, laparams=laparams)
 		interpreter = PDFPageInterpreter(rsrcmgr, device)
 
-		for page_no in range(fitz_doc.page_count):
-			pages = PDFPage.get_pages(fp, pagenos=[page_no], maxpages=0, password=b'')  # pagenos uses zero-based indices. pagenos is sorted inside the function.
-			page = next(pages)
-
+		# The pages are iterated once. PDFPage.get_pages(fp, pagenos=[page_no]) would parse the document from the beginning for every page.
+		pages = PDFPage.get_pages(fp, pagenos=None, maxpages=0, password=b'')
+		for page_no, page in zip(range(fitz_doc.page_count), pages):
 			interpreter.process_page(page)
 
 			layout = device.get_result()
@@ -453,35 +453,18 @@ def intersection_of_pdfminer_and_pymupdf():
 			fitz_blocks = list(filter(lambda blk: blk[6] == 0, fitz_blocks))
 
 			#--------------------
-			def compute_intersection(boxA, boxB):
-				return [
-					max(boxA[0], boxB[0]),
-					max(boxA[1], boxB[1]),
-					min(boxA[2], boxB[2]),
-					min(boxA[3], boxB[3]),
-				]
-
-			def find_max_intersection(bboxes, ref_bbox, area_threshold=100):
-				max_area = 0
-				max_inter = None
-				for bbox in bboxes:
-					inter = compute_intersection(bbox, ref_bbox)
-					area = max(0, inter[2] - inter[0]) * max(0, inter[3] - inter[1])
-					if area > max_area:
-						max_area = area
-						max_inter = inter
-				return max_inter if max_area >= area_threshold else None
-
 			pix = fitz_page.get_pixmap()
 			mode = 'RGBA' if pix.alpha else 'RGB'
 			img = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
 
-			x_scale_factor, y_scale_factor = pix.width / layout.bbox[2], pix.height / layout.bbox[3]
-			#bbox_text_pairs = list(((bbox[0] * x_scale_factor, bbox[1] * y_scale_factor, bbox[2] * x_scale_factor, bbox[3] * y_scale_factor), txt) for bbox, txt in bbox_text_pairs)
-			#bbox_text_pairs = list(((bbox[0] * x_scale_factor, (layout.bbox[3] - bbox[1]) * y_scale_factor, bbox[2] * x_scale_factor, (layout.bbox[3] - bbox[3]) * y_scale_factor), txt) for bbox, txt in bbox_text_pairs)
-			bbox_text_pairs = list(((bbox[0] * x_scale_factor, (layout.bbox[3] - bbox[3]) * y_scale_factor, bbox[2] * x_scale_factor, (layout.bbox[3] - bbox[1]) * y_scale_factor), txt) for bbox, txt in bbox_text_pairs)
+			# pdfminer's origin is at the bottom-left, while the image's is at the top-left.
+			text_bboxes = box_alignment_util.transform_bboxes([bbox for bbox, _ in bbox_text_pairs], **box_alignment_util.get_page_to_image_transform(layout.bbox, (pix.width, pix.height)))
+			bbox_text_pairs = list(zip(text_bboxes.tolist(), (txt for _, txt in bbox_text_pairs)))
 
-			intersections = list(filter(lambda inter: inter, (find_max_intersection(fitz_blocks, bbox, area_threshold=intersection_area_threshold) for bbox, _ in bbox_text_pairs)))
+			# The fitz block of maximum intersection with each text box.
+			block_index = box_alignment_util.BoxIndex([blk[:4] for blk in fitz_blocks])
+			block_ids, _, intersections = block_index.find_max_overlaps(text_bboxes, area_threshold=intersection_area_threshold)
+			intersections = intersections[block_ids >= 0].tolist()
 
 			#--------------------
 			draw = ImageDraw.Draw(img)
@@ -504,6 +487,94 @@ def intersection_of_pdfminer_and_pymupdf():
 	finally:
 		if fp: fp.close()
 
+def page_sharded_extraction_benchmark():
+	import os, time
+	import fitz
+	import pdf_extraction_util
+
+	pdf_filepath = './sample_1000.pdf'
+	num_pages = 1000
+
+	if not os.path.exists(pdf_filepath):
+		# A synthetic document of two text columns per page.
+		doc = fitz.open()
+		for page_no in range(num_pages):
+			page = doc.new_page()
+			for line_no in range(60):
+				page.insert_text((50 + (line_no % 2) * 250, 50 + (line_no // 2) * 24), 'Page {}, line {}: the quick brown fox jumps over the lazy dog.'.format(page_no, line_no), fontsize=8)
+		doc.save(pdf_filepath)
+		doc.close()
+
+	#--------------------
+	# Sequential pdfminer, parsing the document from the beginning for every page as intersection_of_pdfminer_and_pymupdf() used to.
+	num_sampled_pages = 50
+	with open(pdf_filepath, 'rb') as fp:
+		rsrcmgr = PDFResourceManager()
+		device = PDFPageAggregator(rsrcmgr, laparams=LAParams())
+		interpreter = PDFPageInterpreter(rsrcmgr, device)
+		start_time = time.time()
+		for page_no in range(num_pages - num_sampled_pages, num_pages):
+			page = next(PDFPage.get_pages(fp, pagenos=[page_no], maxpages=0, password=b''))
+			interpreter.process_page(page)
+			extract_text_object(device.get_result(), pdf_filepath, page_no)
+		print('Sequential pdfminer with get_pages() per page (the last {} pages): {:.1f} pages/sec.'.format(num_sampled_pages, num_sampled_pages / (time.time() - start_time)))
+
+	#--------------------
+	for engine, page_range in [('pymupdf', None), ('auto', None), ('pdfminer', (0, 200))]:
+		for num_workers in sorted(set([1, 2, 4, os.cpu_count()])):
+			start_time = time.time()
+			num_records, page_nos = 0, set()
+			for page_no, bbox, text in pdf_extraction_util.extract_text_records(pdf_filepath, engine=engine, num_workers=num_workers, pages_per_shard=16, page_range=page_range):
+				num_records += 1
+				page_nos.add(page_no)
+			elapsed_time = time.time() - start_time
+			print('Engine = {}, #workers = {}: {:.1f} pages/sec, #pages = {}, #records = {}.'.format(engine, num_workers, len(page_nos) / elapsed_time, len(page_nos), num_records))
+
+def box_alignment_benchmark():
+	import time
+	import numpy as np
+	import box_alignment_util
+
+	# A dense table page: text boxes of cells, and blocks which are slightly shifted and merged pairwise along rows.
+	num_rows, num_cols = 100, 40
+	cell_width, cell_height = 600 / num_cols, 800 / num_rows
+	xs, ys = np.meshgrid(np.arange(num_cols) * cell_width, np.arange(num_rows) * cell_height)
+	text_bboxes = np.stack([xs.ravel(), ys.ravel(), xs.ravel() + cell_width * 0.9, ys.ravel() + cell_height * 0.9], axis=1)
+	block_bboxes = np.stack([xs[:, ::2].ravel() + 1, ys[:, ::2].ravel() + 1, xs[:, ::2].ravel() + cell_width * 1.9, ys[:, ::2].ravel() + cell_height * 0.8], axis=1)
+	print('#text boxes = {}, #blocks = {}.'.format(len(text_bboxes), len(block_bboxes)))
+
+	def find_max_intersection(bboxes, ref_bbox, area_threshold=100):
+		# As in intersection_of_pdfminer_and_pymupdf() before, O(#blocks) per text box.
+		max_area, max_inter = 0, None
+		for bbox in bboxes:
+			inter = [max(bbox[0], ref_bbox[0]), max(bbox[1], ref_bbox[1]), min(bbox[2], ref_bbox[2]), min(bbox[3], ref_bbox[3])]
+			area = max(0, inter[2] - inter[0]) * max(0, inter[3] - inter[1])
+			if area > max_area:
+				max_area, max_inter = area, inter
+		return max_inter if max_area >= area_threshold else None
+
+	start_time = time.time()
+	block_bboxes_list = block_bboxes.tolist()
+	intersections_loop = [find_max_intersection(block_bboxes_list, bbox, area_threshold=10) for bbox in text_bboxes.tolist()]
+	print('Nested loops: {} secs.'.format(time.time() - start_time))
+
+	start_time = time.time()
+	block_index = box_alignment_util.BoxIndex(block_bboxes)
+	block_ids, areas, intersections = block_index.find_max_overlaps(text_bboxes, area_threshold=10)
+	print('Grid index: {} secs.'.format(time.time() - start_time))
+
+	is_same = all((inter is None and block_id < 0) or (inter is not None and block_id >= 0 and np.allclose(inter, intersection)) for inter, block_id, intersection in zip(intersections_loop, block_ids, intersections))
+	print('Same results = {}, #matched text boxes = {}.'.format(is_same, np.count_nonzero(block_ids >= 0)))
+
+	# Degenerate boxes, e.g. rules and empty text boxes of zero width or height, do not blow up the grid.
+	degenerate_bboxes = np.concatenate([block_bboxes, np.stack([xs[:, 0], ys[:, 0], xs[:, 0], ys[:, 0] + 700], axis=1), [[0, 0, 600, 0.001], [0, 1, 600, 1.001]]])
+	start_time = time.time()
+	block_index = box_alignment_util.BoxIndex(degenerate_bboxes)
+	block_ids, _, _ = block_index.find_max_overlaps(text_bboxes, area_threshold=10)
+	print('Grid index with degenerate boxes: {} secs, grid shape = {}, #matched text boxes = {}.'.format(time.time() - start_time, block_index._grid_shape, np.count_nonzero(block_ids >= 0)))
+	block_index = box_alignment_util.BoxIndex([[0, 0, 0, 800], [600, 0, 600, 800]])
+	print('Grid shape of two zero-width boxes = {}, #boxes overlapping [0, 0, 1, 1] = {}.'.format(block_index._grid_shape, len(block_index.query_pairs([[0, 0, 1, 1]])[0])))
+
 def main():
 	# The coordinate system:
 	#	Origin: bottom-left, +X-axis: rightward, +Y-axis: upward.
@@ -519,6 +590,13 @@ def main():
 	#--------------------
 	# Intersection of pdfminer's text boxes and PyMuPDF's blocks.
 	#intersection_of_pdfminer_and_pymupdf()
+	#	REF [file] >> ./box_alignment_util.py
+	#box_alignment_benchmark()
+
+	#--------------------
+	# Page-sharded text extraction in a process pool.
+	#	REF [file] >> ./pdf_extraction_util.py
+	#page_sharded_extraction_benchmark()
 
 #--------------------------------------------------------------------
 
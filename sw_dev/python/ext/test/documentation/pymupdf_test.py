@@ -443,6 +443,56 @@ def transformation_example():
 		plt.tight_layout()
 		plt.show()
 
+def parallel_rasterization_benchmark():
+	import os, time
+	import numpy as np
+	from PIL import Image
+	import pdf_rasterization_util
+
+	pdf_filepath = './sample_raster_200.pdf'
+	num_pages = 200
+	dpi = 150
+
+	if not os.path.exists(pdf_filepath):
+		# A synthetic document of two text columns and a few drawings per page.
+		doc = fitz.open()
+		for page_no in range(num_pages):
+			page = doc.new_page()
+			for line_no in range(60):
+				page.insert_text((50 + (line_no % 2) * 250, 50 + (line_no // 2) * 24), 'Page {}, line {}: the quick brown fox jumps over the lazy dog.'.format(page_no, line_no), fontsize=8)
+			for idx in range(10):
+				page.draw_rect(fitz.Rect(50 + idx * 45, 780, 90 + idx * 45, 820), color=(0, 0, 1), fill=(idx / 10, 0.5, 0.5))
+		doc.save(pdf_filepath)
+		doc.close()
+
+	#--------------------
+	# Sequential rendering, converted through PIL as in intersection_of_pdfminer_and_pymupdf() in pdfminer_test.py.
+	with fitz.open(pdf_filepath) as doc:
+		start_time = time.time()
+		for page in doc:
+			pix = page.get_pixmap(matrix=fitz.Matrix(dpi / 72, dpi / 72), alpha=False)
+			img = np.asarray(Image.frombytes('RGB', [pix.width, pix.height], pix.samples))
+		print('Sequential, through PIL: {:.1f} pages/sec.'.format(num_pages / (time.time() - start_time)))
+
+		start_time = time.time()
+		for page in doc:
+			img = pdf_rasterization_util.pixmap_to_array(pdf_rasterization_util.render_page(page, dpi), copy=False)
+		print('Sequential, over the samples of pixmaps: {:.1f} pages/sec.'.format(num_pages / (time.time() - start_time)))
+
+	#--------------------
+	for num_workers in sorted(set([1, 2, 4, os.cpu_count()])):
+		start_time = time.time()
+		for page_no, img in pdf_rasterization_util.render_pages(pdf_filepath, dpi=dpi, num_workers=num_workers):
+			pass
+		print('Process pool, #workers = {}: {:.1f} pages/sec.'.format(num_workers, num_pages / (time.time() - start_time)))
+
+		start_time = time.time()
+		with pdf_rasterization_util.RasterizationService(pdf_filepath, dpi=dpi, num_workers=num_workers) as service:
+			for page_no, img in service.iterate_pages():
+				# An OCR stage would consume img here, before the slot is released.
+				pass
+		print('Shared-memory ring buffer, #workers = {}: {:.1f} pages/sec.'.format(num_workers, num_pages / (time.time() - start_time)))
+
 def main():
 	# The coordinate system:
 	#	Origin: top-left, +X-axis: rightward, +Y-axis: downward.
@@ -452,6 +502,9 @@ def main():
 
 	text_extraction_example()
 	#pixmap_example()
+	# Parallel rasterization into NumPy arrays.
+	#	REF [file] >> ./pdf_rasterization_util.py
+	#parallel_rasterization_benchmark()
 
 	#drawing_example()
 	#transformation_example()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Chunked, compressed HDF5 array store.
+#	- Chunk shapes are chosen from the expected access pattern:
+#		"row_batches": batches of consecutive rows, e.g. sequential training epochs. A chunk holds as many whole rows as fit in target_chunk_bytes.
+#		"random_rows": individual rows at random, e.g. shuffled minibatches. A chunk holds one row, so that a read never decodes the other rows of a chunk.
+#		"tiles": sub-regions of large arrays, e.g. crops of images. Chunks are balanced along all the axes.
+#	- Compression filters: "gzip" and "lzf" are built into h5py. "blosc", "lz4", and "zstd" need hdf5plugin.
+#	- Hdf5ArrayWriter appends streaming batches by resizing a dataset whose first axis is unlimited.
+#		With swmr=True, readers in other processes can read the file while it is being appended to.
+#	- ParallelHdf5Reader opens the file independently in each worker process, since HDF5 file handles must not be shared across processes.
+# REF [site] >>
+#	https://docs.h5py.org/en/stable/high/dataset.html#chunked-storage
+#	https://docs.h5py.org/en/stable/swmr.html
+#	https://github.com/silx-kit/hdf5plugin
+
+import math, multiprocessing
+import concurrent.futures
+import numpy as np
+import h5py
+
+try:
+	import hdf5plugin
+except ImportError:
+	hdf5plugin = None
+
+ACCESS_PATTERNS = ("row_batches", "random_rows", "tiles")
+COMPRESSIONS = (None, "gzip", "lzf", "blosc", "lz4", "zstd")
+
+def get_chunk_shape(shape, dtype, access_pattern="row_batches", target_chunk_bytes=1024**2):
+	"""Chooses a chunk shape for a dataset of shape, whose first axis can be unlimited.
+
+	shape[0] can be 0 or None for a dataset to be appended to.
+	"""
+	if access_pattern not in ACCESS_PATTERNS:
+		raise ValueError("Invalid access pattern: {}.".format(access_pattern))
+	itemsize = np.dtype(dtype).itemsize
+	num_rows = shape[0] or None
+	row_shape = tuple(shape[1:])
+	row_bytes = itemsize * math.prod(row_shape)
+
+	if "row_batches" == access_pattern:
+		rows_per_chunk = max(target_chunk_bytes // max(row_bytes, 1), 1)
+		if num_rows:
+			rows_per_chunk = min(rows_per_chunk, num_rows)
+		return (int(rows_per_chunk),) + row_shape
+	elif "random_rows" == access_pattern:
+		return (1,) + row_shape
+	else:
+		# Halve the largest axis until a chunk fits in target_chunk_bytes.
+		chunk_shape = [num_rows or max(target_chunk_bytes // max(row_bytes, 1), 1)] + list(row_shape)
+		while itemsize * math.prod(chunk_shape) > target_chunk_bytes and max(chunk_shape) > 1:
+			axis = int(np.argmax(chunk_shape))
+			chunk_shape[axis] = (chunk_shape[axis] + 1) // 2
+		return tuple(int(size) for size in chunk_shape)
+
+def get_compression_kwargs(compression=None, level=None):
+	"""Keyword arguments of h5py.Group.create_dataset() for a compression filter."""
+	if compression is None:
+		return dict()
+	elif "gzip" == compression:
+		# Byte shuffling groups the bytes of the same significance, which compresses numeric data much better.
+		return dict(compression="gzip", compression_opts=4 if level is None else level, shuffle=True)
+	elif "lzf" == compression:
+		return dict(compression="lzf", shuffle=True)
+	elif compression in ("blosc", "lz4", "zstd"):
+		if hdf5plugin is None:
+			raise ImportError("hdf5plugin is required for {} compression.".format(compression))
+		if "lz4" == compression:
+			return dict(hdf5plugin.LZ4())
+		cname = "lz4" if "blosc" == compression else "zstd"
+		return dict(hdf5plugin.Blosc(cname=cname, clevel=5 if level is None else level, shuffle=hdf5plugin.Blosc.SHUFFLE))
+	else:
+		raise ValueError("Invalid compression: {}.".format(compression))
+
+def create_array_dataset(group, name, shape, dtype, chunked=True, access_pattern="row_batches", compression=None, level=None, resizable=False, target_chunk_bytes=1024**2):
+	"""Creates a dataset whose layout is contiguous, or chunked for an access pattern.
+
+	A resizable dataset has an unlimited first axis and shape[0] can be 0.
+	Compression and resizing require chunked datasets.
+	"""
+	if not chunked:
+		if compression or resizable:
+			raise ValueError("Compression and resizing require a chunked layout.")
+		return group.create_dataset(name, shape=shape, dtype=dtype)
+	chunk_shape = get_chunk_shape(shape, dtype, access_pattern, target_chunk_bytes)
+	maxshape = (None,) + tuple(shape[1:]) if resizable else None
+	return group.create_dataset(name, shape=shape, dtype=dtype, chunks=chunk_shape, maxshape=maxshape, **get_compression_kwargs(compression, level))
+
+class Hdf5ArrayWriter(object):
+	"""Appends batches of rows of shape row_shape to a resizable dataset.
+
+	With swmr=True, the file is switched to SWMR (single writer, multiple readers) mode after the dataset is created.
+	Then readers opened with swmr=True see the rows appended up to the last flush().
+	"""
+
+	def __init__(self, filepath, name, row_shape, dtype, access_pattern="row_batches", compression=None, level=None, target_chunk_bytes=1024**2, swmr=False):
+		# SWMR requires the latest file format.
+		self.file = h5py.File(filepath, "w", libver="latest" if swmr else None)
+		self.dataset = create_array_dataset(self.file, name, (0,) + tuple(row_shape), dtype, True, access_pattern, compression, level, resizable=True, target_chunk_bytes=target_chunk_bytes)
+		if swmr:
+			self.file.swmr_mode = True
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def __len__(self):
+		return self.dataset.shape[0]
+
+	def append(self, batch):
+		batch = np.asarray(batch, dtype=self.dataset.dtype)
+		if batch.shape[1:] != self.dataset.shape[1:]:
+			raise ValueError("Invalid batch shape: {} != (N,) + {}.".format(batch.shape, self.dataset.shape[1:]))
+		start = self.dataset.shape[0]
+		self.dataset.resize(start + len(batch), axis=0)
+		self.dataset[start:] = batch
+
+	def flush(self):
+		# Makes the appended rows visible to SWMR readers.
+		self.dataset.flush()
+
+	def close(self):
+		if self.file is not None:
+			self.file.close()
+			self.file = None
+
+def read_rows(dataset, indices):
+	"""Reads the rows of indices in their order.
+
+	The indices are sorted and deduplicated for the read, and put back in their order afterwards.
+	h5py fancy indexing of a chunked dataset selects rows one by one, which is very slow.
+	So runs of consecutive rows are read as slices of a chunked dataset instead.
+	"""
+	indices = np.asarray(indices)
+	unique_indices, inverse = np.unique(indices, return_inverse=True)
+	if dataset.chunks is None or len(unique_indices) == 0:
+		return dataset[unique_indices][inverse]
+
+	rows = np.empty((len(unique_indices),) + dataset.shape[1:], dtype=dataset.dtype)
+	run_breaks = np.flatnonzero(np.diff(unique_indices) != 1) + 1
+	run_starts = np.concatenate([[0], run_breaks])
+	run_ends = np.concatenate([run_breaks, [len(unique_indices)]])
+	for start, end in zip(run_starts, run_ends):
+		dataset.read_direct(rows, np.s_[unique_indices[start]:unique_indices[end - 1] + 1], np.s_[start:end])
+	return rows[inverse]
+
+_worker_dataset = None
+
+def _initialize_worker(filepath, name, swmr, rdcc_nbytes):
+	global _worker_dataset
+	file = h5py.File(filepath, "r", libver="latest" if swmr else None, swmr=swmr, rdcc_nbytes=rdcc_nbytes)
+	_worker_dataset = file[name]
+
+def _read_batch(indices):
+	if _worker_dataset.file.swmr_mode:
+		# See the rows appended by a SWMR writer since the last read.
+		_worker_dataset.refresh()
+	return read_rows(_worker_dataset, indices)
+
+class ParallelHdf5Reader(object):
+	"""Reads batches of rows of a dataset in worker processes, each of which opens the file by itself.
+
+	The workers are spawned, not forked, so that they do not inherit HDF5 library state from the parent.
+	rdcc_nbytes is the size of the chunk cache of each worker. It should hold at least the chunks of a batch for compressed datasets.
+	"""
+
+	def __init__(self, filepath, name, num_workers=4, swmr=False, rdcc_nbytes=16 * 1024**2):
+		self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context("spawn"), initializer=_initialize_worker, initargs=(filepath, name, swmr, rdcc_nbytes))
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def read(self, indices):
+		return self._executor.submit(_read_batch, indices).result()
+
+	def iterate_batches(self, batches_of_indices):
+		"""Yields the batches in order, reading them concurrently."""
+		yield from self._executor.map(_read_batch, batches_of_indices)
+
+	def close(self):
+		if self._executor is not None:
+			self._executor.shutdown(wait=True)
+			self._executor = None
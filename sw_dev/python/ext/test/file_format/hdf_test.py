@@ -1,8 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 
+import os, time
 import numpy as np
 import h5py
+import hdf5_util
 
 # REF [site] >> https://docs.h5py.org/en/stable/quick.html
 def quick_start_guide():
@@ -82,9 +84,86 @@ def quick_start_guide():
 		print("dset[10] = {}.".format(dset[10]))
 		print("dset[0:100:10] = {}.".format(dset[0:100:10]))
 
+def chunked_store_example():
+	hdf5_filepath = "./mystreamfile.hdf5"
+
+	# Append streaming batches to a resizable, compressed dataset.
+	with hdf5_util.Hdf5ArrayWriter(hdf5_filepath, "images", row_shape=(64, 64, 3), dtype=np.uint8, access_pattern="random_rows", compression="gzip", swmr=True) as writer:
+		print("Chunk shape = {}, compression = {}.".format(writer.dataset.chunks, writer.dataset.compression))
+		for batch_idx in range(10):
+			writer.append(np.full((100, 64, 64, 3), batch_idx, dtype=np.uint8))
+			writer.flush()  # Visible to SWMR readers from here.
+		print("#rows = {}.".format(len(writer)))
+
+	for access_pattern in hdf5_util.ACCESS_PATTERNS:
+		print("Chunk shape for {} = {}.".format(access_pattern, hdf5_util.get_chunk_shape((10000, 480, 640, 3), np.uint8, access_pattern)))
+
+	# Read batches of random rows in worker processes.
+	with hdf5_util.ParallelHdf5Reader(hdf5_filepath, "images", num_workers=2, swmr=True) as reader:
+		for indices, batch in zip([[999, 0, 500], [1, 1, 2]], reader.iterate_batches([[999, 0, 500], [1, 1, 2]])):
+			print("Rows {}: shape = {}, first values = {}.".format(indices, batch.shape, batch[:,0,0,0]))
+
+	os.remove(hdf5_filepath)
+
+def layout_benchmark():
+	hdf5_filepath = "./mybenchmarkfile.hdf5"
+	num_rows, row_shape = 10000, (64, 64, 3)
+	batch_size, num_batches = 64, 200
+
+	# Smooth images with noise, which are compressible like natural images.
+	rng = np.random.default_rng(0)
+	yy, xx = np.mgrid[:row_shape[0], :row_shape[1]]
+	pattern = ((xx + yy) * 2).astype(np.uint8)[None,:,:,None]
+
+	layouts = [
+		("contiguous", dict(chunked=False)),
+		("chunked (row batches)", dict(access_pattern="row_batches")),
+		("chunked (random rows)", dict(access_pattern="random_rows")),
+		("chunked (tiles)", dict(access_pattern="tiles")),
+		("gzip (random rows)", dict(access_pattern="random_rows", compression="gzip")),
+		("lzf (random rows)", dict(access_pattern="random_rows", compression="lzf")),
+	]
+	if hdf5_util.hdf5plugin is not None:
+		layouts.append(("blosc-lz4 (random rows)", dict(access_pattern="random_rows", compression="blosc")))
+		layouts.append(("lz4 (random rows)", dict(access_pattern="random_rows", compression="lz4")))
+
+	batches = [rng.choice(num_rows, size=batch_size, replace=False) for _ in range(num_batches)]
+	for name, kwargs in layouts:
+		with h5py.File(hdf5_filepath, "w") as f:
+			dset = hdf5_util.create_array_dataset(f, "images", (num_rows,) + row_shape, np.uint8, **kwargs)
+			start_time = time.perf_counter()
+			for start in range(0, num_rows, 1000):
+				noise = rng.integers(0, 4, size=(min(1000, num_rows - start),) + row_shape, dtype=np.uint8)
+				dset[start:start + 1000] = pattern + noise
+			write_time = time.perf_counter() - start_time
+			chunks = dset.chunks
+		file_size = os.path.getsize(hdf5_filepath)
+
+		with h5py.File(hdf5_filepath, "r", rdcc_nbytes=16 * 1024**2) as f:
+			dset = f["images"]
+			start_time = time.perf_counter()
+			for indices in batches:
+				hdf5_util.read_rows(dset, indices)
+			read_time = time.perf_counter() - start_time
+		print("{}: chunks = {}, {:.1f} MB, write {:.1f} MB/s, random-batch read {:.0f} rows/sec.".format(name, chunks, file_size / 1024**2, num_rows * np.prod(row_shape) / write_time / 1024**2, batch_size * num_batches / read_time))
+
+		for num_workers in [1, 2, 4]:
+			with hdf5_util.ParallelHdf5Reader(hdf5_filepath, "images", num_workers=num_workers) as reader:
+				reader.read(batches[0])  # Start the workers.
+				start_time = time.perf_counter()
+				for _ in reader.iterate_batches(batches):
+					pass
+				read_time = time.perf_counter() - start_time
+			print("\t{} workers: random-batch read {:.0f} rows/sec.".format(num_workers, batch_size * num_batches / read_time))
+
+	os.remove(hdf5_filepath)
+
 def main():
 	quick_start_guide()
 
+	#chunked_store_example()
+	#layout_benchmark()
+
 #--------------------------------------------------------------------
 
 if "__main__" == __name__:
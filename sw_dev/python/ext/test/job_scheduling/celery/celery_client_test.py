@@ -65,9 +65,93 @@ def celery_tasks_test():
 	print(f"{result.ready()=}.")
 	print(f"{result.get()=}.")
 
+def batch_tasks_test():
+	import numpy as np
+	from celery_tasks import add, add_batch, mul_batch
+	import celery_util
+
+	xs, ys = np.arange(10000, dtype=np.float64), np.arange(10000, dtype=np.float64) * 2
+
+	# One task for whole arrays, or lists.
+	print(f"{add_batch.delay(xs[:5], ys[:5]).get(timeout=10)=}.")
+	print(f"{mul_batch.delay([1, 2, 3], [4, 5, 6]).get(timeout=10)=}.")
+
+	# Fan-out of slices of arrays: a group of batched tasks.
+	group_result = celery_util.group_batches(add_batch, xs, ys, batch_size=1000).apply_async()
+	# Results are yielded as the tasks finish, not in the order of the group.
+	zs = np.empty_like(xs)
+	for idx, value in celery_util.iterate_as_completed(group_result, timeout=60):
+		zs[idx * 1000:(idx + 1) * 1000] = value
+		print(f"Batch #{idx} done.")
+	print(f"{np.array_equal(zs, xs + ys)=}.")
+
+	# Fan-out of a scalar task: each of the chunks runs 1000 calls of add() in one task.
+	group_result = add.chunks(zip(xs.tolist(), ys.tolist()), 1000).apply_async()
+	for idx, values in celery_util.iterate_as_completed(group_result, timeout=60):
+		print(f"Chunk #{idx}: {len(values)} results.")
+
+def batch_dispatch_benchmark():
+	import time
+	import numpy as np
+	from celery.contrib.testing.worker import start_worker
+	from celery_tasks import app, add, add_batch
+	import celery_util
+
+	# An in-memory broker and result backend, served by a worker thread in this process.
+	# Set them to the real ones (and run a worker by "celery -A celery_tasks worker") to include the network round-trips.
+	# The memory transport polls its queues every second by default, which would dominate the time of a few batched tasks.
+	app.conf.update(broker_url="memory://", result_backend="cache+memory://", broker_transport_options={"polling_interval": 0.01})
+
+	# The in-memory result backend keeps at most 5000 results, so there must be fewer scalar tasks than that.
+	num_elements = 4000
+	xs, ys = np.random.rand(num_elements), np.random.rand(num_elements)
+	expected = xs + ys
+
+	def run(name, dispatch, num_tasks):
+		start_time = time.time()
+		zs = dispatch()
+		elapsed_time = time.time() - start_time
+		print(f"{name}: {num_tasks / elapsed_time:.1f} tasks/sec, {num_elements / elapsed_time:.1f} elements/sec, correct = {np.allclose(zs, expected)}.")
+
+	def dispatch_scalar():
+		results = [add.delay(x, y) for x, y in zip(xs.tolist(), ys.tolist())]
+		zs = np.empty(num_elements)
+		for idx, value in celery_util.iterate_as_completed(results):
+			zs[idx] = value
+		return zs
+
+	def dispatch_chunks(chunk_size):
+		zs = np.empty(num_elements)
+		for idx, values in celery_util.iterate_as_completed(add.chunks(zip(xs.tolist(), ys.tolist()), chunk_size).apply_async()):
+			zs[idx * chunk_size:(idx + 1) * chunk_size] = values
+		return zs
+
+	def dispatch_batches(xs, ys, batch_size, serializer):
+		zs = np.empty(num_elements)
+		for idx, values in celery_util.iterate_as_completed(celery_util.group_batches(add_batch, xs, ys, batch_size=batch_size).apply_async(serializer=serializer)):
+			zs[idx * batch_size:(idx + 1) * batch_size] = values
+		return zs
+
+	with start_worker(app, pool="solo", perform_ping_check=False):
+		run("Scalar add()", dispatch_scalar, num_elements)
+		for chunk_size in [100, 1000]:
+			run(f"add.chunks(), chunk size = {chunk_size}", lambda: dispatch_chunks(chunk_size), num_elements // chunk_size)
+		for serializer in ["pickle5", "msgpack_numpy", "json"]:
+			if serializer not in app.conf.accept_content:
+				continue
+			for batch_size in [100, 1000]:
+				# JSON cannot carry NumPy arrays, so lists are sent.
+				args = (xs.tolist(), ys.tolist()) if "json" == serializer else (xs, ys)
+				run(f"Group of add_batch(), batch size = {batch_size}, serializer = {serializer}", lambda: dispatch_batches(*args, batch_size, serializer), num_elements // batch_size)
+
 def main():
 	celery_tasks_test()
 
+	# Batched tasks.
+	#	REF [file] >> ./celery_util.py
+	#batch_tasks_test()
+	#batch_dispatch_benchmark()
+
 #--------------------------------------------------------------------
 
 if "__main__" == __name__:
@@ -4,7 +4,9 @@
 #	http://docs.celeryproject.org/en/latest/getting-started/first-steps-with-celery.html
 #	http://docs.celeryproject.org/en/latest/getting-started/brokers/redis.html
 
+import numpy as np
 from celery import Celery
+import celery_util
 
 #app = Celery("tasks", broker="pyamqp://guest@localhost//")  # With no result backend.
 #app = Celery("tasks", broker="redis://localhost:6379/0")  # With no result backend.
@@ -49,6 +51,13 @@ In celeryconfig.py:
 app.config_from_object("celeryconfig")
 """
 
+# Binary serializers for the batched tasks.
+#	REF [file] >> ./celery_util.py
+app.conf.accept_content = ["json"] + celery_util.register_serializers()
+app.conf.result_accept_content = app.conf.accept_content
+# Results of the batched tasks can be NumPy arrays, which JSON cannot carry.
+app.conf.result_serializer = "pickle5"
+
 @app.task
 def add(x, y):
 	return x + y
@@ -65,6 +74,30 @@ def mul(x, y):
 def div(x, y):
 	return x / y
 
+#--------------------------------------------------------------------
+# Batched tasks, which compute many element-wise operations in one broker round-trip.
+#	xs and ys are NumPy arrays or lists of the same length.
+#	The result is a NumPy array if any of them is one, or a list otherwise.
+
+def _to_result(result, xs, ys):
+	return result if isinstance(xs, np.ndarray) or isinstance(ys, np.ndarray) else result.tolist()
+
+@app.task(serializer="pickle5")
+def add_batch(xs, ys):
+	return _to_result(np.add(xs, ys), xs, ys)
+
+@app.task(serializer="pickle5")
+def sub_batch(xs, ys):
+	return _to_result(np.subtract(xs, ys), xs, ys)
+
+@app.task(serializer="pickle5")
+def mul_batch(xs, ys):
+	return _to_result(np.multiply(xs, ys), xs, ys)
+
+@app.task(serializer="pickle5")
+def div_batch(xs, ys):
+	return _to_result(np.true_divide(xs, ys), xs, ys)
+
 def main():
 	app.conf.broker_url = "pyamqp://guest@localhost//"
 	#app.conf.broker_url = "redis://localhost:6379/0"
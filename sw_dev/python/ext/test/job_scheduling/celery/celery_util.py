@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+# Batched task dispatch for Celery.
+#	- Serializers for binary payloads, e.g. NumPy arrays, which JSON can carry only as lists of numbers:
+#		"pickle5": pickle protocol 5. Out-of-band buffers, e.g. the data of NumPy arrays, are appended after the pickle stream as they are, instead of being copied into it.
+#			On decoding, arrays are rebuilt over slices of the message body without copies, so they are read-only.
+#			Like the built-in "pickle" serializer, it can execute arbitrary code on decoding, so use it only with a broker whose clients are trusted.
+#		"msgpack_numpy": msgpack with NumPy arrays as an extension type of (dtype, shape, data). It is registered only if msgpack is installed.
+#	- Fan-out: group_batches() splits arrays into slices and makes a group of one batched task per slice.
+#		Scalar tasks can be batched without a batched variant by chunks, e.g. add.chunks(zip(xs, ys), 100), which runs 100 calls per task message.
+#	- iterate_as_completed() yields the results of tasks in the order in which they finish, polling the result backend once for all the pending tasks.
+# REF [site] >>
+#	https://docs.celeryq.dev/en/stable/userguide/calling.html#serializers
+#	https://docs.celeryq.dev/en/stable/userguide/canvas.html#chunks
+#	https://peps.python.org/pep-0574/
+
+import time, pickle, struct
+import numpy as np
+from celery import group, states
+from celery.exceptions import TimeoutError
+from celery.result import ResultSet
+from kombu.serialization import register
+
+try:
+	import msgpack
+except ImportError:
+	msgpack = None
+
+_LENGTH = struct.Struct("<Q")
+
+def _pickle5_dumps(obj):
+	buffers = list()
+	payload = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+	buffers = [buf.raw() for buf in buffers]
+	# Body: #buffers, the lengths of the pickle stream and the buffers, the pickle stream, and the buffers.
+	header = struct.pack("<{}Q".format(len(buffers) + 2), len(buffers), len(payload), *(buf.nbytes for buf in buffers))
+	return b"".join([header, payload, *buffers])
+
+def _pickle5_loads(body):
+	body = memoryview(body)
+	num_buffers, = _LENGTH.unpack_from(body)
+	lengths = struct.unpack_from("<{}Q".format(num_buffers + 1), body, _LENGTH.size)
+	chunks, offset = list(), _LENGTH.size * (num_buffers + 2)
+	for length in lengths:
+		chunks.append(body[offset:offset + length])
+		offset += length
+	return pickle.loads(chunks[0], buffers=chunks[1:])
+
+_NDARRAY_EXT_TYPE = 42
+
+def _msgpack_default(obj):
+	if isinstance(obj, np.ndarray):
+		if obj.dtype.hasobject:
+			raise TypeError("Object arrays cannot be serialized: {}.".format(obj.dtype))
+		array = np.ascontiguousarray(obj)
+		return msgpack.ExtType(_NDARRAY_EXT_TYPE, msgpack.packb([array.dtype.str, array.shape, memoryview(array).cast("B")], use_bin_type=True))
+	elif isinstance(obj, np.generic):
+		return obj.item()
+	raise TypeError("Unsupported type: {}.".format(type(obj)))
+
+def _msgpack_ext_hook(code, data):
+	if code == _NDARRAY_EXT_TYPE:
+		dtype, shape, buf = msgpack.unpackb(data, raw=False)
+		return np.frombuffer(buf, dtype=dtype).reshape(shape)
+	return msgpack.ExtType(code, data)
+
+def _msgpack_dumps(obj):
+	return msgpack.packb(obj, use_bin_type=True, default=_msgpack_default)
+
+def _msgpack_loads(body):
+	return msgpack.unpackb(body, raw=False, ext_hook=_msgpack_ext_hook)
+
+def register_serializers():
+	"""Registers the "pickle5" and "msgpack_numpy" serializers with kombu, and returns their names.
+
+	It has to be called in the clients and in the workers. They also have to be in accept_content (and result_accept_content) of the app.
+	"""
+	register("pickle5", _pickle5_dumps, _pickle5_loads, content_type="application/x-python-serialize-5", content_encoding="binary")
+	if msgpack is None:
+		return ["pickle5"]
+	register("msgpack_numpy", _msgpack_dumps, _msgpack_loads, content_type="application/x-msgpack-numpy", content_encoding="binary")
+	return ["pickle5", "msgpack_numpy"]
+
+#--------------------------------------------------------------------
+
+def group_batches(batch_task, *arrays, batch_size=1000):
+	"""Makes a group of batch_task signatures, each of which takes the same slice of all the arrays.
+
+	arrays are NumPy arrays or lists of the same length. Their slices are passed as they are.
+	"""
+	num_elements = len(arrays[0])
+	if any(len(array) != num_elements for array in arrays):
+		raise ValueError("Invalid lengths of arrays: {}.".format([len(array) for array in arrays]))
+	return group(batch_task.s(*(array[start:start + batch_size] for array in arrays)) for start in range(0, num_elements, batch_size))
+
+def _poll_results(results, timeout, interval):
+	pending, start_time = list(results), time.monotonic()
+	while pending:
+		still_pending = list()
+		for result in pending:
+			if result.ready():
+				yield result.id, {"status": result.state, "result": result.result}
+			else:
+				still_pending.append(result)
+		pending = still_pending
+		if pending:
+			if timeout and time.monotonic() - start_time >= timeout:
+				raise TimeoutError("Operation timed out ({}).".format(timeout))
+			time.sleep(interval)
+
+def iterate_as_completed(results, timeout=None, interval=0.05, propagate=True):
+	"""Yields (index, value) of task results in the order in which the tasks finish.
+
+	results is a sequence of AsyncResults, or a ResultSet, e.g. a GroupResult. index is the position of a result in it.
+	If propagate is True, the exception of a failed task is raised. Otherwise, it is yielded as the value.
+	"""
+	result_set = results if isinstance(results, ResultSet) else ResultSet(list(results))
+	if not result_set.results:
+		return
+	indices = {result.id: idx for idx, result in enumerate(result_set.results)}
+	if result_set.supports_native_join:
+		# The Redis and cache backends fetch all the pending results in one request per poll, and the RPC backend consumes them as messages.
+		metas = result_set.iter_native(timeout=timeout, interval=interval)
+	else:
+		metas = _poll_results(result_set.results, timeout, interval)
+	for task_id, meta in metas:
+		value = meta["result"]
+		if propagate and meta["status"] in states.PROPAGATE_STATES:
+			raise value
+		yield indices[task_id], value
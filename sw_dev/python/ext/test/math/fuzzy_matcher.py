@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Batched fuzzy matching of many queries against many choices with RapidFuzz.
+#	- The choices are preprocessed once, and sorted by length.
+#	- Queries are matched in blocks with rapidfuzz.process.cdist(), whose score matrices are bounded by a memory budget.
+#	- Prefilters prune the choices which cannot reach score_cutoff before they are scored:
+#		Length filter: for normalized Indel (fuzz.ratio) and Levenshtein similarities, the score is bounded by the ratio of the string lengths.
+#			Since the choices are sorted by length, the remaining choices are a contiguous range.
+#		Q-gram count filter: strings within edit distance k share at least max(len1, len2) - q + 1 - k * q q-grams.
+#			Shared q-grams are counted by a sparse matrix product, and only the remaining pairs are scored by rapidfuzz.process.cpdist().
+#		Both filters are exact, i.e. they never drop a match whose score >= score_cutoff.
+#	- The top-k matches of each query are returned as NumPy arrays.
+# REF [site] >>
+#	https://rapidfuzz.github.io/RapidFuzz/Usage/process.html
+#	https://en.wikipedia.org/wiki/N-gram#n-grams_for_approximate_matching
+
+import math
+import numpy as np
+import rapidfuzz
+
+def _indel_length_range(length, cutoff):
+	# 2 * LCS / (len1 + len2) <= 2 * min(len1, len2) / (len1 + len2).
+	return length * cutoff / (2 - cutoff), length * (2 - cutoff) / cutoff
+
+def _indel_max_distance(lengths1, lengths2, cutoff):
+	return np.floor((lengths1 + lengths2) * (1 - cutoff) + 1e-9)
+
+def _levenshtein_length_range(length, cutoff):
+	# 1 - distance / max(len1, len2) <= min(len1, len2) / max(len1, len2).
+	return length * cutoff, length / cutoff
+
+def _levenshtein_max_distance(lengths1, lengths2, cutoff):
+	return np.floor(np.maximum(lengths1, lengths2) * (1 - cutoff) + 1e-9)
+
+# Scorer -> (score scale, length range function, max edit distance function).
+#	The Levenshtein distance is at most the Indel distance, so the Indel distance bound is valid for the q-gram count filter.
+_SCORER_BOUNDS = {
+	rapidfuzz.fuzz.ratio: (100, _indel_length_range, _indel_max_distance),
+	rapidfuzz.distance.Indel.normalized_similarity: (1, _indel_length_range, _indel_max_distance),
+	rapidfuzz.distance.Levenshtein.normalized_similarity: (1, _levenshtein_length_range, _levenshtein_max_distance),
+}
+
+def _get_qgram_matrix(strings, qval, vocabulary, grow_vocabulary):
+	# Sparse (#strings, #q-grams) matrix of q-gram counts.
+	import scipy.sparse
+
+	indptr, indices = [0], list()
+	for s in strings:
+		for idx in range(len(s) - qval + 1):
+			qgram = s[idx:idx + qval]
+			column = vocabulary.get(qgram)
+			if column is None:
+				if not grow_vocabulary:
+					continue
+				column = vocabulary[qgram] = len(vocabulary)
+			indices.append(column)
+		indptr.append(len(indices))
+	data = np.ones(len(indices), dtype=np.int32)
+	matrix = scipy.sparse.csr_matrix((data, np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)), shape=(len(strings), max(len(vocabulary), 1)))
+	matrix.sum_duplicates()
+	return matrix
+
+class FuzzyMatcher(object):
+	"""Matches batches of queries against a fixed set of choices.
+
+	The choices are preprocessed by processor once. The same processor is applied to the queries.
+	The length and the q-gram prefilters are only applied when score_cutoff is given and the scorer is fuzz.ratio, Indel.normalized_similarity, or Levenshtein.normalized_similarity.
+	The q-gram prefilter needs SciPy, and is enabled by qval, e.g. 2 or 3.
+	Queries are sorted by length, and matched in blocks of query_block_size queries.
+	memory_budget bounds the size of the score matrix, or of the sparse q-gram product, of each block in bytes.
+	"""
+
+	def __init__(self, choices, scorer=rapidfuzz.fuzz.ratio, processor=rapidfuzz.utils.default_process, qval=None, query_block_size=256, memory_budget=256 * 1024**2, workers=-1):
+		self.scorer = scorer
+		self.processor = processor
+		self.qval = qval
+		self.query_block_size = query_block_size
+		self.memory_budget = memory_budget
+		self.workers = workers
+
+		processed = [processor(choice) for choice in choices] if processor else list(choices)
+		lengths = np.fromiter(map(len, processed), dtype=np.int64, count=len(processed))
+		self._order = np.argsort(lengths, kind="stable")  # Sorted position -> choice index.
+		self._choices = [processed[idx] for idx in self._order]
+		self._lengths = lengths[self._order]
+
+		if qval and scorer in _SCORER_BOUNDS:
+			self._qgram_vocabulary = dict()
+			self._choice_qgrams = _get_qgram_matrix(self._choices, qval, self._qgram_vocabulary, True)
+		else:
+			self._qgram_vocabulary, self._choice_qgrams = None, None
+
+	def __len__(self):
+		return len(self._choices)
+
+	def match(self, queries, k=1, score_cutoff=None):
+		"""Top-k matches of each query.
+
+		Returns (indices, scores) of shape (#queries, k) in descending order of scores.
+		Missing matches, e.g. below score_cutoff, have index -1 and score -inf.
+		"""
+		processed = [self.processor(query) for query in queries] if self.processor else list(queries)
+		lengths = np.fromiter(map(len, processed), dtype=np.int64, count=len(processed))
+		k = min(k, len(self._choices))
+		indices = np.full((len(processed), k), -1, dtype=np.int64)
+		scores = np.full((len(processed), k), -np.inf, dtype=np.float32)
+		if k == 0 or len(processed) == 0:
+			return indices, scores
+
+		bounds = _SCORER_BOUNDS.get(self.scorer) if score_cutoff else None
+		query_order = np.argsort(lengths, kind="stable")
+		# Blocks of queries of similar lengths, whose length-filtered choice ranges are narrow.
+		for block_start in range(0, len(processed), self.query_block_size):
+			rows = query_order[block_start:block_start + self.query_block_size]
+			block_queries = [processed[row] for row in rows]
+			block_lengths = lengths[rows]
+
+			if bounds:
+				scale, length_range, _ = bounds
+				cutoff = score_cutoff / scale
+				lo, _ = length_range(block_lengths.min(), cutoff)
+				_, hi = length_range(block_lengths.max(), cutoff)
+				col_lo = np.searchsorted(self._lengths, math.ceil(lo - 1e-9), side="left")
+				col_hi = np.searchsorted(self._lengths, math.floor(hi + 1e-9), side="right")
+			else:
+				col_lo, col_hi = 0, len(self._choices)
+			if col_lo >= col_hi:
+				continue
+
+			if bounds and self._choice_qgrams is not None:
+				block_cols, block_scores = self._match_qgram_filtered(block_queries, block_lengths, col_lo, col_hi, k, score_cutoff, bounds)
+			else:
+				block_cols, block_scores = self._match_dense(block_queries, col_lo, col_hi, k, score_cutoff)
+			is_valid = block_cols >= 0
+			indices[rows] = np.where(is_valid, self._order[np.maximum(block_cols, 0)], -1)
+			scores[rows] = block_scores
+		return indices, scores
+
+	def _merge_top_k(self, best_cols, best_scores, cols, scores, k):
+		cols = np.concatenate([best_cols, cols], axis=1)
+		scores = np.concatenate([best_scores, scores], axis=1)
+		top = np.argpartition(-scores, k - 1, axis=1)[:,:k]
+		return np.take_along_axis(cols, top, axis=1), np.take_along_axis(scores, top, axis=1)
+
+	def _sort_top_k(self, cols, scores):
+		order = np.argsort(-scores, axis=1, kind="stable")
+		cols, scores = np.take_along_axis(cols, order, axis=1), np.take_along_axis(scores, order, axis=1)
+		cols[~np.isfinite(scores)] = -1
+		return cols, scores
+
+	def _match_dense(self, block_queries, col_lo, col_hi, k, score_cutoff):
+		num_rows = len(block_queries)
+		best_cols = np.full((num_rows, k), -1, dtype=np.int64)
+		best_scores = np.full((num_rows, k), -np.inf, dtype=np.float32)
+		tile_size = int(max(self.memory_budget // (4 * num_rows) - k, 1))
+		for col_start in range(col_lo, col_hi, tile_size):
+			col_end = min(col_start + tile_size, col_hi)
+			scores = rapidfuzz.process.cdist(block_queries, self._choices[col_start:col_end], scorer=self.scorer, processor=None, score_cutoff=score_cutoff, dtype=np.float32, workers=self.workers)
+			if score_cutoff is not None:
+				scores[scores < score_cutoff] = -np.inf
+			cols = np.broadcast_to(np.arange(col_start, col_end), scores.shape)
+			best_cols, best_scores = self._merge_top_k(best_cols, best_scores, cols, scores, k)
+		return self._sort_top_k(best_cols, best_scores)
+
+	def _match_qgram_filtered(self, block_queries, block_lengths, col_lo, col_hi, k, score_cutoff, bounds):
+		scale, _, max_distance = bounds
+		cutoff = score_cutoff / scale
+
+		def get_min_shared(lengths1, lengths2):
+			return np.maximum(lengths1, lengths2) - self.qval + 1 - max_distance(lengths1, lengths2, cutoff) * self.qval
+
+		# Pairs without any shared q-gram are not in the sparse product, but can still match if their bound is <= 0, e.g. for short strings.
+		# Those rows fall back to dense scoring.
+		# Over a range of choice lengths, the bound is the smallest at either end of the range or at the query length.
+		min_length, max_length = self._lengths[col_lo], self._lengths[col_hi - 1]
+		worst_bounds = np.minimum.reduce([get_min_shared(block_lengths, length) for length in (min_length, np.clip(block_lengths, min_length, max_length), max_length)])
+		is_dense_row = worst_bounds <= 0
+
+		num_rows = len(block_queries)
+		best_cols = np.full((num_rows, k), -1, dtype=np.int64)
+		best_scores = np.full((num_rows, k), -np.inf, dtype=np.float32)
+		sparse_rows = np.flatnonzero(~is_dense_row)
+		if len(sparse_rows):
+			query_qgrams = _get_qgram_matrix([block_queries[row] for row in sparse_rows], self.qval, self._qgram_vocabulary, False)
+			# Column tiles bound the size of the sparse product, in which each pair takes about 24 bytes.
+			tile_size = int(max(self.memory_budget // (24 * len(sparse_rows)), 1))
+			for col_start in range(col_lo, col_hi, tile_size):
+				col_end = min(col_start + tile_size, col_hi)
+				# The product of q-gram counts is >= the size of the multiset intersection, so the filter stays exact.
+				shared = (query_qgrams @ self._choice_qgrams[col_start:col_end].T).tocoo()
+				rows, cols = shared.row.astype(np.int64), shared.col.astype(np.int64) + col_start
+				is_candidate = shared.data >= get_min_shared(block_lengths[sparse_rows[rows]], self._lengths[cols])
+				rows, cols = rows[is_candidate], cols[is_candidate]
+				if len(rows) == 0:
+					continue
+
+				scores = rapidfuzz.process.cpdist([block_queries[row] for row in sparse_rows[rows]], [self._choices[col] for col in cols], scorer=self.scorer, processor=None, score_cutoff=score_cutoff, dtype=np.float32, workers=self.workers)
+				is_match = scores >= score_cutoff
+				rows, cols, scores = rows[is_match], cols[is_match], scores[is_match]
+
+				# Scatter the top-k pairs of each row into (#rows, k) arrays: sort by row and then by score in descending order, and rank within each row.
+				order = np.lexsort((-scores, rows))
+				rows, cols, scores = rows[order], cols[order], scores[order]
+				ranks = np.arange(len(rows)) - np.searchsorted(rows, rows, side="left")
+				is_top = ranks < k
+				tile_cols = np.full((len(sparse_rows), k), -1, dtype=np.int64)
+				tile_scores = np.full((len(sparse_rows), k), -np.inf, dtype=np.float32)
+				tile_cols[rows[is_top], ranks[is_top]] = cols[is_top]
+				tile_scores[rows[is_top], ranks[is_top]] = scores[is_top]
+				best_cols[sparse_rows], best_scores[sparse_rows] = self._merge_top_k(best_cols[sparse_rows], best_scores[sparse_rows], tile_cols, tile_scores, k)
+			best_cols[sparse_rows], best_scores[sparse_rows] = self._sort_top_k(best_cols[sparse_rows], best_scores[sparse_rows])
+
+		dense_rows = np.flatnonzero(is_dense_row)
+		if len(dense_rows):
+			best_cols[dense_rows], best_scores[dense_rows] = self._match_dense([block_queries[row] for row in dense_rows], col_lo, col_hi, k, score_cutoff)
+		return best_cols, best_scores
@@ -29,6 +29,9 @@ def simple_example():
 def main():
 	simple_example()
 
+	# Benchmark of string distances across textdistance, RapidFuzz, and jellyfish:
+	#	REF [file] >> ./string_distance_benchmark.py
+
 #--------------------------------------------------------------------
 
 if '__main__' == __name__:
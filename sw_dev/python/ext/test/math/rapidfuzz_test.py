@@ -1,7 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 
+import time, random
+import numpy as np
 import rapidfuzz
+import fuzzy_matcher
 
 # REF [site] >> https://github.com/maxbachmann/RapidFuzz
 def simple_example():
@@ -77,9 +80,62 @@ def simple_example():
 	result = rapidfuzz.process.extractOne("cowboys", choices, scorer=rapidfuzz.fuzz.WRatio, processor=rapidfuzz.utils.default_process)
 	print(f"{result=}")
 
+def batched_matching_benchmark():
+	num_choices, num_queries, k, score_cutoff = 100000, 1000, 5, 80
+
+	# Canonical names and their noisy variants.
+	rng = random.Random(0)
+	syllables = ["ka", "ri", "mo", "ne", "su", "to", "la", "vi", "de", "ron", "mar", "tin", "son", "berg", "ville"]
+	def generate_name():
+		return " ".join("".join(rng.choice(syllables) for _ in range(rng.randint(1, 4))).capitalize() for _ in range(rng.randint(1, 3)))
+	def add_typos(name):
+		chars = list(name)
+		for _ in range(rng.randint(0, 2)):
+			idx = rng.randrange(len(chars))
+			chars[idx] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+		return "".join(chars)
+	choices = [generate_name() for _ in range(num_choices)]
+	queries = [add_typos(rng.choice(choices)) for _ in range(num_queries)]
+
+	# Per-query extract loop.
+	num_loop_queries = 100
+	start_time = time.perf_counter()
+	for query in queries[:num_loop_queries]:
+		rapidfuzz.process.extract(query, choices, scorer=rapidfuzz.fuzz.ratio, processor=rapidfuzz.utils.default_process, limit=k, score_cutoff=score_cutoff)
+	elapsed_time = time.perf_counter() - start_time
+	print(f"process.extract loop: {num_loop_queries / elapsed_time:.1f} queries/sec.")
+
+	variants = [
+		("cdist (no prefilter)", dict(), None),
+		("cdist + length filter", dict(), score_cutoff),
+		("cdist + length & 2-gram filters", dict(qval=2), score_cutoff),
+		("cdist + length & 3-gram filters", dict(qval=3), score_cutoff),
+	]
+	reference = None
+	for name, kwargs, cutoff in variants:
+		start_time = time.perf_counter()
+		matcher = fuzzy_matcher.FuzzyMatcher(choices, scorer=rapidfuzz.fuzz.ratio, processor=rapidfuzz.utils.default_process, workers=-1, **kwargs)
+		build_time = time.perf_counter() - start_time
+		start_time = time.perf_counter()
+		indices, scores = matcher.match(queries, k=k, score_cutoff=cutoff)
+		elapsed_time = time.perf_counter() - start_time
+
+		if cutoff is None:
+			scores = np.where(scores >= score_cutoff, scores, -np.inf)
+		if reference is None:
+			reference = scores
+		is_equal = np.array_equal(reference, scores)
+		print(f"{name}: build {build_time:.2f} secs, {num_queries / elapsed_time:.1f} queries/sec, same top-{k} scores = {is_equal}.")
+	print(f"Top-{k} of {queries[0]!r}: {[(choices[idx], float(score)) for idx, score in zip(indices[0], scores[0]) if idx >= 0]}.")
+
 def main():
 	simple_example()
 
+	#batched_matching_benchmark()
+
+	# Benchmark of string distances across textdistance, RapidFuzz, and jellyfish:
+	#	REF [file] >> ./string_distance_benchmark.py
+
 #--------------------------------------------------------------------
 
 if '__main__' == __name__:
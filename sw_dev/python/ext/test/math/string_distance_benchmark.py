@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Benchmark of string distances across textdistance, RapidFuzz, and jellyfish.
+#	- Metrics: Hamming, Levenshtein, Damerau-Levenshtein, Jaro, Jaro-Winkler, and q-gram Jaccard.
+#	- Corpora of string pairs are generated with Latin and Hangul alphabets and different string lengths.
+#	- For each metric and backend, pairs/sec and the agreement with the reference backend are reported.
+#		The reference is textdistance with external=False, i.e. its own pure-Python implementations.
+#		Backends can disagree by definition, e.g. unrestricted Damerau-Levenshtein vs optimal string alignment (restricted), or the q-gram definition of Jaccard.
+#	- build_dispatch() routes each metric to the fastest backend which fully agrees with the reference, and compute_distances() uses it.
+#	- RapidFuzz also has a vectorized backend, which scores all the pairs in one rapidfuzz.process.cpdist() call.
+# REF [file] >>
+#	${SWDT_PYTHON_HOME}/ext/test/math/textdistance_test.py
+#	${SWDT_PYTHON_HOME}/ext/test/math/rapidfuzz_test.py
+#	${SWDT_PYTHON_HOME}/ext/test/math/jellyfish_test.py
+
+import time, random, collections
+import numpy as np
+
+METRICS = ("hamming", "levenshtein", "damerau_levenshtein", "jaro", "jaro_winkler", "qgram_jaccard")
+
+LATIN_ALPHABET = "abcdefghijklmnopqrstuvwxyz"
+# A subset of Hangul syllables, so that random strings share characters.
+HANGUL_ALPHABET = "가나다라마바사아자차카타파하강남동서울부산대전광주"
+
+_QVAL = 2
+
+def _qgram_set(s, qval=_QVAL):
+	return set(s[idx:idx + qval] for idx in range(len(s) - qval + 1))
+
+def _qgram_jaccard(s1, s2):
+	qgrams1, qgrams2 = _qgram_set(s1), _qgram_set(s2)
+	union = len(qgrams1 | qgrams2)
+	return len(qgrams1 & qgrams2) / union if union else 1.0
+
+def _get_backends():
+	# Metric -> backend name -> (pairwise function, batch function or None).
+	backends = collections.defaultdict(dict)
+
+	try:
+		import textdistance
+		backends["hamming"]["textdistance"] = textdistance.Hamming(external=False).distance, None
+		backends["levenshtein"]["textdistance"] = textdistance.Levenshtein(external=False).distance, None
+		# Optimal string alignment by default, i.e. restricted=True.
+		backends["damerau_levenshtein"]["textdistance"] = textdistance.DamerauLevenshtein(restricted=False, external=False).distance, None
+		backends["jaro"]["textdistance"] = textdistance.Jaro(external=False).similarity, None
+		backends["jaro_winkler"]["textdistance"] = textdistance.JaroWinkler(external=False).similarity, None
+		backends["qgram_jaccard"]["textdistance"] = textdistance.Jaccard(qval=_QVAL, as_set=True, external=False).similarity, None
+	except ImportError:
+		pass
+
+	try:
+		import rapidfuzz
+		from rapidfuzz.distance import Hamming, Levenshtein, DamerauLevenshtein, Jaro, JaroWinkler
+
+		def get_batch_function(scorer, dtype):
+			def compute(strings1, strings2):
+				return rapidfuzz.process.cpdist(strings1, strings2, scorer=scorer, dtype=dtype, workers=-1)
+			return compute
+
+		for metric, scorer, dtype in [("hamming", Hamming.distance, np.int32), ("levenshtein", Levenshtein.distance, np.int32), ("damerau_levenshtein", DamerauLevenshtein.distance, np.int32), ("jaro", Jaro.similarity, np.float64), ("jaro_winkler", JaroWinkler.similarity, np.float64)]:
+			backends[metric]["rapidfuzz"] = scorer, get_batch_function(scorer, dtype)
+	except ImportError:
+		pass
+
+	try:
+		import jellyfish
+		backends["hamming"]["jellyfish"] = jellyfish.hamming_distance, None
+		backends["levenshtein"]["jellyfish"] = jellyfish.levenshtein_distance, None
+		backends["damerau_levenshtein"]["jellyfish"] = jellyfish.damerau_levenshtein_distance, None
+		backends["jaro"]["jellyfish"] = jellyfish.jaro_similarity, None
+		backends["jaro_winkler"]["jellyfish"] = jellyfish.jaro_winkler_similarity, None
+		backends["qgram_jaccard"]["jellyfish"] = lambda s1, s2: jellyfish.jaccard_similarity(s1, s2, _QVAL), None
+	except ImportError:
+		pass
+
+	# RapidFuzz and jellyfish have no set-based q-gram Jaccard similarity.
+	backends["qgram_jaccard"]["builtin"] = _qgram_jaccard, None
+	return backends
+
+def generate_corpus(num_pairs, length, alphabet, max_edits=None, seed=0):
+	"""Pairs of a random string and a copy of it with random edits.
+
+	Substitutions, insertions, deletions, and transpositions are applied, so that all the metrics have non-trivial values.
+	"""
+	rng = random.Random(seed)
+	max_edits = max(length // 4, 1) if max_edits is None else max_edits
+	strings1, strings2 = list(), list()
+	for _ in range(num_pairs):
+		s1 = [rng.choice(alphabet) for _ in range(length)]
+		s2 = list(s1)
+		for _ in range(rng.randint(0, max_edits)):
+			idx = rng.randrange(len(s2)) if s2 else 0
+			op = rng.randrange(4)
+			if 0 == op and s2:
+				s2[idx] = rng.choice(alphabet)
+			elif 1 == op:
+				s2.insert(idx, rng.choice(alphabet))
+			elif 2 == op and len(s2) > 1:
+				del s2[idx]
+			elif 3 == op and idx + 1 < len(s2):
+				s2[idx], s2[idx + 1] = s2[idx + 1], s2[idx]
+		strings1.append("".join(s1))
+		strings2.append("".join(s2))
+	return strings1, strings2
+
+def _run(function, batch_function, strings1, strings2):
+	start_time = time.perf_counter()
+	if batch_function:
+		values = np.asarray(batch_function(strings1, strings2), dtype=np.float64)
+	else:
+		values = np.fromiter((function(s1, s2) for s1, s2 in zip(strings1, strings2)), dtype=np.float64, count=len(strings1))
+	return values, time.perf_counter() - start_time
+
+def run_benchmark(corpora, metrics=METRICS, reference="textdistance", max_reference_pairs=None, verbose=True):
+	"""Runs all the backends of metrics on corpora, a dict of corpus name -> (strings1, strings2).
+
+	Pairs on which the reference is evaluated can be limited by max_reference_pairs, since the pure-Python reference is slow for long strings.
+	Returns a list of dicts with keys "metric", "corpus", "backend", "pairs_per_sec", and "agreement".
+	"""
+	backends = _get_backends()
+	results = list()
+	for metric in metrics:
+		metric_backends = backends.get(metric, dict())
+		if reference not in metric_backends:
+			raise ValueError("Reference backend not available for {}: {}.".format(metric, reference))
+		# The batch variants are benchmarked as separate backends.
+		variants = list()
+		for name, (function, batch_function) in metric_backends.items():
+			variants.append((name, function, None))
+			if batch_function:
+				variants.append((name + " (batch)", function, batch_function))
+
+		for corpus_name, (strings1, strings2) in corpora.items():
+			num_reference_pairs = len(strings1) if max_reference_pairs is None else min(len(strings1), max_reference_pairs)
+			reference_values, _ = _run(metric_backends[reference][0], None, strings1[:num_reference_pairs], strings2[:num_reference_pairs])
+			for name, function, batch_function in variants:
+				values, elapsed_time = _run(function, batch_function, strings1, strings2)
+				agreement = float(np.mean(np.isclose(values[:num_reference_pairs], reference_values, rtol=0, atol=1e-6)))
+				results.append({"metric": metric, "corpus": corpus_name, "backend": name, "pairs_per_sec": len(strings1) / elapsed_time, "agreement": agreement})
+				if verbose:
+					print("{}, {}, {}: {:.0f} pairs/sec, agreement = {:.4f}.".format(metric, corpus_name, name, len(strings1) / elapsed_time, agreement))
+	return results
+
+def choose_backends(results, min_agreement=1.0):
+	"""Chooses the fastest backend of each metric which agrees with the reference on all the corpora.
+
+	Backends are ranked by their geometric mean of pairs/sec over the corpora.
+	Returns a dict of metric -> backend name.
+	"""
+	grouped = collections.defaultdict(list)
+	for result in results:
+		grouped[result["metric"], result["backend"]].append(result)
+
+	chosen = dict()
+	for metric in sorted(set(metric for metric, _ in grouped)):
+		candidates = list()
+		for (metric_, backend), backend_results in grouped.items():
+			if metric_ == metric and all(result["agreement"] >= min_agreement for result in backend_results):
+				candidates.append((np.exp(np.mean(np.log([result["pairs_per_sec"] for result in backend_results]))), backend))
+		if candidates:
+			chosen[metric] = max(candidates)[1]
+	return chosen
+
+def build_dispatch(results=None, min_agreement=1.0):
+	"""Returns a dict of metric -> (pairwise function, batch function or None) of the chosen backends.
+
+	Without results, a small benchmark is run on the default corpora first.
+	"""
+	if results is None:
+		results = run_benchmark(get_default_corpora(num_pairs=500, lengths=(8, 32)), verbose=False)
+	backends = _get_backends()
+	dispatch = dict()
+	for metric, name in choose_backends(results, min_agreement).items():
+		is_batch = name.endswith(" (batch)")
+		function, batch_function = backends[metric][name[:-len(" (batch)")] if is_batch else name]
+		dispatch[metric] = function, batch_function if is_batch else None
+	return dispatch
+
+def compute_distances(dispatch, metric, strings1, strings2):
+	"""Computes a metric over pairs of strings with the backend chosen in dispatch. Returns a NumPy array."""
+	function, batch_function = dispatch[metric]
+	return _run(function, batch_function, strings1, strings2)[0]
+
+def get_default_corpora(num_pairs=2000, lengths=(8, 32, 128)):
+	corpora = dict()
+	for alphabet_name, alphabet in [("latin", LATIN_ALPHABET), ("hangul", HANGUL_ALPHABET)]:
+		for length in lengths:
+			# Fewer pairs of long strings, for the quadratic pure-Python implementations.
+			corpora["{}-{}".format(alphabet_name, length)] = generate_corpus(max(num_pairs * 8 // length, 50) if length > 8 else num_pairs, length, alphabet, seed=length)
+	return corpora
+
+def main():
+	corpora = get_default_corpora()
+	results = run_benchmark(corpora)
+
+	print("\nFastest backends which agree with the reference:")
+	dispatch_names = choose_backends(results)
+	for metric in METRICS:
+		print("\t{}: {}.".format(metric, dispatch_names.get(metric, "none")))
+
+	dispatch = build_dispatch(results)
+	strings1, strings2 = corpora["hangul-8"]
+	print("Levenshtein distances of {} Hangul pairs: {}.".format(len(strings1), compute_distances(dispatch, "levenshtein", strings1, strings2)[:10]))
+
+#--------------------------------------------------------------------
+
+if '__main__' == __name__:
+	main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+# asyncio variant of the echo server in socketserver_tcp_server.py.
+#	- The protocol is the same: greet with 'Hi <address>', echo received data upper-cased, and say 'Bye <address>' and close on 'bye'.
+#	- All the connections are served by one event loop in one thread, instead of an OS thread per connection.
+#	- Writes go to the transport's buffer, which is flushed by the event loop whenever the socket is writable, instead of blocking in sendall().
+#		Reading is paused while the write buffer is over its high-water mark, so a slow client cannot make the buffer grow without bounds.
+# REF [site] >> https://docs.python.org/3/library/asyncio-protocol.html
+
+import asyncio
+import threading
+
+class EchoProtocol(asyncio.Protocol):
+	def __init__(self, verbose=True):
+		super().__init__()
+		self.verbose = verbose
+		self.transport = None
+		self.peername = None
+
+	def connection_made(self, transport):
+		self.transport = transport
+		self.peername = transport.get_extra_info('peername')
+		if self.verbose:
+			print('[{}] {} connected.'.format(threading.get_ident(), self.peername))
+		transport.write(bytes('Hi ' + str(self.peername) + '\n', 'utf-8'))
+
+	def connection_lost(self, exc):
+		if self.verbose:
+			print('[{}] {} disconnected.'.format(threading.get_ident(), self.peername))
+		self.transport = None
+
+	def data_received(self, data):
+		if self.verbose:
+			print('[{}] {} wrote: {}'.format(threading.get_ident(), self.peername[0], data))
+
+		self.transport.write(data.upper())
+		if b'bye' == data.strip():
+			self.transport.write(bytes('Bye ' + str(self.peername) + '\n', 'utf-8'))
+			# The transport is closed after its buffered data are flushed.
+			self.transport.close()
+
+	def pause_writing(self):
+		# The write buffer is over its high-water mark.
+		self.transport.pause_reading()
+
+	def resume_writing(self):
+		self.transport.resume_reading()
+
+async def serve(host, port, verbose=True, backlog=1024):
+	loop = asyncio.get_running_loop()
+	server = await loop.create_server(lambda: EchoProtocol(verbose), host, port, reuse_address=True, backlog=backlog)
+	async with server:
+		await server.serve_forever()
+
+def run_server(host, port, verbose=True, backlog=1024):
+	try:
+		asyncio.run(serve(host, port, verbose, backlog))
+	except KeyboardInterrupt:
+		pass
+
+def main():
+	HOST, PORT = 'localhost', 9999
+	#HOST, PORT = '192.168.10.2', 6789
+
+	print('[{}] Listening on {}:{}'.format(threading.get_ident(), HOST, PORT))
+
+	# This will keep running until you interrupt the program with Ctrl-C.
+	run_server(HOST, PORT, verbose=True)
+
+	# Load test:
+	#	REF [file] >> ./tcp_load_generator.py
+
+#%%------------------------------------------------------------------
+
+if '__main__' == __name__:
+	main()
@@ -3,10 +3,12 @@
 # REF [site] >> https://docs.python.org/3.6/library/socketserver.html
 
 import socket
-import sys, time
+import sys, time, threading
 import struct
+import numpy as np
+import tcp_framing
 
-def send_msg(sock, msg):
+def send_msg(sock, msg, verbose=True):
 	#packet = struct.pack('>s', msg)
 	packet = bytes(msg, 'utf-8')
 
@@ -16,9 +18,10 @@ def send_msg(sock, msg):
 	#print('Sent: {}'.format(str))
 
 	sock.sendall(packet)
-	print('Sent: {}'.format(msg))
+	if verbose:
+		print('Sent: {}'.format(msg))
 
-def receive_msg(sock):
+def receive_msg(sock, verbose=True):
 	# Receive data from the server (and shut down).
 	#recv_data = sock.recv(1024)
 	#if len(recv_data) > 0:
@@ -28,7 +31,8 @@ def receive_msg(sock):
 	data = b''
 	packet = sock.recv(1024)
 	if not packet:
-		print('No recv data.')
+		if verbose:
+			print('No recv data.')
 		return None
 	data += packet
 
@@ -39,10 +43,94 @@ def receive_msg(sock):
 
 	#data = struct.unpack('>s', data)
 	data = str(data, 'utf-8')
-	print('Received: {}'.format(data))
+	if verbose:
+		print('Received: {}'.format(data))
 
 	return data
 
+def framed_echo_example():
+	HOST, PORT = 'localhost', 9999
+
+	# Run the server with socketserver_tcp_server.FramedEchoRequestHandler.
+	with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+		sock.connect((HOST, PORT))
+		reader = tcp_framing.FrameReader(sock)
+
+		tcp_framing.send_frame(sock, 'Hello, World!')
+		print('Received: {}'.format(reader.receive()))
+
+		image = np.random.randint(0, 256, size=(480, 640, 3), dtype=np.uint8)
+		tcp_framing.send_frame(sock, image)
+		frame_type, received = reader.receive()
+		print('Received an array: type = {}, shape = {}, dtype = {}, equal = {}.'.format(frame_type, received.shape, received.dtype, np.array_equal(image, received)))
+
+		tcp_framing.send_frame(sock, b'raw bytes')
+		frame_type, received = reader.receive()
+		print('Received: {}, {}.'.format(frame_type, bytes(received)))
+
+		tcp_framing.send_frame(sock, 'bye')
+		print('Received: {}'.format(reader.receive()))
+
+def framing_benchmark():
+	import socketserver_tcp_server
+
+	HOST, PORT = 'localhost', 9998
+	server = socketserver_tcp_server.MyThreadingTCPServer((HOST, PORT), socketserver_tcp_server.FramedEchoRequestHandler)
+	server.verbose = False
+	server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+	server_thread.start()
+
+	header = struct.Struct('!B3xIQ')  # The header of a bytes frame in tcp_framing.
+
+	def round_trip_naive(sock, reader, payload):
+		# Concatenate the header and the payload, and receive in 1024-byte chunks.
+		sock.sendall(header.pack(tcp_framing.FRAME_BYTES, 0, len(payload)) + payload)
+		chunks, num_bytes = list(), 0
+		while num_bytes < header.size + len(payload):
+			packet = sock.recv(1024)
+			if not packet:
+				raise ConnectionError('Connection closed.')
+			chunks.append(packet)
+			num_bytes += len(packet)
+		return b''.join(chunks)[header.size:]
+
+	def round_trip_framed(sock, reader, payload):
+		tcp_framing.send_frame(sock, payload)
+		return reader.receive()[1]
+
+	try:
+		for payload_size in [1024, 64 * 1024, 1024**2, 16 * 1024**2, 64 * 1024**2]:
+			payload = np.random.randint(0, 256, size=payload_size, dtype=np.uint8).tobytes()
+			num_iterations = max(256 * 1024**2 // payload_size, 1) if payload_size >= 1024**2 else 1000
+			for name, round_trip in [('naive', round_trip_naive), ('framed', round_trip_framed)]:
+				with socket.create_connection((HOST, PORT)) as sock:
+					reader = tcp_framing.FrameReader(sock)
+					assert round_trip(sock, reader, payload) == payload
+					start_time = time.perf_counter()
+					for _ in range(num_iterations):
+						round_trip(sock, reader, payload)
+					elapsed_time = time.perf_counter() - start_time
+					tcp_framing.send_frame(sock, 'bye')
+				# Both directions.
+				print('{}: payload = {} bytes, {:.1f} MB/s.'.format(name, payload_size, 2 * payload_size * num_iterations / elapsed_time / 1024**2))
+
+		# NumPy array payloads.
+		array = np.random.rand(1024, 1024, 4).astype(np.float32)  # 16 MB.
+		num_iterations = 16
+		with socket.create_connection((HOST, PORT)) as sock:
+			reader = tcp_framing.FrameReader(sock)
+			start_time = time.perf_counter()
+			for _ in range(num_iterations):
+				tcp_framing.send_frame(sock, array)
+				_, received = reader.receive()
+			elapsed_time = time.perf_counter() - start_time
+			assert np.array_equal(array, received)
+			tcp_framing.send_frame(sock, 'bye')
+		print('framed array: payload = {} bytes, {:.1f} MB/s.'.format(array.nbytes, 2 * array.nbytes * num_iterations / elapsed_time / 1024**2))
+	finally:
+		server.shutdown()
+		server.server_close()
+
 def main():
 	HOST, PORT = 'localhost', 9999
 
@@ -89,6 +177,9 @@ def main():
 			sock.close()
 			print('Close socket.')
 
+	#framed_echo_example()
+	#framing_benchmark()
+
 #%%------------------------------------------------------------------
 
 if '__main__' == __name__:
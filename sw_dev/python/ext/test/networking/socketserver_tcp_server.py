@@ -4,28 +4,37 @@
 
 import socketserver
 import threading
+import tcp_framing
 
 class EchoBaseRequestHandler(socketserver.BaseRequestHandler):
 	def setup(self):
-		print('[{}] {} connected.'.format(threading.get_ident(), self.client_address))
+		self.verbose = getattr(self.server, 'verbose', True)
+		if self.verbose:
+			print('[{}] {} connected.'.format(threading.get_ident(), self.client_address))
 		self.request.send(bytes('Hi ' + str(self.client_address) + '\n', 'utf-8'))
 
 	def finish(self):
 		self.request.send(bytes('Bye ' + str(self.client_address) + '\n', 'utf-8'))
-		print('[{}] {} disconnected.'.format(threading.get_ident(), self.client_address))
+		if self.verbose:
+			print('[{}] {} disconnected.'.format(threading.get_ident(), self.client_address))
 
 	def handle(self):
-		print('[{}] Enter EchoBaseRequestHandler.handle()'.format(threading.get_ident()))
+		if self.verbose:
+			print('[{}] Enter EchoBaseRequestHandler.handle()'.format(threading.get_ident()))
 		while True:
 			recv_data = self.request.recv(1024)
-			if len(recv_data) > 0:
+			if not recv_data:
+				# The client has closed the connection.
+				break
+			if self.verbose:
 				print('[{}] {} wrote: {}'.format(threading.get_ident(), self.client_address[0], recv_data))
 
-				#self.request.send(recv_data)
-				self.request.sendall(recv_data.upper())
-				if 'bye' == str(recv_data.strip(), 'utf-8'):
-					break
-		print('[{}] Exit EchoBaseRequestHandler.handle()'.format(threading.get_ident()))
+			#self.request.send(recv_data)
+			self.request.sendall(recv_data.upper())
+			if 'bye' == str(recv_data.strip(), 'utf-8'):
+				break
+		if self.verbose:
+			print('[{}] Exit EchoBaseRequestHandler.handle()'.format(threading.get_ident()))
 
 	def handle_old(self):
 		# self.request is the TCP socket connected to the client.
@@ -53,6 +62,28 @@ class EchoStreamRequestHandler(socketserver.StreamRequestHandler):
 		# Likewise, self.wfile is a file-like object used to write back to the client.
 		self.wfile.write(recv_data.upper())
 
+class FramedEchoRequestHandler(socketserver.BaseRequestHandler):
+	# Echoes length-prefixed frames in tcp_framing, e.g. images or tensors, instead of 1024-byte chunks.
+	# Text frames are echoed upper-cased, and a text frame of 'bye' ends the connection.
+	def handle(self):
+		verbose = getattr(self.server, 'verbose', True)
+		reader = tcp_framing.FrameReader(self.request)
+		while True:
+			frame = reader.receive()
+			if frame is None:
+				break
+			frame_type, payload = frame
+			if verbose:
+				print('[{}] {} wrote a frame of type {}, {} bytes.'.format(threading.get_ident(), self.client_address[0], frame_type, payload.nbytes if hasattr(payload, 'nbytes') else len(payload)))
+
+			if tcp_framing.FRAME_TEXT == frame_type:
+				tcp_framing.send_frame(self.request, payload.upper())
+				if 'bye' == payload.strip():
+					break
+			else:
+				# The payload is sent back from the reader's buffer without a copy.
+				tcp_framing.send_frame(self.request, payload, frame_type)
+
 class MyTCPServer(socketserver.TCPServer):
 	import socket
 
@@ -65,7 +96,18 @@ class MyTCPServer(socketserver.TCPServer):
 
 # REF [site] >> https://www.programcreek.com/python/example/73643/SocketServer.BaseRequestHandler
 class MyThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
-	pass
+	allow_reuse_address = True
+	daemon_threads = True
+	request_queue_size = 1024  # Listen backlog. The default of 5 drops bursts of connections.
+	verbose = True
+
+def run_server(host, port, verbose=True, handler_class=EchoBaseRequestHandler):
+	with MyThreadingTCPServer((host, port), handler_class) as server:
+		server.verbose = verbose
+		try:
+			server.serve_forever()
+		except KeyboardInterrupt:
+			pass
 
 def main():
 	HOST, PORT = 'localhost', 9999
@@ -76,7 +118,9 @@ def main():
 	# Create the server, binding to HOST on port PORT.
 	#with socketserver.TCPServer((HOST, PORT), EchoBaseRequestHandler) as server:
 	#with socketserver.TCPServer((HOST, PORT), EchoStreamRequestHandler) as server:
-	with socketserver.ThreadingTCPServer((HOST, PORT), EchoBaseRequestHandler) as server:
+	#with MyThreadingTCPServer((HOST, PORT), FramedEchoRequestHandler) as server:
+	#with socketserver.ThreadingTCPServer((HOST, PORT), EchoBaseRequestHandler) as server:
+	with MyThreadingTCPServer((HOST, PORT), EchoBaseRequestHandler) as server:
 		# Activate the server.
 		#	This will keep running until you interrupt the program with Ctrl-C.
 		try:
@@ -85,6 +129,11 @@ def main():
 			pass
 	server.server_close()
 
+	# asyncio variant with an event loop instead of a thread per connection:
+	#	REF [file] >> ./asyncio_tcp_server.py
+	# Load test:
+	#	REF [file] >> ./tcp_load_generator.py
+
 #%%------------------------------------------------------------------
 
 if '__main__' == __name__:
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+# Length-prefixed framing over TCP sockets.
+#	- A frame is a fixed header, an optional metadata section, and a payload.
+#		Header (network byte order): frame type (uint8), padding (3 bytes), metadata size (uint32), payload size (uint64).
+#		The metadata of an array frame: dtype string (8 bytes, e.g. b'<f4'), ndim (uint8), padding (7 bytes), shape (ndim x uint64).
+#			Its size, 16 + 8 x ndim bytes, is a multiple of 8 bytes, so that a received array, which starts right after it in the receive buffer, is 8-byte aligned.
+#	- Sending: the header, the metadata, and the payload go out in one sendmsg() call (scatter-gather), without concatenating them into a new buffer.
+#	- Receiving: FrameReader reads with recv_into() into one reusable bytearray, which only grows.
+#		A received payload is a memoryview of (or a NumPy array over) that buffer, which is overwritten by the next receive. Copy it if it has to be kept.
+
+import struct
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+FRAME_BYTES = 0
+FRAME_TEXT = 1
+FRAME_ARRAY = 2
+
+_HEADER = struct.Struct('!B3xIQ')
+# Small frames are concatenated and sent with one sendall(), which is cheaper than setting up a scatter-gather call.
+_SMALL_FRAME_SIZE = 16 * 1024
+_ARRAY_META = struct.Struct('!8sB7x')
+
+def _array_shape_struct(ndim):
+	return struct.Struct('!{}Q'.format(ndim))
+
+def _sendmsg_all(sock, buffers):
+	# sendmsg() can send only a part of the buffers, like send().
+	buffers = [memoryview(buf).cast('B') for buf in buffers if len(buf)]
+	if not hasattr(sock, 'sendmsg'):
+		# E.g. on Windows.
+		for buf in buffers:
+			sock.sendall(buf)
+		return
+	while buffers:
+		num_bytes = sock.sendmsg(buffers)
+		while buffers and num_bytes >= len(buffers[0]):
+			num_bytes -= len(buffers[0])
+			buffers.pop(0)
+		if buffers and num_bytes:
+			buffers[0] = buffers[0][num_bytes:]
+
+def send_frame(sock, payload, frame_type=None):
+	"""Sends bytes-like, str, or NumPy array payload in one frame.
+
+	The frame type is inferred from the payload if frame_type is None.
+	"""
+	meta = b''
+	if isinstance(payload, str):
+		frame_type, payload = FRAME_TEXT, payload.encode('utf-8')
+	elif np is not None and isinstance(payload, np.ndarray):
+		frame_type = FRAME_ARRAY
+		if payload.dtype.hasobject:
+			raise ValueError('Unsupported dtype: {}.'.format(payload.dtype))
+		# The original shape, since np.ascontiguousarray() makes 0-d arrays 1-d, and memoryviews of zero-size arrays cannot be cast.
+		meta = _ARRAY_META.pack(payload.dtype.str.encode('ascii'), payload.ndim) + _array_shape_struct(payload.ndim).pack(*payload.shape)
+		payload = np.ascontiguousarray(payload).reshape(-1).view(np.uint8)
+	elif frame_type is None:
+		frame_type = FRAME_BYTES
+	payload = memoryview(payload).cast('B')
+	header = _HEADER.pack(frame_type, len(meta), len(payload))
+	if len(payload) <= _SMALL_FRAME_SIZE:
+		sock.sendall(b''.join([header, meta, payload]))
+	else:
+		_sendmsg_all(sock, [header, meta, payload])
+
+class FrameReader(object):
+	"""Receives frames from a socket into one reusable buffer."""
+
+	def __init__(self, sock, initial_buffer_size=64 * 1024):
+		self.sock = sock
+		self._buffer = bytearray(initial_buffer_size)
+		self._view = memoryview(self._buffer)
+
+	def _receive_into(self, offset, size):
+		# Fills self._buffer[offset:offset + size]. Returns False on EOF before any byte is read.
+		end = offset + size
+		while offset < end:
+			num_bytes = self.sock.recv_into(self._view[offset:end])
+			if not num_bytes:
+				if offset == end - size:
+					return False
+				raise ConnectionError('Connection closed in the middle of a frame.')
+			offset += num_bytes
+		return True
+
+	def _reserve(self, size):
+		if size > len(self._buffer):
+			# A new buffer, since the old one can still be referenced by the last payload.
+			self._buffer = bytearray(max(size, 2 * len(self._buffer)))
+			self._view = memoryview(self._buffer)
+
+	def receive(self):
+		"""Receives a frame.
+
+		Returns (frame type, payload), or None if the connection has been closed.
+		The payload is a memoryview for a bytes frame, a str for a text frame, and a read-only NumPy array for an array frame.
+		Memoryviews and arrays refer to the internal buffer, so they are only valid until the next receive().
+		"""
+		if not self._receive_into(0, _HEADER.size):
+			return None
+		frame_type, meta_size, payload_size = _HEADER.unpack_from(self._buffer, 0)
+		self._reserve(meta_size + payload_size)
+		if not self._receive_into(0, meta_size + payload_size):
+			raise ConnectionError('Connection closed in the middle of a frame.')
+		payload = self._view[meta_size:meta_size + payload_size]
+
+		if FRAME_TEXT == frame_type:
+			return frame_type, str(payload, 'utf-8')
+		elif FRAME_ARRAY == frame_type:
+			if np is None:
+				raise ImportError('NumPy is required for array frames.')
+			dtype_str, ndim = _ARRAY_META.unpack_from(self._buffer, 0)
+			shape = _array_shape_struct(ndim).unpack_from(self._buffer, _ARRAY_META.size)
+			array = np.frombuffer(payload, dtype=np.dtype(dtype_str.rstrip(b'\x00').decode('ascii'))).reshape(shape)
+			array.flags.writeable = False
+			return frame_type, array
+		return frame_type, payload
+
+def receive_frame(sock):
+	"""Receives a frame into a new buffer. Prefer FrameReader for a stream of frames."""
+	frame = FrameReader(sock, initial_buffer_size=_HEADER.size).receive()
+	if frame is None:
+		return None
+	frame_type, payload = frame
+	if isinstance(payload, memoryview):
+		payload = bytes(payload)
+	elif FRAME_ARRAY == frame_type:
+		payload = payload.copy()
+	return frame_type, payload
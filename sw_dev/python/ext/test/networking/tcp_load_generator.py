@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+# Load generator for the echo servers in socketserver_tcp_server.py and asyncio_tcp_server.py.
+#	- Each client is a thread which talks the echo protocol with send_msg() and receive_msg() in socketserver_tcp_client.py.
+#	- All the clients hold their connections open at the same time, so that the server serves num_connections concurrent connections.
+#	- Reports connections/sec until all the connections are greeted, the server's resident memory per connection, and echo round trips/sec.
+#	- The server runs in a child process, so that its memory is measured apart from the clients.
+# NOTE [info] >> Thousands of connections need as many file descriptors in both processes, e.g. 'ulimit -n 65536'.
+
+import sys, time, threading, socket, multiprocessing
+import socketserver_tcp_client
+import socketserver_tcp_server
+import asyncio_tcp_server
+
+def raise_fd_limit():
+	try:
+		import resource
+		soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+		if soft < hard:
+			resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+		return hard
+	except (ImportError, ValueError, OSError):
+		return None
+
+def get_rss(pid):
+	# Resident set size in bytes. Only on Linux.
+	try:
+		with open('/proc/{}/status'.format(pid)) as fd:
+			for line in fd:
+				if line.startswith('VmRSS:'):
+					return int(line.split()[1]) * 1024
+	except OSError:
+		pass
+	return None
+
+def _run_server(server_type, host, port):
+	raise_fd_limit()
+	if 'threading' == server_type:
+		socketserver_tcp_server.run_server(host, port, verbose=False)
+	elif 'asyncio' == server_type:
+		asyncio_tcp_server.run_server(host, port, verbose=False)
+	else:
+		raise ValueError('Invalid server type: {}.'.format(server_type))
+
+def _wait_for_server(host, port, timeout=10):
+	start_time = time.perf_counter()
+	while time.perf_counter() - start_time < timeout:
+		try:
+			with socket.create_connection((host, port), timeout=1) as sock:
+				socketserver_tcp_client.receive_msg(sock, verbose=False)
+				socketserver_tcp_client.send_msg(sock, 'bye', verbose=False)
+				while socketserver_tcp_client.receive_msg(sock, verbose=False) is not None:
+					pass
+			return
+		except OSError:
+			time.sleep(0.1)
+	raise TimeoutError('Server not ready: {}:{}.'.format(host, port))
+
+def run_clients(host, port, num_connections, num_messages, on_connected=None):
+	"""Opens num_connections concurrent connections and exchanges num_messages echo messages on each.
+
+	on_connected() is called once all the connections are open and greeted, before any message is sent.
+	Returns (#connections opened, connecting time, #round trips, round-trip time).
+	"""
+	connected_barrier = threading.Barrier(num_connections + 1)
+	start_event = threading.Event()
+	lock = threading.Lock()
+	counts = {'connections': 0, 'round_trips': 0, 'errors': 0}
+
+	def client():
+		sock = None
+		try:
+			try:
+				sock = socket.create_connection((host, port), timeout=60)
+				socketserver_tcp_client.receive_msg(sock, verbose=False)  # Greeting.
+				with lock:
+					counts['connections'] += 1
+			finally:
+				# Also wait on a failure, so that the barrier is not broken.
+				connected_barrier.wait()
+			start_event.wait()
+
+			num_round_trips = 0
+			for idx in range(num_messages):
+				socketserver_tcp_client.send_msg(sock, 'message-{}'.format(idx), verbose=False)
+				if socketserver_tcp_client.receive_msg(sock, verbose=False) is None:
+					break
+				num_round_trips += 1
+			socketserver_tcp_client.send_msg(sock, 'bye', verbose=False)
+			# Read until the server closes the connection.
+			while socketserver_tcp_client.receive_msg(sock, verbose=False) is not None:
+				pass
+			with lock:
+				counts['round_trips'] += num_round_trips
+		except (OSError, threading.BrokenBarrierError):
+			with lock:
+				counts['errors'] += 1
+		finally:
+			if sock is not None:
+				sock.close()
+
+	# Small stacks, for thousands of client threads.
+	old_stack_size = threading.stack_size(256 * 1024)
+	try:
+		threads = [threading.Thread(target=client, daemon=True) for _ in range(num_connections)]
+	finally:
+		threading.stack_size(old_stack_size)
+
+	start_time = time.perf_counter()
+	for thread in threads:
+		thread.start()
+	connected_barrier.wait()
+	connecting_time = time.perf_counter() - start_time
+
+	if on_connected:
+		on_connected()
+
+	start_time = time.perf_counter()
+	start_event.set()
+	for thread in threads:
+		thread.join()
+	round_trip_time = time.perf_counter() - start_time
+
+	if counts['errors']:
+		print('\t{} client errors.'.format(counts['errors']), file=sys.stderr)
+	return counts['connections'], connecting_time, counts['round_trips'], round_trip_time
+
+def benchmark(server_type, num_connections, num_messages=10, host='localhost', port=9999):
+	# A spawned process, which does not inherit the memory of the client threads.
+	server = multiprocessing.get_context('spawn').Process(target=_run_server, args=(server_type, host, port), daemon=True)
+	server.start()
+	try:
+		_wait_for_server(host, port)
+		time.sleep(0.5)  # Let the server threads of the readiness check finish.
+		base_rss = get_rss(server.pid)
+
+		peak_rss = list()
+		num_opened, connecting_time, num_round_trips, round_trip_time = run_clients(host, port, num_connections, num_messages, on_connected=lambda: peak_rss.append(get_rss(server.pid)))
+
+		print('{} server, {} connections:'.format(server_type, num_connections))
+		print('\t{} connections opened: {:.0f} connections/sec.'.format(num_opened, num_opened / connecting_time))
+		if base_rss is not None and peak_rss[0] is not None and num_opened:
+			print('\tServer RSS: {:.1f} MB -> {:.1f} MB, {:.1f} KB/connection.'.format(base_rss / 1024**2, peak_rss[0] / 1024**2, (peak_rss[0] - base_rss) / num_opened / 1024))
+		print('\t{} round trips: {:.0f} round trips/sec.'.format(num_round_trips, num_round_trips / round_trip_time))
+	finally:
+		server.terminate()
+		server.join()
+
+def main():
+	max_fds = raise_fd_limit()
+	print('Max #file descriptors = {}.'.format(max_fds))
+
+	for num_connections in [100, 1000, 4000]:
+		for server_type in ['threading', 'asyncio']:
+			benchmark(server_type, num_connections, num_messages=10)
+
+#%%------------------------------------------------------------------
+
+if '__main__' == __name__:
+	main()
@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 
+import os, time
 import json
+import jsonl_util
 
 def json_test():
 	# File.
@@ -92,9 +94,74 @@ def json_lines_test():
 	except FileNotFoundError as ex:
 		print(f'File not found, {filepath}: {ex}.')
 
+	#--------------------
+	# Streaming.
+	filepath = './stream.jsonl'
+	with jsonl_util.JsonlWriter(filepath, batch_size=2) as writer:
+		writer.write_many(raw_data)
+
+	print(list(jsonl_util.iterate_jsonl(filepath)))
+	print(list(jsonl_util.iterate_jsonl(filepath, use_mmap=True)))
+	print(list(jsonl_util.iterate_jsonl_parallel(filepath, num_workers=2, range_size=64)))
+
+	# Random access by the byte-offset index.
+	with jsonl_util.JsonlFile(filepath) as jsonl_file:
+		print(f'#records = {len(jsonl_file)}, record 2 = {jsonl_file[2]}, last record = {jsonl_file[-1]}.')
+
+def json_lines_benchmark():
+	filepath = './benchmark.jsonl'
+	index_filepath = './benchmark.jsonl.idx.npy'
+	num_records = 1000000
+
+	def generate_records(num_records):
+		for idx in range(num_records):
+			yield {'id': idx, 'image': f'images/{idx:08d}.jpg', 'boxes': [[idx % 100, idx % 50, idx % 100 + 20, idx % 50 + 40]], 'labels': ['사람', 'car'], 'score': 0.5}
+
+	start_time = time.perf_counter()
+	with jsonl_util.JsonlWriter(filepath, batch_size=10000) as writer:
+		writer.write_many(generate_records(num_records))
+	print(f'JsonlWriter: {num_records / (time.perf_counter() - start_time):.0f} records/sec, {os.path.getsize(filepath) / 1024**2:.1f} MB.')
+
+	def read_all_lines():
+		with open(filepath, encoding='utf-8') as fd:
+			jsonl_lines = fd.readlines()
+		return (json.loads(line) for line in jsonl_lines)
+
+	readers = [
+		('readlines', read_all_lines),
+		('chunked', lambda: jsonl_util.iterate_jsonl(filepath)),
+		('mmap', lambda: jsonl_util.iterate_jsonl(filepath, use_mmap=True)),
+		('parallel', lambda: jsonl_util.iterate_jsonl_parallel(filepath, num_workers=os.cpu_count())),
+	]
+	for name, reader in readers:
+		start_time = time.perf_counter()
+		num_read = sum(1 for _ in reader())
+		assert num_read == num_records
+		print(f'{name}: {num_records / (time.perf_counter() - start_time):.0f} records/sec.')
+
+	for path in [index_filepath]:
+		if os.path.exists(path):
+			os.remove(path)
+	start_time = time.perf_counter()
+	with jsonl_util.JsonlFile(filepath, index_filepath=index_filepath) as jsonl_file:
+		print(f'Index built: {time.perf_counter() - start_time:.3f} secs.')
+	start_time = time.perf_counter()
+	with jsonl_util.JsonlFile(filepath, index_filepath=index_filepath) as jsonl_file:
+		print(f'Index loaded: {time.perf_counter() - start_time:.3f} secs.')
+		import random
+		indices = random.sample(range(num_records), 100000)
+		start_time = time.perf_counter()
+		for idx in indices:
+			assert jsonl_file[idx]['id'] == idx
+		print(f'Random access: {len(indices) / (time.perf_counter() - start_time):.0f} records/sec.')
+
+	os.remove(filepath)
+	os.remove(index_filepath)
+
 def main():
 	#json_test()
 	json_lines_test()
+	#json_lines_benchmark()
 
 #--------------------------------------------------------------------
 
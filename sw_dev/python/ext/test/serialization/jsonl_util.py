@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Streaming JSON Lines (JSONL) I/O.
+#	- Readers are generators over fixed-size chunks or a memory map of the file, so only a chunk of lines is held in memory at a time.
+#	- JsonlWriter encodes records in batches and writes them through a large write buffer.
+#	- iterate_jsonl_parallel() splits the file into newline-aligned byte ranges, and decodes them in a process pool.
+#		At most a few ranges per worker are in flight, so memory stays bounded even when the consumer is slower than the workers.
+#	- JsonlFile keeps a byte-offset index of the lines, so record i is read in O(1) without scanning the file.
+#		The index can be saved to and loaded from a .npy file.
+# REF [site] >> https://jsonlines.org/
+
+import os, mmap, json, collections
+import concurrent.futures
+import numpy as np
+
+def _iterate_decoded_records(chunk):
+	# A chunk of whole lines is decoded to str at once, which is much cheaper than passing each line as bytes to json.loads().
+	# Records are decoded lazily, so that a chunk of records does not stay alive, which would make the cyclic GC traverse all of them.
+	for line in chunk.decode('utf-8').split('\n'):
+		# Empty or blank lines are skipped.
+		if line and not line.isspace():
+			yield json.loads(line)
+
+def _iterate_chunks(read, chunk_size):
+	# Yields chunks of whole lines from read(chunk_size).
+	remainder = b''
+	while True:
+		chunk = read(chunk_size)
+		if not chunk:
+			break
+		last_newline = chunk.rfind(b'\n')
+		if last_newline < 0:
+			# A line longer than a chunk.
+			remainder += chunk
+			continue
+		yield remainder + chunk[:last_newline] if remainder else chunk[:last_newline]
+		remainder = chunk[last_newline + 1:]
+	if remainder:
+		yield remainder
+
+def iterate_jsonl(filepath, chunk_size=16 * 1024**2, use_mmap=False):
+	"""Yields the records of a JSONL file one by one.
+
+	The file is read in chunks of about chunk_size bytes, either by read() or by slicing a memory map if use_mmap is True.
+	"""
+	with open(filepath, 'rb') as fd:
+		if use_mmap:
+			if os.fstat(fd.fileno()).st_size == 0:
+				return
+			with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+				if hasattr(mmap, 'MADV_SEQUENTIAL'):
+					mm.madvise(mmap.MADV_SEQUENTIAL)
+				for chunk in _iterate_chunks(mm.read, chunk_size):
+					yield from _iterate_decoded_records(chunk)
+		else:
+			for chunk in _iterate_chunks(fd.read, chunk_size):
+				yield from _iterate_decoded_records(chunk)
+
+class JsonlWriter(object):
+	"""Batched JSONL writer.
+
+	Records are encoded into a batch, and every batch_size records the batch is joined and written at once through a buffer of buffer_size bytes.
+	"""
+
+	def __init__(self, filepath, append=False, batch_size=1000, buffer_size=16 * 1024**2, ensure_ascii=False):
+		self.fd = open(filepath, 'ab' if append else 'wb', buffering=buffer_size)
+		self.batch_size = batch_size
+		self.num_records = 0
+		self._encoder = json.JSONEncoder(ensure_ascii=ensure_ascii, separators=(',', ':'))
+		self._batch = list()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def write(self, record):
+		self._batch.append(self._encoder.encode(record))
+		if len(self._batch) >= self.batch_size:
+			self.flush()
+
+	def write_many(self, records):
+		for record in records:
+			self.write(record)
+
+	def flush(self):
+		if self._batch:
+			self._batch.append('')  # For the last newline.
+			self.fd.write('\n'.join(self._batch).encode('utf-8'))
+			self.num_records += len(self._batch) - 1
+			self._batch = list()
+
+	def close(self):
+		if self.fd is not None:
+			try:
+				self.flush()
+			finally:
+				self.fd.close()
+				self.fd = None
+
+def get_newline_aligned_ranges(filepath, range_size=16 * 1024**2):
+	"""Splits a file into byte ranges [start, end) of about range_size bytes, each of which ends right after a newline or at the end of the file."""
+	file_size = os.path.getsize(filepath)
+	ranges = list()
+	with open(filepath, 'rb') as fd:
+		start = 0
+		while start < file_size:
+			end = start + range_size
+			if end < file_size:
+				fd.seek(end)
+				fd.readline()  # Move to the start of the next line.
+				end = fd.tell()
+			end = min(end, file_size)
+			ranges.append((start, end))
+			start = end
+	return ranges
+
+def _decode_range(filepath, start, end):
+	with open(filepath, 'rb') as fd:
+		fd.seek(start)
+		return list(_iterate_decoded_records(fd.read(end - start)))
+
+def iterate_jsonl_parallel(filepath, num_workers=None, range_size=16 * 1024**2, max_pending_ranges_per_worker=2):
+	"""Yields the records of a JSONL file in order, decoding newline-aligned byte ranges in a process pool.
+
+	Each worker reads its byte range from the file by itself, so only the decoded records are sent back.
+	"""
+	ranges = get_newline_aligned_ranges(filepath, range_size)
+	num_workers = num_workers or os.cpu_count()
+	max_pending_ranges = max(num_workers * max_pending_ranges_per_worker, 1)
+	with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+		pending = collections.deque()
+		for start, end in ranges:
+			if len(pending) >= max_pending_ranges:
+				yield from pending.popleft().result()
+			pending.append(executor.submit(_decode_range, filepath, start, end))
+		while pending:
+			yield from pending.popleft().result()
+
+def build_jsonl_index(filepath, chunk_size=16 * 1024**2):
+	"""Scans a JSONL file once, and returns the (start, end) byte offsets of its non-empty lines as an (N, 2) int64 array."""
+	newlines = list()
+	with open(filepath, 'rb') as fd:
+		offset = 0
+		while True:
+			chunk = fd.read(chunk_size)
+			if not chunk:
+				break
+			newlines.append(np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == ord('\n')) + offset)
+			offset += len(chunk)
+	newlines = np.concatenate(newlines) if newlines else np.zeros((0,), dtype=np.int64)
+	starts = np.concatenate([[0], newlines + 1]).astype(np.int64)
+	ends = np.concatenate([newlines, [offset]]).astype(np.int64)
+	is_nonempty = ends > starts
+	return np.stack([starts[is_nonempty], ends[is_nonempty]], axis=1)
+
+class JsonlFile(object):
+	"""Random access to the records of a JSONL file through a byte-offset index and a memory map.
+
+	If index_filepath is given, the index is loaded from it, or built and saved to it if it does not exist.
+	Blank lines which consist of whitespace only are not supported.
+	"""
+
+	def __init__(self, filepath, index_filepath=None):
+		self.filepath = filepath
+		if index_filepath and os.path.exists(index_filepath):
+			self.index = np.load(index_filepath)
+		else:
+			self.index = build_jsonl_index(filepath)
+			if index_filepath:
+				np.save(index_filepath, self.index)
+
+		self._fd = open(filepath, 'rb')
+		self._mm = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ) if len(self.index) else None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def __len__(self):
+		return len(self.index)
+
+	def __getitem__(self, idx):
+		start, end = self.index[idx]
+		return json.loads(self._mm[start:end])
+
+	def close(self):
+		if self._mm is not None:
+			self._mm.close()
+			self._mm = None
+		if self._fd is not None:
+			self._fd.close()
+			self._fd = None
@@ -26,8 +26,12 @@ class EncoderDecoder(torch.nn.Module):
 	def encode(self, src, src_mask):
 		return self.encoder(self.src_embed(src), src_mask)
 
-	def decode(self, memory, src_mask, tgt, tgt_mask):
-		return self.decoder(self.tgt_embed(tgt), memory, src_mask, tgt_mask)
+	def decode(self, memory, src_mask, tgt, tgt_mask, cache=None):
+		"If cache is given, only the positions of tgt which are not in the cache are decoded (see Decoder)."
+		x = self.tgt_embed(tgt)
+		if cache is not None:
+			x = x[:, get_cached_length(cache):]
+		return self.decoder(x, memory, src_mask, tgt_mask, cache)
 
 class EncoderDecoderWithoutEmbedding(torch.nn.Module):
 	"""
@@ -48,8 +52,11 @@ class EncoderDecoderWithoutEmbedding(torch.nn.Module):
 	def encode(self, src, src_mask):
 		return self.encoder(src, src_mask)
 
-	def decode(self, memory, src_mask, tgt, tgt_mask):
-		return self.decoder(tgt, memory, src_mask, tgt_mask)
+	def decode(self, memory, src_mask, tgt, tgt_mask, cache=None):
+		"If cache is given, only the positions of tgt which are not in the cache are decoded (see Decoder)."
+		if cache is not None:
+			tgt = tgt[:, get_cached_length(cache):]
+		return self.decoder(tgt, memory, src_mask, tgt_mask, cache)
 
 class Generator(torch.nn.Module):
 	"Define standard linear + softmax generation step."
@@ -131,9 +138,16 @@ class Decoder(torch.nn.Module):
 		self.layers = clones(layer, N)
 		self.norm = LayerNorm(layer.size)
 
-	def forward(self, x, memory, src_mask, tgt_mask):
-		for layer in self.layers:
-			x = layer(x, memory, src_mask, tgt_mask)
+	def forward(self, x, memory, src_mask, tgt_mask, cache=None):
+		"""
+		For incremental decoding, cache is a list which keeps the keys and values of the attentions of the layers across calls.
+		It is filled in the first call, where it has to be empty, and x is then only the positions which follow the cached ones.
+		tgt_mask is [batch_size, x_seq_len, cached_len + x_seq_len], or None to attend to all the cached positions.
+		"""
+		if cache is not None and not cache:
+			cache.extend(dict() for _ in self.layers)
+		for idx, layer in enumerate(self.layers):
+			x = layer(x, memory, src_mask, tgt_mask, None if cache is None else cache[idx])
 		return self.norm(x)
 
 class DecoderLayer(torch.nn.Module):
@@ -147,13 +161,31 @@ class DecoderLayer(torch.nn.Module):
 		self.feed_forward = feed_forward
 		self.sublayer = clones(SublayerConnection(size, dropout), 3)
 
-	def forward(self, x, memory, src_mask, tgt_mask):
+	def forward(self, x, memory, src_mask, tgt_mask, cache=None):
 		"Follow Figure 1 (right) for connections."
 		m = memory
-		x = self.sublayer[0](x, lambda x: self.self_attn(x, x, x, tgt_mask))  # tgt_mask: [batch_size, 1, seq_len - 1, seq_len - 1]
-		x = self.sublayer[1](x, lambda x: self.src_attn(x, m, m, src_mask))  # src_mask: [batch_size, 1, 1, seq_len]
+		self_attn_cache = None if cache is None else cache.setdefault("self_attn", dict())
+		src_attn_cache = None if cache is None else cache.setdefault("src_attn", dict())
+		x = self.sublayer[0](x, lambda x: self.self_attn(x, x, x, tgt_mask, cache=self_attn_cache))  # tgt_mask: [batch_size, 1, seq_len - 1, seq_len - 1]
+		# The keys and values of the memory do not change across steps.
+		x = self.sublayer[1](x, lambda x: self.src_attn(x, m, m, src_mask, cache=src_attn_cache, static_kv=True))  # src_mask: [batch_size, 1, 1, seq_len]
 		return self.sublayer[2](x, self.feed_forward)
 
+def get_cached_length(cache):
+	"The number of target positions whose keys and values are in a decoder cache."
+	if not cache or "key" not in cache[0].get("self_attn", dict()):
+		return 0
+	return cache[0]["self_attn"]["key"].size(2)
+
+def reorder_decoder_cache(cache, indices, attn_names=("self_attn", "src_attn")):
+	"Select (or reorder) the batch entries of a decoder cache in place, e.g. when beams are reordered or finished sequences are dropped."
+	for layer_cache in cache:
+		for name in attn_names:
+			attn_cache = layer_cache.get(name, dict())
+			for k in ("key", "value"):
+				if k in attn_cache:
+					attn_cache[k] = attn_cache[k].index_select(0, indices)
+
 def subsequent_mask(size):
 	"Mask out subsequent positions."
 	attn_shape = (1, size, size)
@@ -186,18 +218,38 @@ class MultiHeadedAttention(torch.nn.Module):
 		self.attn = None
 		self.dropout = torch.nn.Dropout(p=dropout)
 
-	def forward(self, query, key, value, mask=None):
-		"Implements Figure 2"
+	def forward(self, query, key, value, mask=None, cache=None, static_kv=False):
+		"""
+		Implements Figure 2
+
+		cache is a dict which keeps the projected keys and values across calls for incremental decoding.
+		If static_kv is True, key and value are the same in all the calls, e.g. the memory of the encoder, so they are projected only in the first call.
+		Otherwise, the projections of key and value are appended to the cached ones.
+		"""
 		if mask is not None:
 			# Same mask applied to all h heads.
 			mask = mask.unsqueeze(1)
 		nbatches = query.size(0)
 
 		# 1) Do all the linear projections in batch from d_model => h x d_k
-		query, key, value = [
-			lin(x).view(nbatches, -1, self.h, self.d_k).transpose(1, 2)
-			for lin, x in zip(self.linears, (query, key, value))
-		]
+		if cache is None:
+			query, key, value = [
+				lin(x).view(nbatches, -1, self.h, self.d_k).transpose(1, 2)
+				for lin, x in zip(self.linears, (query, key, value))
+			]
+		else:
+			query = self.linears[0](query).view(nbatches, -1, self.h, self.d_k).transpose(1, 2)
+			if static_kv and "key" in cache:
+				key, value = cache["key"], cache["value"]
+			else:
+				key, value = [
+					lin(x).view(nbatches, -1, self.h, self.d_k).transpose(1, 2)
+					for lin, x in zip(self.linears[1:3], (key, value))
+				]
+				if not static_kv and "key" in cache:
+					key = torch.cat([cache["key"], key], dim=2)
+					value = torch.cat([cache["value"], value], dim=2)
+				cache["key"], cache["value"] = key, value
 
 		# 2) Apply attention on all the projected vectors in batch.
 		x, self.attn = attention(
@@ -429,3 +481,73 @@ def greedy_decode(model, src, src_mask, max_len, start_symbol):
 			[ys, torch.zeros(1, 1).type_as(src.data).fill_(next_word)], dim=1
 		)
 	return ys
+
+def greedy_decode_incrementally(model, src, src_mask, max_len, start_symbol, end_symbol=None, pad_symbol=2):
+	"""
+	Batched greedy decoding with cached keys and values, which decodes only the last token at each step.
+	src: [batch_size, src_seq_len], src_mask: [batch_size, 1, src_seq_len], which masks out the padding of src, e.g. Batch.src_mask.
+	A sequence stops at end_symbol, and is dropped from the batch. It is padded by pad_symbol afterwards.
+	Returns [batch_size, <= max_len].
+	"""
+	with torch.no_grad():
+		batch_size = src.size(0)
+		memory = model.encode(src, src_mask)
+		ys = torch.full((batch_size, max_len), pad_symbol, dtype=src.dtype, device=src.device)
+		ys[:, 0] = start_symbol
+		active = torch.arange(batch_size, device=src.device)  # Indices of the running sequences.
+		cache = list()
+		for i in range(1, max_len):
+			out = model.decode(memory, src_mask, ys[active, :i], None, cache)
+			next_words = model.generator(out[:, -1]).argmax(dim=-1)
+			ys[active, i] = next_words
+			if end_symbol is not None:
+				is_running = next_words != end_symbol
+				if not is_running.any():
+					return ys[:, :i + 1]
+				if not is_running.all():
+					running = is_running.nonzero().squeeze(1)
+					active, memory, src_mask = active[running], memory[running], src_mask[running]
+					reorder_decoder_cache(cache, running)
+		return ys
+
+def beam_search_decode(model, src, src_mask, max_len, start_symbol, end_symbol, beam_size=4, pad_symbol=2, length_penalty=0.0):
+	"""
+	Batched beam search with cached keys and values.
+	A finished hypothesis stays in its beam, extended by pad_symbol with no change in its score, and decoding stops when all the hypotheses are finished.
+	Hypotheses are ranked by (sum of log probabilities) / length**length_penalty, where length includes end_symbol but not start_symbol.
+	Returns the best sequences, [batch_size, <= max_len], and their scores, [batch_size].
+	"""
+	with torch.no_grad():
+		batch_size, device = src.size(0), src.device
+		memory = model.encode(src, src_mask).repeat_interleave(beam_size, dim=0)  # [batch_size * beam_size, src_seq_len, d_model]
+		src_mask = src_mask.repeat_interleave(beam_size, dim=0)
+		ys = torch.full((batch_size * beam_size, 1), start_symbol, dtype=src.dtype, device=device)
+		# All the beams but the first start with -inf, so that the first step does not select the same token in every beam.
+		scores = torch.full((batch_size, beam_size), float("-inf"), device=device)
+		scores[:, 0] = 0
+		lengths = torch.zeros(batch_size * beam_size, dtype=torch.long, device=device)
+		is_finished = torch.zeros(batch_size * beam_size, dtype=torch.bool, device=device)
+		beam_offsets = torch.arange(batch_size, device=device).unsqueeze(1) * beam_size
+		cache = list()
+		for _ in range(max_len - 1):
+			out = model.decode(memory, src_mask, ys, None, cache)
+			log_probs = model.generator(out[:, -1])  # [batch_size * beam_size, tgt_vocab]
+			vocab_size = log_probs.size(-1)
+			log_probs[is_finished] = float("-inf")
+			log_probs[is_finished, pad_symbol] = 0
+
+			scores, indices = (scores.view(-1, 1) + log_probs).view(batch_size, -1).topk(beam_size, dim=-1)
+			beam_indices = (indices // vocab_size + beam_offsets).view(-1)
+			next_words = (indices % vocab_size).view(-1).to(ys.dtype)
+			ys = torch.cat([ys[beam_indices], next_words.unsqueeze(1)], dim=1)
+			lengths = lengths[beam_indices] + (~is_finished[beam_indices]).long()
+			is_finished = is_finished[beam_indices] | (next_words == end_symbol)
+			# The keys and values of the memory are the same for all the beams of a sequence.
+			reorder_decoder_cache(cache, beam_indices, attn_names=("self_attn",))
+			if is_finished.all():
+				break
+
+		normalized_scores = scores / lengths.view(batch_size, beam_size).clamp(min=1).float()**length_penalty
+		best = normalized_scores.argmax(dim=-1)
+		batch_indices = torch.arange(batch_size, device=device)
+		return ys.view(batch_size, beam_size, -1)[batch_indices, best], scores[batch_indices, best]
@@ -478,6 +478,41 @@ def inference_test():
 
 	print("Example Untrained Model Prediction:", ys)
 
+def incremental_decoding_benchmark():
+	import time
+
+	torch.manual_seed(0)
+	V = 1000
+	batch_size, src_seq_len, max_len = 32, 32, 64
+	pad, start_symbol = 2, 1
+	model = harvard_nlp_transformer.make_model(V, V, d_model=256, d_ff=1024, n_head=8, n_enc_layers=3, n_dec_layers=3)
+	model.eval()
+
+	# Sources of different lengths, padded.
+	srcs = torch.randint(3, V, (batch_size, src_seq_len))
+	src_lens = torch.randint(src_seq_len // 2, src_seq_len + 1, (batch_size,))
+	srcs[torch.arange(src_seq_len).unsqueeze(0) >= src_lens.unsqueeze(1)] = pad
+	src_mask = harvard_nlp_transformer.Batch(srcs, pad=pad).src_mask  # [batch_size, 1, src_seq_len]
+
+	# No end symbol (-1 for beam search, which is never generated), so that all the decoders generate max_len - 1 tokens per sequence.
+	num_tokens = batch_size * (max_len - 1)
+	with torch.no_grad():
+		start_time = time.time()
+		ys_ref = [harvard_nlp_transformer.greedy_decode(model, srcs[i:i + 1, :src_lens[i]], src_mask[i:i + 1, :, :src_lens[i]], max_len, start_symbol) for i in range(batch_size)]
+		elapsed_time = time.time() - start_time
+	print(f"greedy_decode() per sequence: {num_tokens / elapsed_time:.1f} tokens/sec.")
+
+	start_time = time.time()
+	ys = harvard_nlp_transformer.greedy_decode_incrementally(model, srcs, src_mask, max_len, start_symbol, pad_symbol=pad)
+	elapsed_time = time.time() - start_time
+	print(f"greedy_decode_incrementally(): {num_tokens / elapsed_time:.1f} tokens/sec, same as greedy_decode() = {torch.equal(torch.cat(ys_ref, dim=0), ys)}.")
+
+	for beam_size in [4]:
+		start_time = time.time()
+		ys, scores = harvard_nlp_transformer.beam_search_decode(model, srcs, src_mask, max_len, start_symbol, end_symbol=-1, beam_size=beam_size, pad_symbol=pad)
+		elapsed_time = time.time() - start_time
+		print(f"beam_search_decode(), beam size = {beam_size}: {num_tokens / elapsed_time:.1f} tokens/sec ({num_tokens * beam_size / elapsed_time:.1f} hypothesis tokens/sec).")
+
 def main():
 	# Harvard NLP transformer:
 	#	https://nlp.seas.harvard.edu/annotated-transformer/
@@ -501,6 +536,9 @@ def main():
 	train_test()
 	inference_test()
 
+	# Incremental decoding with cached keys and values.
+	#incremental_decoding_benchmark()
+
 #--------------------------------------------------------------------
 
 if "__main__" == __name__:
@@ -264,6 +264,66 @@ def correct_text2():
 				#print('spell.candidates({}) = {}.'.format(msw, spell.candidates(msw)))
 			print('End correcting a word: {} secs.'.format(time.time() - start_time))
 
+def cached_correction_example():
+	import os
+	import pyspellchecker_util
+
+	korean_dictionary_filepath = './my_korean_dictionary.json'
+	compiled_dictionary_filepath = './my_korean_dictionary.pkl'
+	text_filepath = './Sample-0_0.txt'
+
+	#--------------------
+	if not os.path.exists(compiled_dictionary_filepath):
+		print('Start compiling dictionary...')
+		start_time = time.time()
+		pyspellchecker_util.compile_dictionary(compiled_dictionary_filepath, dictionary_filepaths=[korean_dictionary_filepath], language='en')
+		print('End compiling dictionary: {} secs.'.format(time.time() - start_time))
+
+	print('Start loading dictionary...')
+	start_time = time.time()
+	spell = pyspellchecker_util.load_spell_checker(compiled_dictionary_filepath, distance=1)
+	print('End loading dictionary: {} secs.'.format(time.time() - start_time))
+
+	#--------------------
+	try:
+		with open(text_filepath, 'r', encoding='UTF-8') as fd:
+			data = fd.read()
+	except FileNotFoundError as ex:
+		print('File not found: {}.'.format(text_filepath))
+		return
+	except UnicodeDecodeError as ex:
+		print('Unicode decode error: {}.'.format(text_filepath))
+		return
+
+	#--------------------
+	# Per-token correction, as in correct_text2().
+	print('Start correcting words one by one...')
+	start_time = time.time()
+	for word in data.split():
+		for msw in spell.unknown([word]):
+			spell.correction(msw)
+	print('End correcting words one by one: {} secs.'.format(time.time() - start_time))
+
+	corrector = pyspellchecker_util.SpellingCorrector(spell, cache_size=2**16)
+	for trial in range(2):
+		print('Start correcting a document in a batch...')
+		start_time = time.time()
+		misspellings = corrector.find_misspellings(data)
+		print('End correcting a document in a batch: {} secs.'.format(time.time() - start_time))
+		print('Cache info: {}.'.format(corrector.cache_info()))
+	print('Misspellings = {}.'.format(misspellings))
+	print('Corrected text = {}.'.format(corrector.correct_text(data)[:200]))
+
+	#--------------------
+	# Corpus-scale correction in a process pool.
+	documents = data.splitlines() * 100
+
+	print('Start correcting a corpus...')
+	start_time = time.time()
+	corrected_documents = list(pyspellchecker_util.correct_corpus(documents, compiled_dictionary_filepath, distance=1, num_workers=4, batch_size=64))
+	print('End correcting a corpus: {} secs.'.format(time.time() - start_time))
+	print('#documents = {}.'.format(len(corrected_documents)))
+
 def main():
 	#simple_example()
 
@@ -273,6 +333,10 @@ def main():
 	#correct_text()
 	correct_text2()
 
+	# Cached, batched correction with a compiled dictionary.
+	#	REF [file] >> ./pyspellchecker_util.py
+	#cached_correction_example()
+
 #--------------------------------------------------------------------
 
 if '__main__' == __name__:
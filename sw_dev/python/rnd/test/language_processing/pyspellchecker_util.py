@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Cached, batched spelling correction over pyspellchecker.
+#	- A word frequency dictionary is compiled once into a pickle of the frequency table and its statistics.
+#		Loading it skips JSON parsing and the recomputation of the letters and the longest word length, so it takes milliseconds instead of seconds.
+#	- SpellingCorrector keeps an LRU cache of corrections keyed by token, since candidate generation by edit distance dominates the runtime.
+#		Candidate edits are intersected with the dictionary before they are checked, instead of checking all of them with SpellChecker.known().
+#		A whole document is corrected in a batch: its tokens are deduplicated, and only the unknown ones are corrected.
+#	- correct_corpus() corrects documents in a process pool, each worker of which loads the compiled dictionary once.
+# REF [site] >> https://github.com/barrust/pyspellchecker
+
+import os, re, pickle, unicodedata, functools, collections
+import concurrent.futures
+import spellchecker
+
+_DICTIONARY_FORMAT_VERSION = 1
+
+def _remove_diacritics(text):
+	return ''.join(ch for ch in unicodedata.normalize('NFKD', text) if not unicodedata.combining(ch))
+
+def compile_dictionary(output_filepath, dictionary_filepaths=(), language=None, words=(), encoding='UTF-8'):
+	"""Compiles word frequency dictionaries into one file which load_spell_checker() loads fast.
+
+	dictionary_filepaths are JSON (or gzipped JSON) files of pyspellchecker, e.g. made by spellchecker.SpellChecker.export().
+	language is a language whose dictionary comes with pyspellchecker, e.g. 'en'.
+	"""
+	spell = spellchecker.SpellChecker(language=language)
+	for dictionary_filepath in dictionary_filepaths:
+		spell.word_frequency.load_dictionary(dictionary_filepath, encoding=encoding)
+	if words:
+		spell.word_frequency.load_words(words)
+	save_dictionary(spell.word_frequency, output_filepath)
+	return spell
+
+def save_dictionary(word_frequency, filepath):
+	"""Saves the frequency table of a spellchecker.WordFrequency with its precomputed statistics."""
+	state = {
+		'version': _DICTIONARY_FORMAT_VERSION,
+		'dictionary': dict(word_frequency.dictionary),
+		'total_words': word_frequency.total_words,
+		'unique_words': word_frequency.unique_words,
+		'letters': word_frequency.letters,
+		'longest_word_length': word_frequency.longest_word_length,
+	}
+	with open(filepath, 'wb') as fd:
+		pickle.dump(state, fd, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_spell_checker(filepath, distance=1, tokenizer=None, case_sensitive=False):
+	"""Creates a spellchecker.SpellChecker with a dictionary saved by save_dictionary()."""
+	with open(filepath, 'rb') as fd:
+		state = pickle.load(fd)
+	if state.get('version') != _DICTIONARY_FORMAT_VERSION:
+		raise ValueError('Unsupported dictionary format: {}.'.format(filepath))
+
+	spell = spellchecker.SpellChecker(language=None, distance=distance, tokenizer=tokenizer, case_sensitive=case_sensitive)
+	# WordFrequency has no API to set its statistics, and load_json() would recompute them by scanning all the words.
+	word_frequency = spell.word_frequency
+	word_frequency._dictionary = collections.Counter(state['dictionary'])
+	word_frequency._total_words = state['total_words']
+	word_frequency._unique_words = state['unique_words']
+	word_frequency._letters = state['letters']
+	word_frequency._longest_word_length = state['longest_word_length']
+	return spell
+
+class SpellingCorrector(object):
+	"""Corrects tokens with a spellchecker.SpellChecker, caching the corrections.
+
+	A token which is known, or which has no candidate, is kept as it is.
+	The cache is per instance, so it has to be cleared by clear_cache() when the dictionary of the spell checker changes.
+	"""
+
+	_TOKEN_PATTERN = re.compile(r'\S+')
+
+	def __init__(self, spell, cache_size=2**16):
+		self.spell = spell
+		self._case_sensitive = spell._case_sensitive
+		self._correct = functools.lru_cache(maxsize=cache_size)(self._correct_uncached)
+
+	def _get_candidates(self, token):
+		# Same as spellchecker.SpellChecker.candidates() for an unknown token.
+		# But the edits are intersected with the dictionary first, since SpellChecker.known() checks every edit in Python, which dominates the runtime.
+		spell = self.spell
+		dictionary_words = spell.word_frequency.dictionary.keys()
+		edits = spell.edit_distance_1(token)
+		candidates = spell.known(edits & dictionary_words)
+		if candidates or spell.distance != 2:
+			return candidates
+		for edit in edits:
+			candidates.update(spell.known(spell.edit_distance_1(edit) & dictionary_words))
+		return candidates
+
+	def _correct_uncached(self, token):
+		if not self.spell.unknown([token]):
+			return token
+		candidates = self._get_candidates(token)
+		if not candidates:
+			return token
+		# Same as spellchecker.SpellChecker.correction(), which prefers the candidates that differ only in diacritics.
+		# Ties of frequencies are broken by the words, so that corrections do not depend on the order of a set.
+		token_without_diacritics = _remove_diacritics(token)
+		diacritics_candidates = [candidate for candidate in candidates if _remove_diacritics(candidate) == token_without_diacritics]
+		return max(diacritics_candidates or candidates, key=lambda candidate: (self.spell[candidate], candidate))
+
+	def correct(self, token):
+		return self._correct(token)
+
+	def correct_tokens(self, tokens):
+		"""Corrects a list of tokens. Each distinct token is looked up once."""
+		unique_tokens = dict.fromkeys(tokens)
+		# Known tokens are filtered out in one call, before the per-token cache.
+		unknown_tokens = self.spell.unknown(unique_tokens)
+		for token in unique_tokens:
+			key = token if self._case_sensitive else token.lower()
+			unique_tokens[token] = self._correct(token) if key in unknown_tokens else token
+		return [unique_tokens[token] for token in tokens]
+
+	def correct_text(self, text):
+		"""Corrects the whitespace-separated tokens of a text, keeping its whitespaces."""
+		spans = [match.span() for match in self._TOKEN_PATTERN.finditer(text)]
+		corrections = self.correct_tokens([text[start:end] for start, end in spans])
+		pieces, last = list(), 0
+		for (start, end), correction in zip(spans, corrections):
+			pieces.append(text[last:start])
+			pieces.append(correction)
+			last = end
+		pieces.append(text[last:])
+		return ''.join(pieces)
+
+	def find_misspellings(self, text):
+		"""Returns a dict of misspelled token -> correction of a text."""
+		tokens = self._TOKEN_PATTERN.findall(text)
+		return {token: correction for token, correction in zip(tokens, self.correct_tokens(tokens)) if correction != token}
+
+	def cache_info(self):
+		return self._correct.cache_info()
+
+	def clear_cache(self):
+		self._correct.cache_clear()
+
+_worker_corrector = None
+
+def _initialize_worker(dictionary_filepath, distance, case_sensitive, cache_size):
+	global _worker_corrector
+	_worker_corrector = SpellingCorrector(load_spell_checker(dictionary_filepath, distance=distance, case_sensitive=case_sensitive), cache_size=cache_size)
+
+def _correct_texts(texts):
+	return [_worker_corrector.correct_text(text) for text in texts]
+
+def correct_corpus(texts, dictionary_filepath, distance=1, case_sensitive=False, num_workers=None, batch_size=64, cache_size=2**16):
+	"""Yields the corrected texts in order, correcting batches of texts in a process pool.
+
+	Each worker loads the compiled dictionary of dictionary_filepath once, and keeps its own cache of corrections.
+	"""
+	num_workers = num_workers or os.cpu_count()
+	with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, initializer=_initialize_worker, initargs=(dictionary_filepath, distance, case_sensitive, cache_size)) as executor:
+		pending = collections.deque()
+		batch = list()
+		for text in texts:
+			batch.append(text)
+			if len(batch) >= batch_size:
+				# At most two batches per worker are in flight.
+				if len(pending) >= 2 * num_workers:
+					yield from pending.popleft().result()
+				pending.append(executor.submit(_correct_texts, batch))
+				batch = list()
+		if batch:
+			pending.append(executor.submit(_correct_texts, batch))
+		while pending:
+			yield from pending.popleft().result()
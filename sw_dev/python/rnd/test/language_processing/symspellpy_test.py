@@ -225,12 +225,115 @@ def word_segmentation_example():
 	result = symspell.word_segmentation(input_term)
 	print('{}, {}, {}'.format(result.corrected_string, result.distance_sum, result.log_prob_sum))
 
+def dictionary_image_example():
+	import time
+	import symspellpy_util
+
+	dictionary_filepath = pkg_resources.resource_filename('symspellpy', 'frequency_dictionary_en_82_765.txt')
+	bigram_filepath = pkg_resources.resource_filename('symspellpy', 'frequency_bigramdictionary_en_243_342.txt')
+	pickle_filepath = './symspell_en.pkl.gz'
+	image_filepath = './symspell_en.img'
+
+	print('Start building a SymSpell index...')
+	start_time = time.time()
+	symspell = symspellpy.SymSpell(max_dictionary_edit_distance=2, prefix_length=7)
+	symspell.load_dictionary(dictionary_filepath, term_index=0, count_index=1)
+	symspell.load_bigram_dictionary(bigram_filepath, term_index=0, count_index=2)
+	print('End building a SymSpell index: {} secs.'.format(time.time() - start_time))
+	print('#words = {}, #deletes = {}.'.format(symspell.word_count, symspell.entry_count))
+
+	symspell.save_pickle(pickle_filepath)
+	symspellpy_util.save_image(symspell, image_filepath)
+
+	print('Start loading a pickle...')
+	start_time = time.time()
+	symspell_pickle = symspellpy.SymSpell(max_dictionary_edit_distance=2, prefix_length=7)
+	symspell_pickle.load_pickle(pickle_filepath)
+	print('End loading a pickle: {} secs.'.format(time.time() - start_time))
+
+	print('Start loading an image...')
+	start_time = time.time()
+	symspell_image = symspellpy_util.load_image(image_filepath)
+	print('End loading an image: {} secs.'.format(time.time() - start_time))
+
+	# The deletes index of an image is memory-mapped, and looked up by binary search instead of a dict.
+	input_terms = ['memebers', 'apastraphee', 'hapenning', 'somthing', 'recieve'] * 200
+	for name, sym in [('dict', symspell), ('image', symspell_image)]:
+		start_time = time.time()
+		suggestions = [sym.lookup(input_term, symspellpy.Verbosity.CLOSEST, max_edit_distance=2) for input_term in input_terms]
+		print('Lookup ({}): {} terms/sec.'.format(name, len(input_terms) / (time.time() - start_time)))
+	print('Suggestions = {}.'.format([str(suggestion) for suggestion in suggestions[0]]))
+
+	input_term = 'thequickbrownfoxjumpsoverthelazydog'
+	result = symspell_image.word_segmentation(input_term)
+	print('{}, {}, {}'.format(result.corrected_string, result.distance_sum, result.log_prob_sum))
+
+def lookup_server_benchmark():
+	import os, time, random, threading
+	import numpy as np
+	import symspellpy_util
+
+	dictionary_filepath = pkg_resources.resource_filename('symspellpy', 'frequency_dictionary_en_82_765.txt')
+	bigram_filepath = pkg_resources.resource_filename('symspellpy', 'frequency_bigramdictionary_en_243_342.txt')
+	image_filepath = './symspell_en.img'
+	socket_filepath = './symspell.sock'
+	num_workers = os.cpu_count()
+	num_requests_per_client = 200
+
+	if not os.path.exists(image_filepath):
+		symspell = symspellpy.SymSpell(max_dictionary_edit_distance=2, prefix_length=7)
+		symspell.load_dictionary(dictionary_filepath, term_index=0, count_index=1)
+		symspell.load_bigram_dictionary(bigram_filepath, term_index=0, count_index=2)
+		symspellpy_util.save_image(symspell, image_filepath)
+
+	# Misspelled words with one substitution.
+	rng = random.Random(0)
+	symspell = symspellpy_util.load_image(image_filepath)
+	words = [word for word in itertools.islice(symspell.words, 20000) if len(word) > 3]
+	def misspell(word):
+		idx = rng.randrange(len(word))
+		return word[:idx] + rng.choice('abcdefghijklmnopqrstuvwxyz') + word[idx + 1:]
+	phrases = [misspell(rng.choice(words)) for _ in range(10000)]
+
+	def run_client(batch_size, latencies):
+		with symspellpy_util.SymSpellClient(socket_filepath) as client:
+			for idx in range(num_requests_per_client):
+				start = idx * batch_size % (len(phrases) - batch_size)
+				start_time = time.perf_counter()
+				client.lookup(phrases[start:start + batch_size], max_edit_distance=2)
+				latencies.append(time.perf_counter() - start_time)
+
+	# In-process lookups, as a baseline.
+	start_time = time.perf_counter()
+	for phrase in phrases[:1000]:
+		symspell.lookup(phrase, symspellpy.Verbosity.CLOSEST, max_edit_distance=2)
+	print('In-process: {:.1f} usecs/lookup.'.format((time.perf_counter() - start_time) / 1000 * 1e6))
+
+	with symspellpy_util.SymSpellServer(symspell, socket_filepath, num_workers=num_workers):
+		for num_clients in sorted(set([1, num_workers])):
+			for batch_size in [1, 16, 256]:
+				latencies = list()
+				threads = [threading.Thread(target=run_client, args=(batch_size, latencies)) for _ in range(num_clients)]
+				start_time = time.perf_counter()
+				for thread in threads:
+					thread.start()
+				for thread in threads:
+					thread.join()
+				elapsed_time = time.perf_counter() - start_time
+				latencies = np.array(latencies) * 1000
+				print('#clients = {}, batch size = {}: p50 = {:.3f} msecs, p99 = {:.3f} msecs, {:.0f} lookups/sec.'.format(num_clients, batch_size, np.percentile(latencies, 50), np.percentile(latencies, 99), num_clients * num_requests_per_client * batch_size / elapsed_time))
+
 def main():
 	#dictionary_example()
 	#lookup_example()
 	#lookup_compound_example()
 	word_segmentation_example()
 
+	# Precomputed dictionary images and a multi-process lookup server.
+	#	REF [file] >> ./symspellpy_util.py
+	#dictionary_image_example()
+	#lookup_server_benchmark()
+
 #--------------------------------------------------------------------
 
 if '__main__' == __name__:
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# SymSpell dictionary images and a multi-process lookup server.
+#	- save_image() writes the precomputed deletes index of a symspellpy.SymSpell to a compact binary image, and load_image() maps it back.
+#		The image has a JSON header and flat arrays: the words, the bigrams, and the deletes index.
+#		The deletes index is a sorted array of 64-bit hashes of delete strings, CSR offsets, and word indices.
+#		It is memory-mapped and looked up by binary search, so it is neither parsed nor rebuilt at load time, and its pages are shared by all the processes mapping the file.
+#		Like the original C# SymSpell, the deletes are binned by hash. SymSpell.lookup() already skips suggestions which are in a bin only because of a hash collision.
+#	- SymSpellServer loads one index, and forks workers which inherit it copy-on-write.
+#		The workers accept connections on one Unix domain socket (pre-fork model), and serve batched lookup, lookup_compound, and word_segmentation requests.
+#		gc.freeze() keeps the cyclic GC of the workers from writing to (and so copying) the pages of the inherited objects.
+# REF [site] >>
+#	https://github.com/mammothb/symspellpy
+#	https://github.com/wolfgarbe/SymSpell
+
+import os, gc, json, mmap, bisect, hashlib, struct, multiprocessing
+import multiprocessing.connection
+import numpy as np
+import symspellpy
+
+_IMAGE_MAGIC = b'SYMSPELL'
+_IMAGE_VERSION = 1
+_IMAGE_HEADER = struct.Struct('<8sQ')  # Magic, header size.
+_ALIGNMENT = 64
+
+def _hash_delete(key):
+	# A stable hash, unlike hash() which is salted per process.
+	return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+class _HashedDeletes(object):
+	"""A read-only mapping of delete string -> list of words over the arrays of an image.
+
+	It provides the part of the dict interface which symspellpy.SymSpell.lookup() uses.
+	"""
+
+	def __init__(self, hashes, offsets, word_indices, words):
+		self._hashes = hashes
+		self._offsets = offsets
+		self._word_indices = word_indices
+		self._words = words
+		# lookup() tests a key by 'in' and then gets it.
+		self._last_key, self._last_pos = None, -1
+
+	def _find(self, key):
+		if key != self._last_key:
+			h = _hash_delete(key)
+			pos = bisect.bisect_left(self._hashes, h)
+			self._last_key, self._last_pos = key, pos if pos < len(self._hashes) and self._hashes[pos] == h else -1
+		return self._last_pos
+
+	def __len__(self):
+		return len(self._hashes)
+
+	def __contains__(self, key):
+		return self._find(key) >= 0
+
+	def __getitem__(self, key):
+		pos = self._find(key)
+		if pos < 0:
+			raise KeyError(key)
+		words = self._words
+		return [words[idx] for idx in self._word_indices[self._offsets[pos]:self._offsets[pos + 1]]]
+
+def _encode_counts(counts):
+	# Terms cannot contain newlines, since dictionaries are read line by line.
+	blob = '\n'.join(counts.keys()).encode('utf-8')
+	return np.frombuffer(blob, dtype=np.uint8), np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+
+def _decode_terms(blob, num_terms):
+	return str(blob, 'utf-8').split('\n') if num_terms else list()
+
+def save_image(symspell, filepath):
+	"""Saves the dictionaries and the deletes index of a symspellpy.SymSpell to a binary image file."""
+	words = symspell.words
+	word_ids = {word: idx for idx, word in enumerate(words)}
+
+	# Delete strings with the same hash share a bin.
+	bins = dict()
+	for key, suggestions in symspell.deletes.items():
+		bins.setdefault(_hash_delete(key), list()).extend(word_ids[suggestion] for suggestion in suggestions)
+	hashes = np.fromiter(bins.keys(), dtype=np.uint64, count=len(bins))
+	order = np.argsort(hashes, kind='stable')
+	hashes = hashes[order]
+	bin_values = list(bins.values())
+	sizes = np.fromiter((len(bin_values[idx]) for idx in order), dtype=np.int64, count=len(order))
+	offsets = np.zeros(len(hashes) + 1, dtype=np.int64)
+	np.cumsum(sizes, out=offsets[1:])
+	word_indices = np.empty(offsets[-1], dtype=np.int32)
+	for pos, idx in enumerate(order):
+		word_indices[offsets[pos]:offsets[pos + 1]] = bin_values[idx]
+
+	word_blob, word_counts = _encode_counts(words)
+	below_threshold_blob, below_threshold_counts = _encode_counts(symspell.below_threshold_words)
+	bigram_blob, bigram_counts = _encode_counts(symspell.bigrams)
+	arrays = {
+		'word_blob': word_blob, 'word_counts': word_counts,
+		'below_threshold_blob': below_threshold_blob, 'below_threshold_counts': below_threshold_counts,
+		'bigram_blob': bigram_blob, 'bigram_counts': bigram_counts,
+		'delete_hashes': hashes, 'delete_offsets': offsets, 'delete_word_indices': word_indices,
+	}
+
+	header = {
+		'version': _IMAGE_VERSION,
+		'max_dictionary_edit_distance': symspell._max_dictionary_edit_distance,
+		'prefix_length': symspell._prefix_length,
+		'count_threshold': symspell._count_threshold,
+		'max_length': symspell._max_length,
+		'arrays': dict(),
+	}
+	# The offsets of the arrays are relative to the end of the header, so the header can be sized before they are known.
+	offset = 0
+	for name, array in arrays.items():
+		offset = (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+		header['arrays'][name] = {'dtype': array.dtype.str, 'length': len(array), 'offset': offset}
+		offset += array.nbytes
+	header_bytes = json.dumps(header).encode('utf-8')
+	data_start = (_IMAGE_HEADER.size + len(header_bytes) + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+	with open(filepath, 'wb') as fd:
+		fd.write(_IMAGE_HEADER.pack(_IMAGE_MAGIC, len(header_bytes)))
+		fd.write(header_bytes)
+		for name, array in arrays.items():
+			fd.seek(data_start + header['arrays'][name]['offset'])
+			fd.write(array.tobytes())
+		fd.truncate(data_start + offset)
+
+def load_image(filepath):
+	"""Loads a symspellpy.SymSpell from an image file saved by save_image().
+
+	The words and the bigrams are loaded into dicts. The deletes index stays memory-mapped, and is read-only:
+	adding or deleting dictionary entries of the loaded SymSpell is not supported.
+	"""
+	with open(filepath, 'rb') as fd:
+		magic, header_size = _IMAGE_HEADER.unpack(fd.read(_IMAGE_HEADER.size))
+		if magic != _IMAGE_MAGIC:
+			raise ValueError('Not a SymSpell image: {}.'.format(filepath))
+		header = json.loads(fd.read(header_size))
+		if header['version'] != _IMAGE_VERSION:
+			raise ValueError('Unsupported SymSpell image version: {}.'.format(header['version']))
+		mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+	data_start = (_IMAGE_HEADER.size + header_size + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+	def get_array(name):
+		# A memoryview is indexed much faster from Python than a NumPy array.
+		info = header['arrays'][name]
+		dtype = np.dtype(info['dtype'])
+		start = data_start + info['offset']
+		view = memoryview(mm)[start:start + info['length'] * dtype.itemsize]
+		return view if dtype == np.uint8 else view.cast(dtype.char)
+
+	def get_counts(prefix):
+		counts = get_array(prefix + '_counts')
+		return dict(zip(_decode_terms(get_array(prefix + '_blob'), len(counts)), counts.tolist()))
+
+	symspell = symspellpy.SymSpell(header['max_dictionary_edit_distance'], header['prefix_length'], header['count_threshold'])
+	symspell._words = get_counts('word')
+	symspell._below_threshold_words = get_counts('below_threshold')
+	symspell._bigrams = get_counts('bigram')
+	symspell._max_length = header['max_length']
+	symspell._deletes = _HashedDeletes(get_array('delete_hashes'), get_array('delete_offsets'), get_array('delete_word_indices'), list(symspell._words.keys()))
+	return symspell
+
+#--------------------------------------------------------------------
+
+def _handle_request(symspell, method, phrases, kwargs):
+	if 'lookup' == method:
+		return [[(item.term, item.distance, item.count) for item in symspell.lookup(phrase, **kwargs)] for phrase in phrases]
+	elif 'lookup_compound' == method:
+		return [[(item.term, item.distance, item.count) for item in symspell.lookup_compound(phrase, **kwargs)] for phrase in phrases]
+	elif 'word_segmentation' == method:
+		return [tuple(symspell.word_segmentation(phrase, **kwargs)) for phrase in phrases]
+	else:
+		raise ValueError('Invalid method: {}.'.format(method))
+
+def _serve(listener, symspell):
+	while True:
+		try:
+			conn = listener.accept()
+		except (OSError, EOFError, multiprocessing.AuthenticationError):
+			continue
+		with conn:
+			while True:
+				try:
+					method, phrases, kwargs = conn.recv()
+				except (EOFError, ConnectionError):
+					break
+				try:
+					response = True, _handle_request(symspell, method, phrases, kwargs)
+				except Exception as ex:
+					response = False, '{}: {}'.format(type(ex).__name__, ex)
+				conn.send(response)
+
+class SymSpellServer(object):
+	"""Serves lookups of one symspellpy.SymSpell from forked worker processes over a Unix domain socket.
+
+	symspell is a SymSpell or the filepath of its image.
+	Each worker serves one connection at a time, so up to num_workers clients are served concurrently.
+	Workers are forked, which is only supported on POSIX systems.
+	"""
+
+	def __init__(self, symspell, address, num_workers=4, authkey=None, backlog=128):
+		self.symspell = load_image(symspell) if isinstance(symspell, (str, os.PathLike)) else symspell
+		self.address = address
+		self.num_workers = num_workers
+		self.authkey = authkey
+		self.backlog = backlog
+		self._listener = None
+		self._workers = list()
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.stop()
+
+	def start(self):
+		if os.path.exists(self.address):
+			os.remove(self.address)
+		self._listener = multiprocessing.connection.Listener(self.address, family='AF_UNIX', backlog=self.backlog, authkey=self.authkey)
+
+		# Move the objects allocated so far into the permanent generation, which the cyclic GC of the workers does not traverse.
+		gc.collect()
+		gc.freeze()
+		try:
+			context = multiprocessing.get_context('fork')
+			for _ in range(self.num_workers):
+				# The arguments are inherited by the fork, not pickled.
+				worker = context.Process(target=_serve, args=(self._listener, self.symspell), daemon=True)
+				worker.start()
+				self._workers.append(worker)
+		finally:
+			gc.unfreeze()
+
+	def stop(self):
+		for worker in self._workers:
+			worker.terminate()
+		for worker in self._workers:
+			worker.join()
+		self._workers = list()
+		if self._listener is not None:
+			# Also removes the socket file.
+			self._listener.close()
+			self._listener = None
+
+class SymSpellClient(object):
+	"""A connection to a SymSpellServer. Each method sends a batch of phrases in one request."""
+
+	def __init__(self, address, authkey=None):
+		self._conn = multiprocessing.connection.Client(address, family='AF_UNIX', authkey=authkey)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def _request(self, method, phrases, kwargs):
+		self._conn.send((method, list(phrases), kwargs))
+		is_ok, result = self._conn.recv()
+		if not is_ok:
+			raise RuntimeError(result)
+		return result
+
+	def lookup(self, phrases, verbosity=symspellpy.Verbosity.CLOSEST, **kwargs):
+		"""Returns a list of (term, distance, count) suggestions per phrase."""
+		return self._request('lookup', phrases, dict(kwargs, verbosity=verbosity))
+
+	def lookup_compound(self, phrases, max_edit_distance, **kwargs):
+		"""Returns a list of (term, distance, count) suggestions per phrase."""
+		return self._request('lookup_compound', phrases, dict(kwargs, max_edit_distance=max_edit_distance))
+
+	def word_segmentation(self, phrases, **kwargs):
+		"""Returns a (segmented_string, corrected_string, distance_sum, log_prob_sum) tuple per phrase."""
+		return self._request('word_segmentation', phrases, kwargs)
+
+	def close(self):
+		if self._conn is not None:
+			self._conn.close()
+			self._conn = None
@@ -984,6 +984,49 @@ def transform_test():
 
 	plt.show()
 
+def lmdb_dataset_benchmark():
+	import sys, shutil
+	sys.path.append('../../../../ext/test/database')
+	import lmdb
+	import lmdb_util, lmdb_dataset
+
+	num_classes, num_images_per_class = 10, 500
+	image_shape = 64, 64, 3  # (H, W, C).
+	image_dir_path = './lmdb_benchmark_images'
+	lmdb_dir_path = './lmdb_benchmark_lmdb'
+	batch_size = 64
+
+	# Raw image folder & LMDB of the same images.
+	shutil.rmtree(image_dir_path, ignore_errors=True)
+	shutil.rmtree(lmdb_dir_path, ignore_errors=True)
+	images, labels = list(), list()
+	for label in range(num_classes):
+		os.makedirs(os.path.join(image_dir_path, 'class_{}'.format(label)))
+		for idx in range(num_images_per_class):
+			image = np.random.randint(256, size=image_shape, dtype=np.uint8)
+			PIL.Image.fromarray(image).save(os.path.join(image_dir_path, 'class_{}'.format(label), '{:06}.png'.format(idx)))
+			images.append(image.transpose(2, 0, 1))  # (C, H, W).
+			labels.append(label)
+	with lmdb.open(lmdb_dir_path, map_size=sum(image.nbytes for image in images) * 2) as env:
+		with env.begin(write=True) as txn:
+			keys = ['{:08}'.format(idx).encode('ascii') for idx in range(len(images))]
+			lmdb_util.put_many(txn, keys, images, labels, append=True)
+
+	image_folder_dataset = torchvision.datasets.ImageFolder(root=image_dir_path, transform=torchvision.transforms.PILToTensor())
+	lmdb_datasets = {
+		'LmdbDataset': lmdb_dataset.LmdbDataset(lmdb_dir_path, prefetch_size=batch_size),
+		# The first half of the keys, e.g. for node 0 of 2 nodes.
+		'LmdbDataset (shard 0/2)': lmdb_dataset.LmdbDataset(lmdb_dir_path, shard_index=0, num_shards=2, prefetch_size=batch_size),
+	}
+
+	for num_workers in [0, 2, 4]:
+		for name, dataset in [('ImageFolder', image_folder_dataset)] + list(lmdb_datasets.items()):
+			# Sequential reads, which can be prefetched by the LMDB cursor.
+			dataloader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers, persistent_workers=False)
+			start_time = time.time()
+			num_samples = sum(len(batch_labels) for _, batch_labels in dataloader)
+			print('{} (#workers = {}): {:.1f} samples/sec.'.format(name, num_workers, num_samples / (time.time() - start_time)))
+
 def main():
 	#return_none_dataset_test()
 
@@ -1005,6 +1048,9 @@ def main():
 
 	transform_test()  # Transforms & automatic augmentation transforms.
 
+	#--------------------
+	#lmdb_dataset_benchmark()  # LMDB-backed dataset vs. raw image folder.
+
 #--------------------------------------------------------------------
 
 if '__main__' == __name__:
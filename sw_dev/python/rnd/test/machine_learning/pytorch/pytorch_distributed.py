@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 
-import os, math, random, datetime, tempfile
+import os, math, time, random, datetime, tempfile
+import concurrent.futures
+import numpy as np
 import torch
 import torchvision
 
@@ -104,34 +106,52 @@ def run_all_reduce_p2p(rank, world_size, use_cuda=True):
 #	https://github.com/seba-1511/dist_tuto.pth/blob/gh-pages/allreduce.py
 def all_reduce(send, recv, use_cuda):
 	""" Implementation of a ring-reduce. """
-	rank = torch.distributed.get_rank()
-	world_size = torch.distributed.get_world_size()
-	if use_cuda: device = torch.device('cuda:{}'.format(rank))
-
-	send_buff = torch.zeros(send.size())
-	recv_buff = torch.zeros(send.size())
-	accum = torch.zeros(send.size())
-	if use_cuda: accum = accum.to(device)
-	accum[:] = send[:]
+	recv.copy_(send)
+	ring_all_reduce(recv)
 	if use_cuda: torch.cuda.synchronize()
 
-	left = ((rank - 1) + world_size) % world_size
-	right = (rank + 1) % world_size
-
-	for i in range(world_size - 1):
-		if i % 2 == 0:
-			# Send send_buff.
-			send_req = torch.distributed.isend(send_buff, right)
-			torch.distributed.recv(recv_buff, left)
-			accum[:] += recv[:]
-		else:
-			# Send recv_buff.
-			send_req = torch.distributed.isend(recv_buff, right)
-			torch.distributed.recv(send_buff, left)
-			accum[:] += send[:]
-		send_req.wait()
-	if use_cuda: torch.cuda.synchronize()
-	recv[:] = accum[:]
+# REF [site] >> https://andrew.gibiansky.com/blog/machine-learning/baidu-allreduce/
+def ring_all_reduce(tensor, group=None):
+	""" Sums tensor over all the processes in place, by a chunked ring all-reduce.
+
+	The tensor is split into world_size chunks.
+	Reduce-scatter: in each of world_size - 1 steps, every process sends a chunk to its right neighbor, and adds the chunk received from its left neighbor to its own.
+		Then each process has the full sum of one chunk.
+	All-gather: in each of world_size - 1 steps, every process passes a fully summed chunk on to its right neighbor.
+	Each process sends and receives 2 * (world_size - 1) / world_size times the size of the tensor, whatever world_size is.
+	"""
+	world_size = torch.distributed.get_world_size(group)
+	if world_size == 1:
+		return tensor
+	rank = torch.distributed.get_rank(group)
+	left = torch.distributed.get_global_rank(group, (rank - 1) % world_size) if group is not None else (rank - 1) % world_size
+	right = torch.distributed.get_global_rank(group, (rank + 1) % world_size) if group is not None else (rank + 1) % world_size
+
+	flat = tensor.view(-1) if tensor.is_contiguous() else tensor.flatten()
+	chunks = flat.tensor_split(world_size)
+	recv_buff = torch.empty_like(chunks[0])  # The first chunk is the largest.
+
+	def exchange(send_chunk, recv_chunk):
+		# Chunk sizes are the same on all the processes, so empty chunks are skipped by both ends.
+		send_req = torch.distributed.isend(send_chunk, right, group=group) if send_chunk.numel() > 0 else None
+		if recv_chunk.numel() > 0:
+			torch.distributed.recv(recv_chunk, left, group=group)
+		if send_req is not None:
+			send_req.wait()
+
+	# Reduce-scatter.
+	for step in range(world_size - 1):
+		recv_idx = (rank - step - 1) % world_size
+		recv_chunk = recv_buff[:chunks[recv_idx].numel()]
+		exchange(chunks[(rank - step) % world_size], recv_chunk)
+		chunks[recv_idx].add_(recv_chunk)
+	# All-gather. The process of rank r starts with the full sum of chunk r + 1.
+	for step in range(world_size - 1):
+		exchange(chunks[(rank - step + 1) % world_size], chunks[(rank - step) % world_size])
+
+	if flat.data_ptr() != tensor.data_ptr():
+		tensor.copy_(flat.view_as(tensor))
+	return tensor
 
 # REF [site] >>
 #	https://github.com/seba-1511/dist_tuto.pth/blob/gh-pages/gloo.py
@@ -159,33 +179,111 @@ def run_all_reduce(rank, world_size, use_cuda=True):
 class Partition(object):
 	def __init__(self, data, index):
 		self.data = data
-		self.index = index
+		self.index = index  # A NumPy array or a range of indices into data.
 
 	def __len__(self):
 		return len(self.index)
 
 	def __getitem__(self, index):
-		data_idx = self.index[index]
+		data_idx = int(self.index[index])
 		return self.data[data_idx]
 
 # REF [site] >> https://github.com/seba-1511/dist_tuto.pth/blob/gh-pages/train_dist.py
 class DataPartitioner(object):
-	def __init__(self, data, sizes=[0.7, 0.2, 0.1], seed=1234):
+	""" Splits the indices of a dataset into partitions, e.g. one per rank, which are reshuffled every epoch.
+
+	All the processes compute the same partitions from seed and the epoch, so no communication is needed.
+	The order of the samples is a permutation of the indices, or, if block_size > 1, a permutation of blocks of block_size consecutive indices,
+	so that a partition reads runs of consecutive samples and only a permutation of the blocks is computed. The last, partial block is permuted with the others.
+	If shuffle is False, the samples are in their order, and each partition is a range of consecutive indices.
+	sizes are the fractions of the dataset for the partitions.
+	By default, a partition has floor(size * len(data)) samples, so partitions are disjoint, and the samples left at the end of the order, which differ every epoch, are dropped.
+	If pad is True, the order of the samples is wrapped around so that a partition has ceil(size * len(data)) samples instead,
+	e.g. so that ranks get the same number of samples. Then partitions can share samples.
+	Partitions are views (or ranges) of one index array where possible, not copies.
+	"""
+
+	def __init__(self, data, sizes=[0.7, 0.2, 0.1], seed=1234, shuffle=True, block_size=1, pad=False):
 		self.data = data
-		self.partitions = []
-		rng = random.Random()
-		rng.seed(seed)
-		data_len = len(data)
-		indexes = [x for x in range(0, data_len)]
-		rng.shuffle(indexes)
-
-		for frac in sizes:
-			part_len = int(frac * data_len)
-			self.partitions.append(indexes[0:part_len])
-			indexes = indexes[part_len:]
+		self.data_len = data if isinstance(data, int) else len(data)
+		self.seed = seed
+		self.shuffle = shuffle
+		self.block_size = block_size
+		self.epoch = 0
+		self._order, self._order_epoch = None, None
+
+		# Rounded first, since e.g. 0.07 * 100 is 7.000000000000001.
+		part_lens = [math.ceil(round(frac * self.data_len, 6)) if pad else math.floor(round(frac * self.data_len, 6)) for frac in sizes]
+		self._part_offsets = [0]
+		for part_len in part_lens:
+			self._part_offsets.append(self._part_offsets[-1] + part_len)
+
+	def __len__(self):
+		return len(self._part_offsets) - 1
+
+	def set_epoch(self, epoch):
+		self.epoch = epoch
+
+	def _get_order(self):
+		# A permutation of the samples, or of the blocks.
+		if self._order_epoch != self.epoch:
+			rng = np.random.default_rng([self.seed, self.epoch])
+			self._order = rng.permutation(self.data_len if self.block_size == 1 else -(-self.data_len // self.block_size))
+			self._order_epoch = self.epoch
+		return self._order
+
+	def _to_indices(self, positions):
+		# Maps positions in the order of the samples of this epoch to indices into data.
+		if not self.shuffle:
+			return positions
+		order = self._get_order()
+		if self.block_size == 1:
+			return order[positions]
+		tail_len = self.data_len % self.block_size
+		if tail_len:
+			# The partial block is shorter, so the positions after it are shifted as if it were a full block.
+			tail_end = int(np.flatnonzero(order == len(order) - 1)[0]) * self.block_size + tail_len
+			positions = np.where(positions >= tail_end, positions + (self.block_size - tail_len), positions)
+		blocks, offsets = np.divmod(positions, self.block_size)
+		return order[blocks] * self.block_size + offsets
+
+	def get_indices(self, partition):
+		""" Returns the indices into data of a partition in this epoch. """
+		start, end = self._part_offsets[partition], self._part_offsets[partition + 1]
+		if end <= self.data_len:
+			if not self.shuffle:
+				return range(start, end)
+			if self.block_size == 1:
+				return self._get_order()[start:end]
+		return self._to_indices(np.arange(start, end) % self.data_len)
 
 	def use(self, partition):
-		return Partition(self.data, self.partitions[partition])
+		""" Returns a partition of data in this epoch, which has to be got again after set_epoch(). """
+		return Partition(self.data, self.get_indices(partition))
+
+	def sampler(self, partition):
+		""" Returns a sampler of the indices of a partition, which follows set_epoch() of this partitioner or of the sampler. """
+		return PartitionSampler(self, partition)
+
+class PartitionSampler(torch.utils.data.Sampler):
+	""" Samples the indices of a partition of a DataPartitioner, e.g. torch.utils.data.DataLoader(dataset, sampler=partitioner.sampler(rank)).
+
+	Like torch.utils.data.distributed.DistributedSampler, set_epoch() has to be called at the beginning of each epoch for a new shuffle.
+	"""
+
+	def __init__(self, partitioner, partition):
+		self.partitioner = partitioner
+		self.partition = partition
+
+	def __len__(self):
+		return self.partitioner._part_offsets[self.partition + 1] - self.partitioner._part_offsets[self.partition]
+
+	def __iter__(self):
+		indices = self.partitioner.get_indices(self.partition)
+		return iter(indices if isinstance(indices, range) else indices.tolist())
+
+	def set_epoch(self, epoch):
+		self.partitioner.set_epoch(epoch)
 
 # REF [site] >> https://github.com/seba-1511/dist_tuto.pth/blob/gh-pages/train_dist.py
 class Net(torch.nn.Module):
@@ -220,9 +318,14 @@ def partition_dataset():
 	size = torch.distributed.get_world_size()
 	batch_size = math.ceil(128 / float(size))
 	partition_sizes = [1.0 / size for _ in range(size)]
-	partition = DataPartitioner(dataset, partition_sizes)
-	partition = partition.use(torch.distributed.get_rank())
-	train_dataloader = torch.utils.data.DataLoader(partition, batch_size=batch_size, shuffle=True)
+	# Padded, so that all the ranks run the same number of batches.
+	partitioner = DataPartitioner(dataset, partition_sizes, pad=True)
+	if False:
+		partition = partitioner.use(torch.distributed.get_rank())
+		train_dataloader = torch.utils.data.DataLoader(partition, batch_size=batch_size, shuffle=True)
+	else:
+		# The partitions are reshuffled every epoch by train_dataloader.sampler.set_epoch().
+		train_dataloader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, sampler=partitioner.sampler(torch.distributed.get_rank()))
 	return train_dataloader, batch_size
 
 # Gradient averaging.
@@ -233,6 +336,106 @@ def average_gradients(model):
 		torch.distributed.all_reduce(param.grad.data, op=torch.distributed.ReduceOp.SUM)
 		param.grad.data /= size
 
+class GradientBucketer(object):
+	""" Averages the gradients of a model over all the processes in buckets of about bucket_cap_mb, overlapping communication with backward.
+
+	Parameters are assigned to buckets in reverse order, which is roughly the order in which backward produces their gradients.
+	When all the gradients of a bucket have been accumulated, which a post-accumulate-grad hook detects, the bucket is copied into a flat buffer and all-reduced on a communication thread while backward goes on.
+	Buckets are all-reduced in the same order on all the processes, so a bucket waits for all the buckets before it.
+	synchronize() has to be called after backward and before the optimizer step. It waits for the buckets and copies the averaged gradients back.
+	It has to be called after every backward: gradients accumulated over several backward calls are not supported, and a second gradient of a parameter before synchronize() raises RuntimeError.
+	Each bucket also carries a flag per parameter, so that like DistributedDataParallel, a parameter which got no gradient on any process keeps its gradient as it is, e.g. None,
+	and one which got no gradient on this process, but did on others, gets the average with zeros for the processes without a gradient.
+	No other collective may be issued while backward is running, since the communication thread uses the same process group.
+	"""
+
+	def __init__(self, model, bucket_cap_mb=25, all_reduce_fn=ring_all_reduce, group=None):
+		self.all_reduce_fn = all_reduce_fn
+		self.group = group
+		self.world_size = torch.distributed.get_world_size(group)
+
+		params = [param for param in model.parameters() if param.requires_grad]
+		bucket_cap = bucket_cap_mb * 1024 * 1024
+		self.buckets = list()  # [(flat buffer, [(param, offset, flag offset), ...]), ...].
+		bucket_params, bucket_bytes = list(), 0
+		for param in reversed(params):
+			if bucket_params and (bucket_bytes + param.numel() * param.element_size() > bucket_cap or param.dtype != bucket_params[0].dtype or param.device != bucket_params[0].device):
+				self._add_bucket(bucket_params)
+				bucket_params, bucket_bytes = list(), 0
+			bucket_params.append(param)
+			bucket_bytes += param.numel() * param.element_size()
+		if bucket_params:
+			self._add_bucket(bucket_params)
+
+		self._param_slots = {param: (idx, offset, flag_offset) for idx, (_, slots) in enumerate(self.buckets) for param, offset, flag_offset in slots}
+		self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+		self._hooks = [param.register_post_accumulate_grad_hook(self._on_grad_ready) for param in params]
+		self._reset()
+
+	def _add_bucket(self, params):
+		offsets = [0]
+		for param in params[:-1]:
+			offsets.append(offsets[-1] + param.numel())
+		num_elements = offsets[-1] + params[-1].numel()
+		# The gradients, followed by a flag per parameter which is 1 if the parameter got a gradient.
+		buffer = torch.zeros(num_elements + len(params), dtype=params[0].dtype, device=params[0].device)
+		self.buckets.append((buffer, list(zip(params, offsets, range(num_elements, num_elements + len(params))))))
+
+	def _reset(self):
+		# The slots of parameters which get no gradient in the next backward have to be zeros when their buckets are flushed.
+		for buffer, _ in self.buckets:
+			buffer.zero_()
+		self._num_pending = [len(slots) for _, slots in self.buckets]
+		self._ready_params = set()
+		self._next_bucket = 0
+		self._futures = list()
+
+	def _all_reduce(self, buffer):
+		self.all_reduce_fn(buffer, group=self.group)
+		buffer.div_(self.world_size)
+
+	def _launch_ready_buckets(self, flush=False):
+		while self._next_bucket < len(self.buckets) and (flush or self._num_pending[self._next_bucket] == 0):
+			self._futures.append(self._executor.submit(self._all_reduce, self.buckets[self._next_bucket][0]))
+			self._next_bucket += 1
+
+	def _on_grad_ready(self, param):
+		if param in self._ready_params:
+			# Its bucket may already be being all-reduced.
+			raise RuntimeError('Gradient produced twice before synchronize(): {}.'.format(tuple(param.shape)))
+		self._ready_params.add(param)
+		bucket_idx, offset, flag_offset = self._param_slots[param]
+		buffer = self.buckets[bucket_idx][0]
+		# Gradients can be non-contiguous, e.g. in channels_last.
+		buffer[offset:offset + param.numel()].copy_(param.grad.reshape(-1))
+		buffer[flag_offset] = 1
+		self._num_pending[bucket_idx] -= 1
+		self._launch_ready_buckets()
+
+	def synchronize(self):
+		""" Waits for all the buckets, and replaces the gradients by their averages. """
+		# Parameters which got no gradient in this backward leave their buckets incomplete. Their slots are zeros.
+		self._launch_ready_buckets(flush=True)
+		for future in self._futures:
+			future.result()
+		for buffer, slots in self.buckets:
+			is_used = (buffer[len(buffer) - len(slots):] > 0).tolist()
+			for (param, offset, _), used in zip(slots, is_used):
+				if not used:
+					continue
+				averaged = buffer[offset:offset + param.numel()].view_as(param)
+				if param.grad is None:
+					param.grad = averaged.clone()
+				else:
+					param.grad.copy_(averaged)
+		self._reset()
+
+	def close(self):
+		for hook in self._hooks:
+			hook.remove()
+		self._hooks = list()
+		self._executor.shutdown()
+
 # Distributed synchronous SGD example.
 # REF [site] >> https://github.com/seba-1511/dist_tuto.pth/blob/gh-pages/train_dist.py
 def run_synchronous_sgd(rank, world_size, use_cuda=True):
@@ -244,10 +447,13 @@ def run_synchronous_sgd(rank, world_size, use_cuda=True):
 	model = Net()
 	if use_cuda: model = model.to(device)
 	optimizer = torch.optim.SGD(model.parameters(), lr=0.01, momentum=0.5)
+	bucketer = GradientBucketer(model, bucket_cap_mb=25, all_reduce_fn=torch.distributed.all_reduce)
 
 	#num_batches = math.ceil(len(train_dataloader.dataset) / float(batch_size))
 	num_batches = len(train_dataloader)
 	for epoch in range(10):
+		if isinstance(train_dataloader.sampler, PartitionSampler):
+			train_dataloader.sampler.set_epoch(epoch)
 		epoch_loss = 0.0
 		for data, target in train_dataloader:
 			if use_cuda:
@@ -260,9 +466,98 @@ def run_synchronous_sgd(rank, world_size, use_cuda=True):
 			loss = torch.nn.functional.nll_loss(output, target)
 			epoch_loss += loss.item()
 			loss.backward()
-			average_gradients(model)
+			#average_gradients(model)  # One all-reduce per parameter, after backward.
+			bucketer.synchronize()  # Buckets are all-reduced during backward.
 			optimizer.step()
 		print('Rank {}, epoch {}: loss = {}.'.format(torch.distributed.get_rank(), epoch, epoch_loss / num_batches))
+	bucketer.close()
+
+def run_all_reduce_benchmark(rank, world_size, use_cuda=False):
+	""" Compares ring_all_reduce() with torch.distributed.all_reduce(), and bucketed gradient averaging with averaging per parameter. """
+	num_iters = 5
+
+	def measure(fn):
+		fn()  # Warm-up.
+		torch.distributed.barrier()
+		start_time = time.time()
+		for _ in range(num_iters):
+			fn()
+		torch.distributed.barrier()
+		return (time.time() - start_time) / num_iters
+
+	for size_mb in [1, 25, 100]:
+		tensor = torch.ones(size_mb * 1024 * 1024 // 4)
+		for name, all_reduce_fn in [('torch.distributed.all_reduce', torch.distributed.all_reduce), ('ring_all_reduce', ring_all_reduce)]:
+			elapsed_time = measure(lambda: all_reduce_fn(tensor))
+			if rank == 0:
+				# Bus bandwidth is what each process sends, 2 * (world_size - 1) / world_size times the tensor size for a ring.
+				print('{}, {} MB: {:.1f} ms, algorithm bandwidth = {:.1f} MB/s, bus bandwidth = {:.1f} MB/s.'.format(name, size_mb, elapsed_time * 1000, size_mb / elapsed_time, size_mb / elapsed_time * 2 * (world_size - 1) / world_size))
+		# The ring gives the same sums as torch.distributed.all_reduce().
+		tensor = torch.full((1000003,), float(rank + 1))
+		if rank == 0:
+			print('\tCorrect: {}.'.format(torch.allclose(ring_all_reduce(tensor.clone()), torch.full_like(tensor, world_size * (world_size + 1) / 2))))
+		else:
+			ring_all_reduce(tensor.clone())
+
+	#-----
+	torch.manual_seed(1234)
+	model = torchvision.models.resnet18()
+	inputs, targets = torch.randn(8, 3, 64, 64), torch.randint(0, 1000, (8,))
+	num_bytes = sum(param.numel() * param.element_size() for param in model.parameters())
+
+	def step(sync_fn):
+		model.zero_grad(set_to_none=True)
+		torch.nn.functional.cross_entropy(model(inputs), targets).backward()
+		sync_fn()
+
+	elapsed_time = measure(lambda: step(lambda: None))
+	if rank == 0:
+		print('ResNet-18 ({:.1f} MB of gradients, {} tensors), no synchronization: {:.1f} ms/step.'.format(num_bytes / 1024**2, len(list(model.parameters())), elapsed_time * 1000))
+	elapsed_time = measure(lambda: step(lambda: average_gradients(model)))
+	if rank == 0:
+		print('average_gradients() per parameter: {:.1f} ms/step.'.format(elapsed_time * 1000))
+	for name, all_reduce_fn in [('torch.distributed.all_reduce', torch.distributed.all_reduce), ('ring_all_reduce', ring_all_reduce)]:
+		bucketer = GradientBucketer(model, bucket_cap_mb=25, all_reduce_fn=all_reduce_fn)
+		elapsed_time = measure(lambda: step(bucketer.synchronize))
+		bucketer.close()
+		if rank == 0:
+			print('GradientBucketer with {}: {:.1f} ms/step.'.format(name, elapsed_time * 1000))
+
+def data_partitioner_benchmark():
+	""" Measures the time and the memory to build the partitions of a large dataset, which is given by its length. """
+	import resource
+
+	def measure(fn):
+		# ru_maxrss is the peak so far, so the increase is only seen on the first largest run.
+		start_time, start_rss = time.time(), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		retval = fn()
+		return retval, time.time() - start_time, (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss) / 1024
+
+	world_size = 8
+	partition_sizes = [1.0 / world_size] * world_size
+
+	# A list of Python ints, as in the original partitioner.
+	num_samples = 10**7
+	def build_list():
+		indexes = list(range(num_samples))
+		random.Random(1234).shuffle(indexes)
+		return [indexes[int(sum(partition_sizes[:idx]) * num_samples):int(sum(partition_sizes[:idx + 1]) * num_samples)] for idx in range(world_size)]
+	partitions, elapsed_time, memory = measure(build_list)
+	print('Shuffled list, {} samples: {:.2f} secs, {:.0f} MB.'.format(num_samples, elapsed_time, memory))
+	del partitions
+
+	num_samples = 10**8
+	for name, kwargs in [('Contiguous blocks of 64', dict(block_size=64)), ('Shuffled', dict()), ('Not shuffled', dict(shuffle=False))]:
+		partitioner = DataPartitioner(num_samples, partition_sizes, **kwargs)
+		for epoch in range(2):
+			partitioner.set_epoch(epoch)
+			indices, elapsed_time, memory = measure(lambda: partitioner.get_indices(world_size - 1))
+			print('{}, {} samples, epoch {}: {:.2f} secs, {:.0f} MB, {} samples/partition.'.format(name, num_samples, epoch, elapsed_time, memory, len(indices)))
+
+	# Padded partitions of an epoch are of equal size, and cover all the samples.
+	partitioner = DataPartitioner(1000003, partition_sizes, block_size=64, pad=True)
+	indices = [np.asarray(partitioner.get_indices(rank)) for rank in range(world_size)]
+	print('Equal sizes: {}, all the samples: {}.'.format(len(set(len(idx) for idx in indices)) == 1, len(np.unique(np.concatenate(indices))) == 1000003))
 
 # REF [site] >>
 #	https://github.com/seba-1511/dist_tuto.pth/blob/gh-pages/train_dist.py
@@ -311,6 +606,9 @@ def distributed_tutorial():
 	elif False:
 		run_functor = run_all_reduce
 		use_cuda = True
+	elif False:
+		run_functor = run_all_reduce_benchmark
+		use_cuda = False
 	else:
 		run_functor = run_synchronous_sgd
 		use_cuda = True
@@ -627,6 +925,8 @@ def main():
 	#--------------------
 	#distributed_tutorial()
 
+	#data_partitioner_benchmark()
+
 	# When using mpirun.
 	# NOTE [error] >> RuntimeError: Distributed package doesn't have MPI built in. MPI is only included if you build PyTorch from source on a host that has MPI installed.
 	#mpi_distributed_tutorial()
@@ -18,6 +18,7 @@ def dqn_cart_pole_tutorial():
 	import torch.optim as optim
 	import torch.nn.functional as F
 	import torchvision.transforms as T
+	from replay_buffer_util import ReplayBuffer
 
 	# REF [site] >> https://www.gymlibrary.dev/environments/classic_control/cart_pole/
 	env = gym.make("CartPole-v0").unwrapped
@@ -140,7 +141,18 @@ def dqn_cart_pole_tutorial():
 	target_net.eval()
 
 	optimizer = optim.RMSprop(policy_net.parameters())
-	memory = ReplayMemory(10000)
+	#memory = ReplayMemory(10000)
+	# A prioritized ring buffer of transitions, whose fields are stored in preallocated arrays.
+	#	REF [file] >> ./replay_buffer_util.py
+	# A final next state is stored as zeros, and masked out by done.
+	memory = ReplayBuffer(10000, fields={
+		"state": (init_screen.shape[1:], np.float32),
+		"action": ((), np.int64),
+		"next_state": (init_screen.shape[1:], np.float32),
+		"reward": ((), np.float32),
+		"done": ((), bool),
+	}, alpha=0.6, device=device)
+	BETA_START, BETA_FRAMES = 0.4, 10000  # The exponent of importance-sampling weights is annealed from BETA_START to 1.
 
 	steps_done = 0
 
@@ -181,18 +193,29 @@ def dqn_cart_pole_tutorial():
 	def optimize_model():
 		if len(memory) < BATCH_SIZE:
 			return
-		transitions = memory.sample(BATCH_SIZE)
-		# Transpose the batch (see https://stackoverflow.com/a/19343/3343043 for detailed explanation).
-		# This converts batch-array of Transitions to Transition of batch-arrays.
-		batch = Transition(*zip(*transitions))
-
-		# Compute a mask of non-final states and concatenate the batch elements
-		# (a final state would've been the one after which simulation ended).
-		non_final_mask = torch.tensor(tuple(map(lambda s: s is not None, batch.next_state)), device=device, dtype=torch.bool)
-		non_final_next_states = torch.cat([s for s in batch.next_state if s is not None])
-		state_batch = torch.cat(batch.state)
-		action_batch = torch.cat(batch.action)
-		reward_batch = torch.cat(batch.reward)
+		if False:
+			transitions = memory.sample(BATCH_SIZE)
+			# Transpose the batch (see https://stackoverflow.com/a/19343/3343043 for detailed explanation).
+			# This converts batch-array of Transitions to Transition of batch-arrays.
+			batch = Transition(*zip(*transitions))
+
+			# Compute a mask of non-final states and concatenate the batch elements
+			# (a final state would've been the one after which simulation ended).
+			non_final_mask = torch.tensor(tuple(map(lambda s: s is not None, batch.next_state)), device=device, dtype=torch.bool)
+			non_final_next_states = torch.cat([s for s in batch.next_state if s is not None])
+			state_batch = torch.cat(batch.state)
+			action_batch = torch.cat(batch.action)
+			reward_batch = torch.cat(batch.reward)
+			weights = torch.ones(BATCH_SIZE, device=device)
+		else:
+			# The batch comes as tensors of the fields.
+			batch = memory.sample(BATCH_SIZE, beta=min(1.0, BETA_START + (1.0 - BETA_START) * steps_done / BETA_FRAMES))
+			non_final_mask = ~batch["done"]
+			non_final_next_states = batch["next_state"][non_final_mask]
+			state_batch = batch["state"]
+			action_batch = batch["action"].unsqueeze(1)
+			reward_batch = batch["reward"]
+			weights = batch["weights"]
 
 		# Compute Q(s_t, a) - the model computes Q(s_t), then we select the columns of actions taken.
 		# These are the actions which would've been taken for each batch state according to policy_net.
@@ -206,9 +229,12 @@ def dqn_cart_pole_tutorial():
 		# Compute the expected Q values.
 		expected_state_action_values = (next_state_values * GAMMA) + reward_batch
 
-		# Compute Huber loss.
-		criterion = nn.SmoothL1Loss()
-		loss = criterion(state_action_values, expected_state_action_values.unsqueeze(1))
+		# Compute Huber loss, weighted by the importance-sampling weights.
+		criterion = nn.SmoothL1Loss(reduction="none")
+		loss = (weights.unsqueeze(1) * criterion(state_action_values, expected_state_action_values.unsqueeze(1))).mean()
+		# The TD errors are the new priorities of the sampled transitions.
+		if isinstance(batch, dict):
+			memory.update_priorities(batch["indices"], (expected_state_action_values.unsqueeze(1) - state_action_values).detach().squeeze(1))
 
 		# Optimize the model.
 		optimizer.zero_grad()
@@ -239,7 +265,8 @@ def dqn_cart_pole_tutorial():
 				next_state = None
 
 			# Store the transition in memory.
-			memory.push(state, action, next_state, reward)
+			#memory.push(state, action, next_state, reward)
+			memory.add(state=state.squeeze(0), action=action.item(), next_state=torch.zeros_like(state.squeeze(0)) if next_state is None else next_state.squeeze(0), reward=reward.item(), done=done)
 
 			# Move to the next state.
 			state = next_state
@@ -686,6 +713,7 @@ def ddpg_inverted_pendulum_test():
 	import gym
 	#import gymnasium as gym
 	import matplotlib.pyplot as plt
+	from replay_buffer_util import ReplayBuffer
 
 	device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 	print(f"Device: {device}.")
@@ -748,36 +776,32 @@ def ddpg_inverted_pendulum_test():
 				self.x_prev = np.zeros_like(self.mean)
 
 	# Experience replay
+	#	A prioritized ring buffer of transitions.
+	#	REF [file] >> ./replay_buffer_util.py
 	class Buffer:
-		def __init__(self, buffer_capacity=100000, batch_size=64):
+		def __init__(self, buffer_capacity=100000, batch_size=64, alpha=0.6, beta=0.4):
 			# Number of "experiences" to store at max
 			self.buffer_capacity = buffer_capacity
 			# Num of tuples to train on.
 			self.batch_size = batch_size
-
-			# Its tells us num of times record() was called
-			self.buffer_counter = 0
-
-			# Instead of list of tuples as the exp.replay concept go
-			# We use different np.arrays for each tuple element
-			self.state_buffer = np.zeros((self.buffer_capacity, num_states))
-			self.action_buffer = np.zeros((self.buffer_capacity, num_actions))
-			self.reward_buffer = np.zeros((self.buffer_capacity, 1))
-			self.next_state_buffer = np.zeros((self.buffer_capacity, num_states))
+			# The exponent of importance-sampling weights.
+			self.beta = beta
+
+			# One preallocated array per tuple element, e.g. states of shape (buffer_capacity, num_states).
+			# Batches are sampled in proportion to the TD errors of the critic, and come out as tensors.
+			self.replay_buffer = ReplayBuffer(buffer_capacity, fields={
+				"state": ((num_states,), np.float32),
+				"action": ((num_actions,), np.float32),
+				"reward": ((1,), np.float32),
+				"next_state": ((num_states,), np.float32),
+			}, alpha=alpha, device=device)
 
 		# Takes (s, a, r, s') obervation tuple as input
 		def record(self, obs_tuple):
-			# Set index to zero if buffer_capacity is exceeded, replacing old records
-			index = self.buffer_counter % self.buffer_capacity
-
-			self.state_buffer[index] = obs_tuple[0]
-			self.action_buffer[index] = obs_tuple[1]
-			self.reward_buffer[index] = obs_tuple[2]
-			self.next_state_buffer[index] = obs_tuple[3]
-
-			self.buffer_counter += 1
+			# Replaces the oldest record if buffer_capacity is exceeded.
+			self.replay_buffer.add(state=obs_tuple[0], action=np.reshape(obs_tuple[1], -1), reward=np.reshape(obs_tuple[2], -1), next_state=obs_tuple[3])
 
-		def update(self, state_batch, action_batch, reward_batch, next_state_batch):
+		def update(self, state_batch, action_batch, reward_batch, next_state_batch, weights=None):
 			# Training and updating Actor & Critic networks.
 			# See Pseudo Code in the paper.
 
@@ -798,8 +822,12 @@ def ddpg_inverted_pendulum_test():
 				y = reward_batch + gamma * target_critic(next_state_batch, target_actions)
 			critic_value = critic_model(state_batch, action_batch)
 
-			critic_loss = critic_loss_function(y, critic_value)
-			#critic_loss = torch.mean(torch.square(y - critic_value))
+			if weights is None:
+				critic_loss = critic_loss_function(y, critic_value)
+				#critic_loss = torch.mean(torch.square(y - critic_value))
+			else:
+				# Weighted by the importance-sampling weights of prioritized replay.
+				critic_loss = torch.mean(weights.to(device).unsqueeze(1) * torch.square(y - critic_value))
 			critic_loss.backward()
 			critic_optimizer.step()
 
@@ -816,20 +844,16 @@ def ddpg_inverted_pendulum_test():
 			actor_loss.backward()
 			actor_optimizer.step()
 
+			# TD errors.
+			return (y - critic_value).detach()
+
 		# We compute the loss and update parameters
 		def learn(self):
-			# Get sampling range
-			record_range = min(self.buffer_counter, self.buffer_capacity)
-			# Randomly sample indices
-			batch_indices = np.random.choice(record_range, self.batch_size)
-
-			# Convert to tensors
-			state_batch = torch.tensor(self.state_buffer[batch_indices], dtype=torch.float32)
-			action_batch = torch.tensor(self.action_buffer[batch_indices], dtype=torch.float32)
-			reward_batch = torch.tensor(self.reward_buffer[batch_indices], dtype=torch.float32)
-			next_state_batch = torch.tensor(self.next_state_buffer[batch_indices], dtype=torch.float32)
+			# Sample a batch of tensors
+			batch = self.replay_buffer.sample(self.batch_size, beta=self.beta)
 
-			self.update(state_batch, action_batch, reward_batch, next_state_batch)
+			td_errors = self.update(batch["state"], batch["action"], batch["reward"], batch["next_state"], batch["weights"])
+			self.replay_buffer.update_priorities(batch["indices"], td_errors)
 
 	# This update target parameters slowly
 	# Based on rate `tau`, which is much less than one.
@@ -1061,6 +1085,86 @@ def ddpg_inverted_pendulum_test():
 	#env.render()
 	env.close()
 
+def _add_transitions(replay_buffer, num_steps, batch_size, seed):
+	import numpy as np
+
+	# An actor which adds batches of random transitions, e.g. from vectorized environments.
+	rng = np.random.default_rng(seed)
+	for _ in range(num_steps):
+		replay_buffer.add_batch(**{name: rng.random((batch_size,) + shape).astype(dtype) for name, (shape, dtype) in replay_buffer.fields.items()})
+	replay_buffer.close()
+
+def replay_buffer_benchmark():
+	import time, random, multiprocessing
+	from collections import namedtuple, deque
+	import numpy as np
+	import torch
+	from replay_buffer_util import ReplayBuffer
+
+	capacity = 10**6
+	batch_size = 256
+	num_steps = 2000
+	num_states, num_actions = 3, 1  # Pendulum-v1.
+	fields = {
+		"state": ((num_states,), np.float32),
+		"action": ((num_actions,), np.float32),
+		"reward": ((1,), np.float32),
+		"next_state": ((num_states,), np.float32),
+	}
+	rng = np.random.default_rng(1234)
+	data = {name: rng.random((capacity,) + shape).astype(dtype) for name, (shape, dtype) in fields.items()}
+
+	def measure(step):
+		step()  # Warm-up.
+		start_time = time.time()
+		for _ in range(num_steps):
+			step()
+		return num_steps / (time.time() - start_time)
+
+	# A deque of tuples of tensors, as ReplayMemory in dqn_cart_pole_tutorial().
+	Transition = namedtuple("Transition", tuple(fields))
+	memory = deque([], maxlen=capacity)
+	start_time = time.time()
+	for transition in zip(*(torch.from_numpy(array).unsqueeze(1) for array in data.values())):
+		memory.append(Transition(*transition))
+	print(f"deque of tuples: filled in {time.time() - start_time:.2f} secs.")
+	def deque_step():
+		batch = Transition(*zip(*random.sample(memory, batch_size)))
+		return [torch.cat(field) for field in batch]
+	print(f"deque of tuples, uniform sampling: {measure(deque_step):.0f} steps/sec.")
+	del memory
+
+	# NumPy arrays indexed by np.random.choice(), as Buffer in ddpg_inverted_pendulum_test() used to be.
+	def arrays_step():
+		batch_indices = np.random.choice(capacity, batch_size)
+		return [torch.tensor(array[batch_indices], dtype=torch.float32) for array in data.values()]
+	print(f"Arrays, uniform sampling: {measure(arrays_step):.0f} steps/sec.")
+
+	for alpha in [0.0, 0.6]:
+		replay_buffer = ReplayBuffer(capacity, fields, alpha=alpha)
+		start_time = time.time()
+		for start in range(0, capacity, 10000):
+			replay_buffer.add_batch(**{name: array[start:start + 10000] for name, array in data.items()})
+		print(f"ReplayBuffer (alpha = {alpha}): filled in {time.time() - start_time:.2f} secs.")
+		def replay_buffer_step():
+			batch = replay_buffer.sample(batch_size)
+			# Random TD errors in place of those of a critic.
+			replay_buffer.update_priorities(batch["indices"], rng.random(batch_size))
+		print(f"ReplayBuffer (alpha = {alpha}), sample + update_priorities: {measure(replay_buffer_step):.0f} steps/sec.")
+
+	# Actor processes add transitions to a shared buffer while the learner samples from it.
+	num_actors = 2
+	context = multiprocessing.get_context("spawn")
+	with ReplayBuffer(capacity, fields, alpha=0.6, shared=True, context=context) as replay_buffer:
+		replay_buffer.add_batch(**{name: array[:batch_size] for name, array in data.items()})
+		actors = [context.Process(target=_add_transitions, args=(replay_buffer, 1000, 64, seed)) for seed in range(num_actors)]
+		for actor in actors:
+			actor.start()
+		steps_per_sec = measure(replay_buffer_step)
+		for actor in actors:
+			actor.join()
+		print(f"Shared ReplayBuffer (alpha = 0.6) with {num_actors} actors, sample + update_priorities: {steps_per_sec:.0f} steps/sec, {len(replay_buffer)} transitions.")
+
 def main():
 	# Value-function-based algorithm
 
@@ -1068,6 +1172,10 @@ def main():
 	#dqn_cart_pole_tutorial()  # More structured implementation
 	#dqn_atari_breakout_test()  # Naive low-level implementation
 
+	# Experience replay.
+	#	REF [file] >> ./replay_buffer_util.py
+	#replay_buffer_benchmark()
+
 	#-----
 	# Policy gradient algorithm
 
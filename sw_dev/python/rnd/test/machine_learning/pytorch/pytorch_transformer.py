@@ -34,10 +34,11 @@ class PositionalEncoding(torch.nn.Module):
 		pe[:, 0, 1::2] = torch.cos(position * div_term)
 		self.register_buffer("pe", pe)
 
-	def forward(self, x: torch.Tensor) -> torch.Tensor:
+	def forward(self, x: torch.Tensor, offset: int = 0) -> torch.Tensor:
 		r"""Inputs of forward function
 		Args:
 			x: the sequence fed to the positional encoder model (required).
+			offset: the position of the first element of x, e.g. the number of cached positions in incremental decoding (default=0).
 		Shape:
 			x: [sequence length, batch size, embedding dim]
 			output: [sequence length, batch size, embedding dim]
@@ -45,7 +46,7 @@ class PositionalEncoding(torch.nn.Module):
 			>>> output = pos_encoder(x)
 		"""
 
-		x = x + self.pe[:x.size(0)]
+		x = x + self.pe[offset:offset + x.size(0)]
 		return self.dropout(x)
 
 class StandardTransformerModel(torch.nn.Module):
@@ -146,6 +147,65 @@ class TransformerModel(torch.nn.Module):
 		#output = torch.nn.functional.logsigmoid(output)
 		return output
 
+class KVCache(object):
+	"""Preallocated keys and values of the self-attention layers of a decoder-only transformer for incremental decoding.
+
+	keys and values are [num_layers, batch size, num heads, max length, head dim], and are written in place.
+	length is the number of cached positions, which is advanced by the model after all the layers have processed a step.
+	"""
+
+	def __init__(self, num_layers: int, batch_size: int, num_heads: int, head_dim: int, max_len: int, dtype: typing.Optional[torch.dtype] = None, device=None):
+		self.keys = torch.empty(num_layers, batch_size, num_heads, max_len, head_dim, dtype=dtype, device=device)
+		self.values = torch.empty_like(self.keys)
+		self.max_len = max_len
+		self.length = 0
+
+	def attend(self, self_attn: torch.nn.MultiheadAttention, x: torch.Tensor, layer_idx: int) -> torch.Tensor:
+		"""Self-attention of new positions x over themselves and all the cached positions, which appends the keys and values of x to the cache.
+
+		It computes the same as self_attn(x, x, x, attn_mask=<causal mask>, need_weights=False)[0] over the whole sequence, but only for the positions of x.
+		x: [new length, batch size, embedding dim], or [batch size, new length, embedding dim] if self_attn.batch_first.
+		"""
+		if self_attn.batch_first:
+			x = x.transpose(0, 1)
+		seq_len, batch_size, embed_dim = x.shape
+		start, end = self.length, self.length + seq_len
+		if end > self.max_len:
+			raise ValueError("KV cache overflow: {} > {}.".format(end, self.max_len))
+
+		# [seq len, batch size, 3 * embed dim] -> 3 x [batch size, num heads, seq len, head dim].
+		q, k, v = torch.nn.functional.linear(x, self_attn.in_proj_weight, self_attn.in_proj_bias).view(seq_len, batch_size, 3, self_attn.num_heads, self_attn.head_dim).permute(2, 1, 3, 0, 4)
+		self.keys[layer_idx, :, :, start:end] = k
+		self.values[layer_idx, :, :, start:end] = v
+
+		# A new position attends to all the cached positions and to the new positions up to itself.
+		attn_mask = None if seq_len == 1 else torch.ones(seq_len, end, dtype=torch.bool, device=x.device).tril(diagonal=start)
+		x = torch.nn.functional.scaled_dot_product_attention(
+			q, self.keys[layer_idx, :, :, :end], self.values[layer_idx, :, :, :end],
+			attn_mask=attn_mask, dropout_p=self_attn.dropout if self_attn.training else 0.0
+		)
+		x = self_attn.out_proj(x.permute(2, 0, 1, 3).reshape(seq_len, batch_size, embed_dim))
+		return x.transpose(0, 1) if self_attn.batch_first else x
+
+def sample_next_tokens(logits: torch.Tensor, temperature: float = 1.0, top_k: typing.Optional[int] = None, top_p: typing.Optional[float] = None, generator: typing.Optional[torch.Generator] = None) -> torch.Tensor:
+	"""Samples a token per row of logits ([batch size, num tokens]), restricted to the top-k tokens and to the smallest set of tokens whose probability is at least top-p.
+
+	A temperature of 0 selects the most probable tokens.
+	"""
+	if temperature == 0:
+		return logits.argmax(dim=-1)
+	logits = logits / temperature
+	if top_k is not None and top_k < logits.size(-1):
+		kth_logits = logits.topk(top_k, dim=-1).values[..., -1:]
+		logits = logits.masked_fill(logits < kth_logits, float("-inf"))
+	if top_p is not None and top_p < 1.0:
+		sorted_logits, sorted_indices = logits.sort(dim=-1, descending=True)
+		sorted_probs = sorted_logits.softmax(dim=-1)
+		# A token is removed if the tokens more probable than it already reach top-p, so the most probable one is always kept.
+		is_removed = (sorted_probs.cumsum(dim=-1) - sorted_probs) >= top_p
+		logits = logits.masked_fill(is_removed.scatter(-1, sorted_indices, is_removed), float("-inf"))
+	return torch.multinomial(logits.softmax(dim=-1), num_samples=1, generator=generator).squeeze(-1)
+
 # REF [class] >> TransformerDecoderLayer class in https://github.com/pytorch/pytorch/blob/master/torch/nn/modules/transformer.py.
 class DecoderOnlyTransformerLayer(torch.nn.Module):
 	__constants__ = ["batch_first", "norm_first"]
@@ -185,16 +245,18 @@ class DecoderOnlyTransformerLayer(torch.nn.Module):
 	#def forward(self, tgt: torch.Tensor, memory: torch.Tensor, tgt_mask: typing.Optional[torch.Tensor] = None, memory_mask: typing.Optional[torch.Tensor] = None,
 	#			tgt_key_padding_mask: typing.Optional[torch.Tensor] = None, memory_key_padding_mask: typing.Optional[torch.Tensor] = None) -> torch.Tensor:
 	def forward(self, tgt: torch.Tensor, tgt_mask: typing.Optional[torch.Tensor] = None,
-				tgt_key_padding_mask: typing.Optional[torch.Tensor] = None) -> torch.Tensor:
+				tgt_key_padding_mask: typing.Optional[torch.Tensor] = None,
+				kv_cache: typing.Optional[KVCache] = None, layer_idx: int = 0) -> torch.Tensor:
 		# See Fig. 1 of https://arxiv.org/pdf/2002.04745v1.pdf
+		# If kv_cache is given, tgt is only the positions which follow the cached ones, and tgt_mask and tgt_key_padding_mask are ignored.
 
 		x = tgt
 		if self.norm_first:
-			x = x + self._sa_block(self.norm1(x), tgt_mask, tgt_key_padding_mask)
+			x = x + self._sa_block(self.norm1(x), tgt_mask, tgt_key_padding_mask, kv_cache, layer_idx)
 			#x = x + self._mha_block(self.norm2(x), memory, memory_mask, memory_key_padding_mask)
 			x = x + self._ff_block(self.norm3(x))
 		else:
-			x = self.norm1(x + self._sa_block(x, tgt_mask, tgt_key_padding_mask))
+			x = self.norm1(x + self._sa_block(x, tgt_mask, tgt_key_padding_mask, kv_cache, layer_idx))
 			#x = self.norm2(x + self._mha_block(x, memory, memory_mask, memory_key_padding_mask))
 			x = self.norm3(x + self._ff_block(x))
 
@@ -202,7 +264,10 @@ class DecoderOnlyTransformerLayer(torch.nn.Module):
 
 	# Self-attention block.
 	def _sa_block(self, x: torch.Tensor,
-				attn_mask: typing.Optional[torch.Tensor], key_padding_mask: typing.Optional[torch.Tensor]) -> torch.Tensor:
+				attn_mask: typing.Optional[torch.Tensor], key_padding_mask: typing.Optional[torch.Tensor],
+				kv_cache: typing.Optional[KVCache] = None, layer_idx: int = 0) -> torch.Tensor:
+		if kv_cache is not None:
+			return self.dropout1(kv_cache.attend(self.self_attn, x, layer_idx))
 		x = self.self_attn(x, x, x,
 						attn_mask=attn_mask,
 						key_padding_mask=key_padding_mask,
@@ -248,17 +313,18 @@ class DecoderOnlyTransformerDecoder(torch.nn.Module):
 	#			memory_mask: typing.Optional[torch.Tensor] = None, tgt_key_padding_mask: typing.Optional[torch.Tensor] = None,
 	#			memory_key_padding_mask: typing.Optional[torch.Tensor] = None) -> torch.Tensor:
 	def forward(self, tgt: torch.Tensor, tgt_mask: typing.Optional[torch.Tensor] = None,
-				tgt_key_padding_mask: typing.Optional[torch.Tensor] = None) -> torch.Tensor:
+				tgt_key_padding_mask: typing.Optional[torch.Tensor] = None,
+				kv_cache: typing.Optional[KVCache] = None) -> torch.Tensor:
 		output = tgt
 
-		for mod in self.layers:
+		for layer_idx, mod in enumerate(self.layers):
 			"""
 			output = mod(output, memory, tgt_mask=tgt_mask,
 						memory_mask=memory_mask,
 						tgt_key_padding_mask=tgt_key_padding_mask,
 						memory_key_padding_mask=memory_key_padding_mask)
 			"""
-			output = mod(output, tgt_mask=tgt_mask, tgt_key_padding_mask=tgt_key_padding_mask)
+			output = mod(output, tgt_mask=tgt_mask, tgt_key_padding_mask=tgt_key_padding_mask, kv_cache=kv_cache, layer_idx=layer_idx)
 
 		if self.norm is not None:
 			output = self.norm(output)
@@ -310,6 +376,63 @@ class DecoderOnlyTransformerModel(torch.nn.Module):
 		#output = torch.nn.functional.logsigmoid(output)
 		return output
 
+	def make_kv_cache(self, batch_size: int, max_len: int, device=None) -> KVCache:
+		layers = self.transformer_decoder.layers
+		self_attn = layers[0].self_attn
+		return KVCache(len(layers), batch_size, self_attn.num_heads, self_attn.head_dim, max_len, dtype=self.emb.weight.dtype, device=device)
+
+	def forward_incrementally(self, src: torch.Tensor, kv_cache: KVCache) -> torch.Tensor:
+		"""Computes the outputs of the positions of src, which follow the positions cached in kv_cache, and caches them.
+
+		src: [seq len, batch size]. output: [seq len, batch size, num tokens].
+		"""
+		x = self.emb(src) * self.sqrt_d_model
+		x = self.pos_encoder(x, offset=kv_cache.length)
+		if isinstance(self.transformer_decoder, DecoderOnlyTransformerDecoder):
+			x = self.transformer_decoder(x, kv_cache=kv_cache)
+		else:
+			# torch.nn.TransformerEncoder, whose layers cannot take a cache, so they are run here.
+			for layer_idx, layer in enumerate(self.transformer_decoder.layers):
+				sa_block = lambda x: layer.dropout1(kv_cache.attend(layer.self_attn, x, layer_idx))
+				if layer.norm_first:
+					x = x + sa_block(layer.norm1(x))
+					x = x + layer._ff_block(layer.norm2(x))
+				else:
+					x = layer.norm1(x + sa_block(x))
+					x = layer.norm2(x + layer._ff_block(x))
+			if self.transformer_decoder.norm is not None:
+				x = self.transformer_decoder.norm(x)
+		kv_cache.length += src.size(0)
+		return self.generator(x)
+
+	@torch.no_grad()
+	def generate(self, prompt: torch.Tensor, max_new_tokens: int, temperature: float = 1.0, top_k: typing.Optional[int] = None, top_p: typing.Optional[float] = None,
+				eos_token: typing.Optional[int] = None, generator: typing.Optional[torch.Generator] = None) -> typing.Iterator[torch.Tensor]:
+		"""Yields a batch of generated tokens ([batch size]) per step, continuing prompt ([prompt len, batch size]).
+
+		The prompt is processed in one pass, and then each step processes only the last tokens, attending to the preallocated KV cache of the previous ones.
+		A sequence which has generated eos_token keeps generating it, and generation stops when all the sequences have.
+		See sample_next_tokens() for temperature, top_k, and top_p.
+		"""
+		prompt_len, batch_size = prompt.shape
+		# The last generated tokens are not fed back.
+		kv_cache = self.make_kv_cache(batch_size, prompt_len + max_new_tokens - 1, device=prompt.device)
+		if kv_cache.max_len > self.pos_encoder.pe.size(0):
+			raise ValueError("Too long sequences: {} > {}.".format(kv_cache.max_len, self.pos_encoder.pe.size(0)))
+
+		is_finished = torch.zeros(batch_size, dtype=torch.bool, device=prompt.device)
+		tokens = prompt
+		for step in range(max_new_tokens):
+			logits = self.forward_incrementally(tokens, kv_cache)[-1]  # [batch size, num tokens].
+			tokens = sample_next_tokens(logits, temperature, top_k, top_p, generator)
+			if eos_token is not None:
+				tokens = tokens.masked_fill(is_finished, eos_token)
+				is_finished |= tokens == eos_token
+			yield tokens
+			if eos_token is not None and is_finished.all():
+				break
+			tokens = tokens.unsqueeze(0)
+
 # REF [function] >> transformer_tutorial().
 def standard_transformer_test():
 	# NOTE [info] >> Not-so-good example for encoder-decoder transformer models.
@@ -934,6 +1057,45 @@ def decoder_based_transformer_test():
 	print(f"| End of training | test loss {test_loss:5.2f} | test ppl {test_ppl:8.2f}")
 	print("=" * 89)
 
+def kv_cache_generation_test():
+	device = torch.device("cpu")
+	torch.manual_seed(0)
+
+	num_tokens, dim_model, num_heads, dim_ff, num_layers = 10000, 256, 4, 1024, 4
+	model = DecoderOnlyTransformerModel(num_tokens, dim_model, num_heads, dim_ff, num_layers, dropout=0.1).to(device)
+	model.eval()
+
+	batch_size, prompt_len, max_new_tokens, bucket_size = 4, 8, 1024, 128
+	prompt = torch.randint(0, num_tokens, (prompt_len, batch_size), device=device)
+
+	#-----
+	# Streaming generation, sampling from the top-k tokens within top-p.
+	start_time = time.time()
+	latencies = list()
+	for tokens in model.generate(prompt, max_new_tokens, temperature=0.8, top_k=50, top_p=0.95):
+		latencies.append(time.time() - start_time)
+		start_time = time.time()
+	print("Generation with a KV cache:")
+	for start in range(0, len(latencies), bucket_size):
+		print(f"\tContext length {prompt_len + start:5d}-{prompt_len + start + bucket_size - 1:5d}: {sum(latencies[start:start + bucket_size]) * 1000 / len(latencies[start:start + bucket_size]):.2f} ms/token.")
+
+	#-----
+	# Generation without a cache, which runs the whole sequence at every step.
+	max_new_tokens = 512
+	print("Generation without a cache:")
+	with torch.no_grad():
+		seq = prompt
+		latencies = list()
+		for _ in range(max_new_tokens):
+			start_time = time.time()
+			seq_len = seq.size(0)
+			src_mask = torch.triu(torch.ones(seq_len, seq_len, device=device) * float("-inf"), diagonal=1)
+			logits = model(seq, src_mask)[-1]
+			seq = torch.cat([seq, sample_next_tokens(logits, temperature=0.8, top_k=50, top_p=0.95).unsqueeze(0)], dim=0)
+			latencies.append(time.time() - start_time)
+	for start in range(0, len(latencies), bucket_size):
+		print(f"\tContext length {prompt_len + start:5d}-{prompt_len + start + bucket_size - 1:5d}: {sum(latencies[start:start + bucket_size]) * 1000 / len(latencies[start:start + bucket_size]):.2f} ms/token.")
+
 # REF [site] >> https://pytorch.org/hub/huggingface_pytorch-transformers/
 def huggingface_pytorch_transformers_test():
 	import transformers
@@ -1528,6 +1690,7 @@ def main():
 	#	Decoder-only transformer model = transformer model architecture in a decoder-only setup.
 
 	#decoder_based_transformer_test()  # Encoder-only or decoder-only transformer model.
+	#kv_cache_generation_test()  # Streaming generation with a KV cache by a decoder-only transformer model.
 
 	#-----
 	# PyTorch-Transformers.
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Array-backed experience replay for off-policy RL, e.g. DQN and DDPG.
+#	- Transitions are stored field by field in preallocated ring arrays, e.g. states of shape (capacity, *state_shape), instead of as tuples of tensors.
+#		So adding a transition copies it into the arrays, and sampling a batch is one gather per field into a tensor.
+#	- Prioritized sampling draws transitions with probabilities proportional to their priorities, (|TD error| + epsilon)^alpha.
+#		The priorities are kept in a sum-tree, so a batch is sampled, and the priorities of a batch are updated, in O(batch size * log(capacity)).
+#		Sampling is stratified: the total priority is split into batch_size equal segments, and one transition is drawn from each segment.
+#		Importance-sampling weights, (N * P(i))^-beta normalized by their maximum in the batch, correct the bias of prioritized sampling.
+#	- With shared=True, the arrays and the sum-tree are allocated in one block of shared memory, so actor processes can add transitions to the buffer of a learner process.
+#		The buffer is pickled by the name of the block. It has to be created in the learner process, and passed to actor processes as an argument of multiprocessing.Process.
+# REF [paper] >> "Prioritized Experience Replay", ICLR 2016.
+# REF [site] >>
+#	https://docs.python.org/3/library/multiprocessing.shared_memory.html
+#	https://pytorch.org/tutorials/intermediate/reinforcement_q_learning.html
+
+import math, contextlib, multiprocessing
+import multiprocessing.shared_memory
+import numpy as np
+import torch
+
+_ALIGNMENT = 64
+
+class SumTree(object):
+	"""A complete binary tree over an array of priorities, in which each node holds the sum of its children.
+
+	tree is a float64 array of 2 * capacity rounded up to a power of two. Node 1 is the root, and node i has children 2i and 2i + 1.
+	All the operations are vectorized over a batch of leaves.
+	"""
+
+	def __init__(self, capacity, tree=None):
+		self.capacity = capacity
+		self.num_leaves = 1 << max(capacity - 1, 0).bit_length()
+		self.depth = self.num_leaves.bit_length() - 1
+		self.tree = np.zeros(2 * self.num_leaves, dtype=np.float64) if tree is None else tree
+
+	@staticmethod
+	def get_tree_size(capacity):
+		return 2 * (1 << max(capacity - 1, 0).bit_length())
+
+	@property
+	def total(self):
+		return self.tree[1]
+
+	def get(self, indices):
+		return self.tree[self.num_leaves + indices]
+
+	def update(self, indices, priorities):
+		"""Sets the priorities of leaves, and recomputes the sums of their ancestors from their children, so that no rounding errors accumulate."""
+		nodes = self.num_leaves + np.asarray(indices, dtype=np.int64)
+		self.tree[nodes] = priorities
+		# The parents of sorted nodes are sorted, so duplicates are adjacent, and removed without sorting again.
+		nodes = np.unique(nodes // 2)
+		for _ in range(self.depth):
+			self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+			nodes = nodes // 2
+			nodes = nodes[np.concatenate(([True], nodes[1:] != nodes[:-1]))]
+
+	def find(self, values):
+		"""Returns the leaves at which the prefix sums of the priorities reach values in [0, total)."""
+		values = np.array(values, dtype=np.float64)
+		nodes = np.ones(len(values), dtype=np.int64)
+		for _ in range(self.depth):
+			left_sums = self.tree[2 * nodes]
+			go_right = values >= left_sums
+			values -= np.where(go_right, left_sums, 0.0)
+			nodes = 2 * nodes + go_right
+		return nodes - self.num_leaves
+
+class ReplayBuffer(object):
+	"""A ring buffer of transitions with uniform or prioritized sampling.
+
+	fields maps the name of each field of a transition to its (shape, dtype), e.g. {"state": ((3,), np.float32), "action": ((), np.int64)}.
+	If alpha is 0, transitions are sampled uniformly, and no sum-tree is kept.
+	New transitions get the maximum priority so far, so that every transition is sampled at least once with high probability.
+	"""
+
+	def __init__(self, capacity, fields, alpha=0.6, epsilon=1e-6, device="cpu", shared=False, context=None):
+		self.capacity = capacity
+		self.fields = {name: (tuple(shape), np.dtype(dtype)) for name, (shape, dtype) in fields.items()}
+		self.alpha = alpha
+		self.epsilon = epsilon
+		self.device = torch.device(device)
+
+		# Layout: (name, shape, dtype) of the arrays in one block of memory.
+		self._layout = [(name, (capacity,) + shape, dtype) for name, (shape, dtype) in self.fields.items()]
+		self._layout.append(("_state", (2,), np.dtype(np.int64)))  # The next position, and the size.
+		self._layout.append(("_max_priority", (1,), np.dtype(np.float64)))
+		if self.alpha > 0:
+			self._layout.append(("_tree", (SumTree.get_tree_size(capacity),), np.dtype(np.float64)))
+		self._offsets, offset = list(), 0
+		for _, shape, dtype in self._layout:
+			offset = (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+			self._offsets.append(offset)
+			offset += math.prod(shape) * dtype.itemsize
+
+		if shared:
+			context = context or multiprocessing.get_context()
+			self._shm = multiprocessing.shared_memory.SharedMemory(create=True, size=max(offset, 1))
+			self._shm.buf[:offset] = bytes(offset)
+			self._is_owner = True
+			self._lock = context.Lock()
+		else:
+			self._shm, self._is_owner = None, False
+			self._buffer = bytearray(max(offset, 1))
+			self._lock = None
+		self._map_arrays()
+		self._max_priority[0] = 1.0
+
+	def __getstate__(self):
+		if self._shm is None:
+			raise TypeError("Only a shared ReplayBuffer can be passed to other processes.")
+		state = {key: value for key, value in self.__dict__.items() if key not in ("_arrays", "_state", "_max_priority", "_tree")}
+		state["_shm"] = self._shm.name
+		state["_is_owner"] = False
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._shm = multiprocessing.shared_memory.SharedMemory(name=state["_shm"])
+		self._map_arrays()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def __len__(self):
+		return int(self._state[1])
+
+	def _map_arrays(self):
+		buf = self._buffer if self._shm is None else self._shm.buf
+		arrays = {name: np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset) for (name, shape, dtype), offset in zip(self._layout, self._offsets)}
+		self._state = arrays.pop("_state")
+		self._max_priority = arrays.pop("_max_priority")
+		self._tree = SumTree(self.capacity, arrays.pop("_tree")) if "_tree" in arrays else None
+		self._arrays = arrays
+
+	def _locked(self):
+		return contextlib.nullcontext() if self._lock is None else self._lock
+
+	def add(self, **transition):
+		"""Adds a transition, whose fields are arrays, tensors, or scalars."""
+		self.add_batch(**{name: np.expand_dims(_to_numpy(value), 0) for name, value in transition.items()})
+
+	def add_batch(self, **transitions):
+		"""Adds transitions, whose fields are arrays or tensors of a batch, with the batch dimension first."""
+		if set(transitions) != set(self._arrays):
+			raise ValueError("Invalid fields: {} != {}.".format(sorted(transitions), sorted(self._arrays)))
+		transitions = {name: _to_numpy(value) for name, value in transitions.items()}
+		batch_size = len(next(iter(transitions.values())))
+		if batch_size > self.capacity:
+			# Only the last capacity transitions would be kept.
+			transitions = {name: value[-self.capacity:] for name, value in transitions.items()}
+			batch_size = self.capacity
+		with self._locked():
+			position, size = int(self._state[0]), int(self._state[1])
+			indices = (position + np.arange(batch_size)) % self.capacity
+			for name, value in transitions.items():
+				self._arrays[name][indices] = value
+			if self._tree is not None:
+				self._tree.update(indices, self._max_priority[0])
+			self._state[0] = (position + batch_size) % self.capacity
+			self._state[1] = min(size + batch_size, self.capacity)
+
+	def sample(self, batch_size, beta=0.4, rng=None):
+		"""Samples a batch of transitions.
+
+		Returns a dict of the fields as tensors on device, with "indices" of the transitions for update_priorities(), and importance-sampling "weights".
+		The weights are all 1 for uniform sampling.
+		"""
+		rng = np.random.default_rng() if rng is None else rng
+		with self._locked():
+			size = int(self._state[1])
+			if size == 0:
+				raise ValueError("Empty replay buffer.")
+			if self._tree is None:
+				indices = rng.integers(size, size=batch_size)
+				weights = np.ones(batch_size, dtype=np.float32)
+			else:
+				total = self._tree.total
+				values = (np.arange(batch_size) + rng.random(batch_size)) * (total / batch_size)
+				# Rounding can lead the search past the last transition, into the empty leaves.
+				indices = np.minimum(self._tree.find(np.minimum(values, np.nextafter(total, 0))), size - 1)
+				probs = self._tree.get(indices) / total
+				weights = (size * probs) ** -beta
+				weights = (weights / weights.max()).astype(np.float32)
+			batch = {name: torch.from_numpy(array[indices]) for name, array in self._arrays.items()}
+		batch["indices"] = torch.from_numpy(indices)
+		batch["weights"] = torch.from_numpy(weights)
+		if self.device.type != "cpu":
+			batch = {name: value.pin_memory().to(self.device, non_blocking=True) for name, value in batch.items()}
+		return batch
+
+	def update_priorities(self, indices, errors):
+		"""Sets the priorities of sampled transitions from their errors, e.g. TD errors."""
+		if self._tree is None:
+			return
+		priorities = (np.abs(_to_numpy(errors).astype(np.float64).reshape(-1)) + self.epsilon) ** self.alpha
+		with self._locked():
+			self._tree.update(_to_numpy(indices), priorities)
+			self._max_priority[0] = max(self._max_priority[0], priorities.max())
+
+	def close(self):
+		if self._shm is not None:
+			# The arrays are views of the block, which cannot be closed while they are alive.
+			self._arrays, self._state, self._max_priority, self._tree = dict(), None, None, None
+			self._shm.close()
+			if self._is_owner:
+				self._shm.unlink()
+			self._shm = None
+
+def _to_numpy(value):
+	if torch.is_tensor(value):
+		return value.detach().cpu().numpy()
+	return np.asarray(value)
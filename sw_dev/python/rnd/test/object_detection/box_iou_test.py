@@ -3,6 +3,7 @@
 
 import functools,time
 import torch, torchvision
+import box_iou_util
 
 def box_iou_test():
 	box_mode = "xyxy"
@@ -122,10 +123,62 @@ def box_iou_loss_test():
 	print(f"{box_iou_losses=}.")
 	print(f"{box_iou_losses.nanmean().item()=}.")
 
+def generate_random_boxes(num_boxes, image_size=1000, max_box_size=100):
+	xy = torch.rand(num_boxes, 2) * image_size
+	wh = torch.rand(num_boxes, 2) * max_box_size + 1
+	return torch.cat([xy, xy + wh], dim=-1)  # (x1, y1, x2, y2).
+
+def chunked_box_iou_benchmark():
+	torch.manual_seed(37)
+
+	k, threshold = 5, 0.5
+	memory_budget = 256 * 1024**2  # 256 MB.
+	box_iou_functors = {
+		"iou": torchvision.ops.box_iou,
+		"giou": torchvision.ops.generalized_box_iou,
+		"diou": functools.partial(torchvision.ops.distance_box_iou, eps=1e-07),
+		"ciou": functools.partial(torchvision.ops.complete_box_iou, eps=1e-07),
+	}
+
+	max_dense_matrix_size = 256 * 1024**2  # Max. #elements of the dense matrices.
+
+	for num_gts, num_preds in [(1000, 10000), (2000, 50000), (50000, 500000)]:
+		gt_boxes = generate_random_boxes(num_gts, image_size=10000)
+		pred_boxes = generate_random_boxes(num_preds, image_size=10000)
+		print(f"#ground-truth boxes = {num_gts}, #predicted boxes = {num_preds}:")
+
+		for mode, box_iou_functor in box_iou_functors.items():
+			if num_gts * num_preds > max_dense_matrix_size:
+				# The dense (50000, 500000) matrix takes 100 GB.
+				start_time = time.time()
+				rows, cols, match_scores = box_iou_util.chunked_box_iou_topk(gt_boxes, pred_boxes, k=k, threshold=threshold, mode=mode, memory_budget=memory_budget)
+				print(f"\t{mode}: chunked = {time.time() - start_time} sec ({memory_budget / 1024**2:.1f} MB budget), #matches = {len(match_scores)}.")
+				continue
+
+			# Dense torchvision path: (N, M) matrix + top-k.
+			start_time = time.time()
+			scores = box_iou_functor(gt_boxes, pred_boxes)
+			top_scores, top_indices = scores.topk(k, dim=1)
+			is_valid = top_scores >= threshold
+			dense_elapsed_time = time.time() - start_time
+			dense_num_matches = is_valid.sum().item()
+			del scores
+
+			# Tiled path under the memory budget.
+			start_time = time.time()
+			rows, cols, match_scores = box_iou_util.chunked_box_iou_topk(gt_boxes, pred_boxes, k=k, threshold=threshold, mode=mode, memory_budget=memory_budget)
+			chunked_elapsed_time = time.time() - start_time
+
+			assert len(match_scores) == dense_num_matches, f"{len(match_scores)} != {dense_num_matches}."
+			assert torch.allclose(match_scores, top_scores[is_valid], atol=1e-5)
+			print(f"\t{mode}: dense = {dense_elapsed_time} sec ({num_gts * num_preds * 4 / 1024**2:.1f} MB matrix), chunked = {chunked_elapsed_time} sec ({memory_budget / 1024**2:.1f} MB budget), #matches = {len(match_scores)}.")
+
 def main():
 	box_iou_test()
 	box_iou_loss_test()
 
+	chunked_box_iou_benchmark()
+
 #--------------------------------------------------------------------
 
 if "__main__" == __name__:
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Pairwise box IoU, GIoU, DIoU, and CIoU kernels.
+#	- Boxes are in (x1, y1, x2, y2) format s.t. 0 <= x1 < x2 and 0 <= y1 < y2, as in torchvision.ops.
+#	- Inputs can be NumPy arrays or CPU torch tensors. Torch tensors are viewed as NumPy arrays without a copy, and the outputs are converted back.
+#	- chunked_box_iou_topk() evaluates the (N, M) score matrix in tiles under a memory budget and only keeps the sparse top-k matches of each row.
+# REF [site] >> https://github.com/pytorch/vision/blob/main/torchvision/ops/boxes.py
+
+import math
+import numpy as np
+
+BOX_IOU_MODES = ('iou', 'giou', 'diou', 'ciou')
+
+# Approximate number of float temporaries per matrix element in _pairwise_scores().
+_NUM_TEMPORARIES_PER_ELEMENT = 12
+
+def _to_numpy(boxes):
+	# Returns a NumPy view of boxes and whether boxes is a torch tensor.
+	if isinstance(boxes, np.ndarray):
+		return boxes, False
+	if hasattr(boxes, 'detach') and hasattr(boxes, 'numpy'):
+		if boxes.device.type != 'cpu':
+			raise ValueError('Only CPU tensors are supported: {}.'.format(boxes.device))
+		return boxes.detach().numpy(), True
+	return np.asarray(boxes), False
+
+def _from_numpy(array, is_torch):
+	if is_torch:
+		import torch
+		return torch.from_numpy(np.ascontiguousarray(array))
+	return array
+
+def _pairwise_scores(boxes1, boxes2, mode='iou', eps=1e-7):
+	# (N, 4) & (M, 4) -> (N, M).
+	area1 = (boxes1[:,2] - boxes1[:,0]) * (boxes1[:,3] - boxes1[:,1])
+	area2 = (boxes2[:,2] - boxes2[:,0]) * (boxes2[:,3] - boxes2[:,1])
+
+	lt = np.maximum(boxes1[:,None,:2], boxes2[None,:,:2])  # (N, M, 2).
+	rb = np.minimum(boxes1[:,None,2:], boxes2[None,:,2:])  # (N, M, 2).
+	wh = np.clip(rb - lt, 0, None)
+	inter = wh[...,0] * wh[...,1]
+	union = area1[:,None] + area2[None,:] - inter
+	iou = inter / union
+	if 'iou' == mode:
+		return iou
+
+	# Smallest enclosing box.
+	lti = np.minimum(boxes1[:,None,:2], boxes2[None,:,:2])
+	rbi = np.maximum(boxes1[:,None,2:], boxes2[None,:,2:])
+	whi = np.clip(rbi - lti, 0, None)
+	if 'giou' == mode:
+		area_i = whi[...,0] * whi[...,1]
+		return iou - (area_i - union) / area_i
+
+	diagonal_distance_squared = whi[...,0]**2 + whi[...,1]**2 + eps
+	centers1 = (boxes1[:,:2] + boxes1[:,2:]) / 2
+	centers2 = (boxes2[:,:2] + boxes2[:,2:]) / 2
+	centers_distance_squared = ((centers1[:,None,:] - centers2[None,:,:])**2).sum(axis=-1)
+	diou = iou - centers_distance_squared / diagonal_distance_squared
+	if 'diou' == mode:
+		return diou
+
+	atan1 = np.arctan((boxes1[:,2] - boxes1[:,0]) / (boxes1[:,3] - boxes1[:,1]))
+	atan2 = np.arctan((boxes2[:,2] - boxes2[:,0]) / (boxes2[:,3] - boxes2[:,1]))
+	v = (4 / (math.pi**2)) * (atan1[:,None] - atan2[None,:])**2
+	alpha = v / (1 - iou + v + eps)
+	return diou - alpha * v
+
+def box_iou(boxes1, boxes2, mode='iou', eps=1e-7):
+	"""Dense (N, M) matrix of the pairwise IoU, GIoU, DIoU, or CIoU scores."""
+	if mode not in BOX_IOU_MODES:
+		raise ValueError('Invalid box IoU mode: {}.'.format(mode))
+	boxes1, is_torch = _to_numpy(boxes1)
+	boxes2, _ = _to_numpy(boxes2)
+	return _from_numpy(_pairwise_scores(boxes1, boxes2, mode, eps), is_torch)
+
+def get_tile_shape(num_rows, num_cols, k, itemsize, memory_budget, max_tile_rows=None):
+	# Square-ish tiles whose temporaries fit in memory_budget bytes.
+	max_elements = max(memory_budget // (itemsize * _NUM_TEMPORARIES_PER_ELEMENT), 1)
+	tile_rows = int(min(num_rows, max(math.isqrt(max_elements), 1)))
+	if max_tile_rows:
+		tile_rows = min(tile_rows, max_tile_rows)
+	tile_cols = int(min(num_cols, max(max_elements // tile_rows - k, 1)))
+	return tile_rows, tile_cols
+
+def chunked_box_iou_topk(boxes1, boxes2, k=1, threshold=None, mode='iou', memory_budget=256 * 1024**2, eps=1e-7):
+	"""Top-k matches in boxes2 of each box in boxes1 without materializing the dense (N, M) score matrix.
+
+	The score matrix is evaluated in tiles whose temporaries take about memory_budget bytes.
+	Matches whose scores are < threshold are dropped.
+	If threshold > 0, only overlapping boxes can match in all the modes, so the tiles which cannot overlap along the x-axis are skipped.
+	Returns sparse matches (row indices, column indices, scores), sorted by row index and then by score in descending order.
+	"""
+	if mode not in BOX_IOU_MODES:
+		raise ValueError('Invalid box IoU mode: {}.'.format(mode))
+	boxes1, is_torch = _to_numpy(boxes1)
+	boxes2, _ = _to_numpy(boxes2)
+	dtype = np.result_type(boxes1.dtype, boxes2.dtype, np.float32)
+	boxes1, boxes2 = boxes1.astype(dtype, copy=False), boxes2.astype(dtype, copy=False)
+
+	num_rows, num_cols = len(boxes1), len(boxes2)
+	k = min(k, num_cols)
+	if num_rows == 0 or k == 0:
+		empty_indices = np.zeros((0,), dtype=np.int64)
+		return _from_numpy(empty_indices, is_torch), _from_numpy(empty_indices.copy(), is_torch), _from_numpy(np.zeros((0,), dtype=dtype), is_torch)
+	is_pruned = threshold is not None and threshold > 0
+	# Narrow tiles of rows for the pruning.
+	tile_rows, tile_cols = get_tile_shape(num_rows, num_cols, k, dtype.itemsize, memory_budget, max_tile_rows=256 if is_pruned else None)
+	if is_pruned:
+		# Sort both sets along the x-axis so that a tile of rows only overlaps a narrow range of columns.
+		row_order = np.argsort(boxes1[:,0], kind='stable')
+		col_order = np.argsort(boxes2[:,0], kind='stable')
+		boxes1, boxes2 = boxes1[row_order], boxes2[col_order]
+		max_col_width = (boxes2[:,2] - boxes2[:,0]).max()
+
+	rows_list, cols_list, scores_list = list(), list(), list()
+	for row_start in range(0, num_rows, tile_rows):
+		row_boxes = boxes1[row_start:row_start + tile_rows]
+		if is_pruned:
+			col_lo = np.searchsorted(boxes2[:,0], row_boxes[:,0].min() - max_col_width, side='right')
+			col_hi = np.searchsorted(boxes2[:,0], row_boxes[:,2].max(), side='left')
+		else:
+			col_lo, col_hi = 0, num_cols
+
+		best_scores = np.full((len(row_boxes), k), -np.inf, dtype=dtype)
+		best_cols = np.full((len(row_boxes), k), -1, dtype=np.int64)
+		for col_start in range(col_lo, col_hi, tile_cols):
+			col_end = min(col_start + tile_cols, col_hi)
+			scores = _pairwise_scores(row_boxes, boxes2[col_start:col_end], mode, eps)
+			if threshold is not None:
+				scores[scores < threshold] = -np.inf
+
+			# Merge the running top-k with this tile.
+			scores = np.concatenate([best_scores, scores], axis=1)
+			cols = np.concatenate([best_cols, np.broadcast_to(np.arange(col_start, col_end), (len(row_boxes), col_end - col_start))], axis=1)
+			top_indices = np.argpartition(-scores, k - 1, axis=1)[:,:k]
+			best_scores = np.take_along_axis(scores, top_indices, axis=1)
+			best_cols = np.take_along_axis(cols, top_indices, axis=1)
+
+		is_valid = np.isfinite(best_scores)
+		rows_list.append(np.nonzero(is_valid)[0] + row_start)
+		cols_list.append(best_cols[is_valid])
+		scores_list.append(best_scores[is_valid])
+
+	rows, cols, scores = np.concatenate(rows_list), np.concatenate(cols_list), np.concatenate(scores_list)
+	if is_pruned:
+		rows, cols = row_order[rows], col_order[cols]
+	# Sort by row index and then by score in descending order.
+	order = np.lexsort((-scores, rows))
+	return _from_numpy(rows[order], is_torch), _from_numpy(cols[order], is_torch), _from_numpy(scores[order], is_torch)
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 
-import time
+import os, time
 import numpy as np
 import cv2
 import tensorflow as tf
@@ -9,10 +9,16 @@ from nms import nms
 # REF [site] >>
 #	https://github.com/cudamat/cudamat/blob/6565e63a23a2d61b046b8d115346130da05e7d31/setup.py
 #	https://github.com/MrGF/py-faster-rcnn-windows/blob/master/lib/setup.py
-import py_cpu_nms, cpu_nms, gpu_nms
-import py_parallel_nms_cpu, py_parallel_nms_gpu
+import py_cpu_nms, cpu_nms
+import py_parallel_nms_cpu
+try:
+	import gpu_nms, py_parallel_nms_gpu
+except ImportError:
+	# Built by setup_cpu.py without CUDA.
+	gpu_nms, py_parallel_nms_gpu = None, None
+import vectorized_nms, parallel_cpu_nms
 
-def main():
+def nms_comparison_test():
 	np.random.seed(37)
 
 	max_x, max_y = 10000, 10000
@@ -65,13 +71,14 @@ def main():
 
 	#--------------------
 	# REF [site] >> https://github.com/rbgirshick/py-faster-rcnn
-	print('Start gpu_nms...')
-	start_time = time.time()
-	selected_indices = gpu_nms.gpu_nms(boxes_scores, iou_threshold)
-	print('\tElapsed time = {}'.format(time.time() - start_time))
-	print('\t#selected boxes =', len(selected_indices))
-	#print('\tSelected indices =', selected_indices)
-	print('End gpu_nms.')
+	if gpu_nms:
+		print('Start gpu_nms...')
+		start_time = time.time()
+		selected_indices = gpu_nms.gpu_nms(boxes_scores, iou_threshold)
+		print('\tElapsed time = {}'.format(time.time() - start_time))
+		print('\t#selected boxes =', len(selected_indices))
+		#print('\tSelected indices =', selected_indices)
+		print('End gpu_nms.')
 
 	"""
 	#--------------------
@@ -141,11 +148,119 @@ def main():
 		#print('\tSelected indices =', selected_indices)
 	print('End tf.')
 
+def generate_boxes(num_boxes, max_x, max_y, max_box_size):
+	x1s = np.random.randint(max_x - max_box_size, size=num_boxes)
+	y1s = np.random.randint(max_y - max_box_size, size=num_boxes)
+	widths = np.random.randint(1, max_box_size, size=num_boxes)
+	heights = np.random.randint(1, max_box_size, size=num_boxes)
+	scores = np.random.rand(num_boxes)
+	return np.stack([x1s, y1s, x1s + widths, y1s + heights, scores], axis=1).astype(np.float32)
+
+def vectorized_nms_test():
+	np.random.seed(37)
+
+	iou_threshold = 0.5
+	max_x, max_y = 10000, 10000
+	max_box_size = 200
+
+	for num_boxes in [1000, 10000, 100000]:
+		boxes_scores = generate_boxes(num_boxes, max_x, max_y, max_box_size)
+		print('#boxes = {}:'.format(num_boxes))
+
+		#--------------------
+		# REF [site] >> https://github.com/rbgirshick/py-faster-rcnn
+		start_time = time.time()
+		selected_indices = py_cpu_nms.py_cpu_nms(boxes_scores, iou_threshold)
+		print('\tpy_cpu_nms: elapsed time = {}, #selected boxes = {}.'.format(time.time() - start_time, len(selected_indices)))
+
+		start_time = time.time()
+		selected_indices = cpu_nms.cpu_nms(boxes_scores, iou_threshold)
+		print('\tcpu_nms: elapsed time = {}, #selected boxes = {}.'.format(time.time() - start_time, len(selected_indices)))
+
+		#--------------------
+		start_time = time.time()
+		selected_indices = vectorized_nms.vectorized_nms(boxes_scores, iou_threshold)
+		print('\tvectorized_nms: elapsed time = {}, #selected boxes = {}.'.format(time.time() - start_time, len(selected_indices)))
+
+		start_time = time.time()
+		selected_indices = vectorized_nms.vectorized_nms(boxes_scores, iou_threshold, top_k=num_boxes // 10)
+		print('\tvectorized_nms (top-k = {}): elapsed time = {}, #selected boxes = {}.'.format(num_boxes // 10, time.time() - start_time, len(selected_indices)))
+
+		# A batch of 8 images with 80 classes in one call.
+		image_ids = np.random.randint(8, size=num_boxes)
+		class_ids = np.random.randint(80, size=num_boxes)
+		start_time = time.time()
+		selected_indices = vectorized_nms.batched_nms(boxes_scores, iou_threshold, image_ids, class_ids)
+		print('\tbatched_nms: elapsed time = {}, #selected boxes = {}.'.format(time.time() - start_time, len(selected_indices)))
+
+		# Tied scores, which are ordered like py_cpu_nms, so the same boxes are kept.
+		tied_boxes_scores = boxes_scores.copy()
+		tied_boxes_scores[:,4] = np.round(tied_boxes_scores[:,4] * 4) / 4
+		selected_indices = py_cpu_nms.py_cpu_nms(tied_boxes_scores, iou_threshold)
+		assert vectorized_nms.vectorized_nms(tied_boxes_scores, iou_threshold) == [int(idx) for idx in selected_indices]
+		assert vectorized_nms.batched_nms(tied_boxes_scores, iou_threshold) == vectorized_nms.vectorized_nms(tied_boxes_scores, iou_threshold)
+		print('\tvectorized_nms & batched_nms with tied scores: same as py_cpu_nms.')
+
+		# Soft-NMS is sequential by nature, so only the top-k boxes are considered.
+		top_k = min(num_boxes, 10000)
+		start_time = time.time()
+		selected_indices, selected_scores = vectorized_nms.soft_nms(boxes_scores, sigma=0.5, iou_threshold=iou_threshold, score_threshold=0.001, method='gaussian', top_k=top_k)
+		print('\tsoft_nms (top-k = {}): elapsed time = {}, #selected boxes = {}.'.format(top_k, time.time() - start_time, len(selected_indices)))
+
+def parallel_cpu_nms_scaling_test():
+	np.random.seed(37)
+
+	iou_threshold = 0.5
+	max_x, max_y = 10000, 10000
+	max_box_size = 200
+	num_boxes, num_images, num_classes = 1000000, 16, 80
+
+	boxes_scores = generate_boxes(num_boxes, max_x, max_y, max_box_size)
+	image_ids = np.random.randint(num_images, size=num_boxes)
+	class_ids = np.random.randint(num_classes, size=num_boxes)
+	print('#boxes = {}, #images = {}, #classes = {}:'.format(num_boxes, num_images, num_classes))
+
+	start_time = time.time()
+	selected_indices = vectorized_nms.batched_nms(boxes_scores, iou_threshold, image_ids, class_ids)
+	print('\tbatched_nms: elapsed time = {}, #selected boxes = {}.'.format(time.time() - start_time, len(selected_indices)))
+
+	# Tied scores, for which the merge has to break ties like batched_nms().
+	tied_boxes_scores = boxes_scores.copy()
+	tied_boxes_scores[:,4] = np.round(tied_boxes_scores[:,4] * 4) / 4
+	tied_selected_indices = vectorized_nms.batched_nms(tied_boxes_scores, iou_threshold, image_ids, class_ids)
+	tied_top_k_selected_indices = vectorized_nms.batched_nms(tied_boxes_scores, iou_threshold, image_ids, class_ids, top_k=100)
+
+	num_cores = os.cpu_count()
+	for use_threads in [False, True]:
+		num_workers = 1
+		while True:
+			with parallel_cpu_nms.ParallelCpuNms(num_workers, use_threads=use_threads) as nms:
+				nms(boxes_scores[:1000], iou_threshold)  # Warm up the workers.
+
+				start_time = time.time()
+				parallel_selected_indices = nms(boxes_scores, iou_threshold, image_ids, class_ids)
+				print('\tParallelCpuNms ({}, #workers = {}): elapsed time = {}, #selected boxes = {}.'.format('threads' if use_threads else 'processes', num_workers, time.time() - start_time, len(parallel_selected_indices)))
+				assert parallel_selected_indices == selected_indices
+
+				# Tied scores.
+				assert nms(tied_boxes_scores, iou_threshold, image_ids, class_ids) == tied_selected_indices
+				assert nms(tied_boxes_scores, iou_threshold, image_ids, class_ids, top_k=100) == tied_top_k_selected_indices
+
+			if num_workers >= num_cores:
+				break
+			num_workers = min(num_workers * 2, num_cores)
+
+def main():
+	nms_comparison_test()
+	vectorized_nms_test()
+	parallel_cpu_nms_scaling_test()
+
 #--------------------------------------------------------------------
 
 # Usage:
 #	REF [site] >> http://docs.cython.org/en/latest/src/tutorial/cython_tutorial.html
 #	python setup_nms.py build_ext --inplace
+#		Use setup_cpu.py on machines without CUDA.
 #	python nms_test.py
 
 if '__main__' == __name__:
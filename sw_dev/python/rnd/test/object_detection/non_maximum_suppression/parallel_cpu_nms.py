@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Pure-CPU parallel NMS which does not need CUDA.
+#	- The boxes are grouped by (image, class), and the groups are processed by a process or thread pool.
+#	- The boxes are shared with the worker processes through a shared-memory buffer, so that box arrays are not pickled.
+#	- The results of the groups are merged in a deterministic order, which does not depend on the number of workers or on the completion order.
+
+import os, concurrent.futures
+from multiprocessing import shared_memory
+import numpy as np
+import vectorized_nms
+
+def _run_nms(dets, ranges, thresh, top_k, score_threshold):
+	# Returns the indices of the kept boxes of the groups in ranges, as indices into dets, and their ranks in the kept boxes of their groups.
+	kept = [start + np.array(vectorized_nms.vectorized_nms(dets[start:end], thresh, top_k=top_k, score_threshold=score_threshold), dtype=np.int64) for start, end in ranges]
+	if not kept:
+		return np.zeros((0,), dtype=np.int64), np.zeros((0,), dtype=np.int64)
+	return np.concatenate(kept), np.concatenate([np.arange(len(indices)) for indices in kept])
+
+def _shared_memory_worker(shm_name, shape, dtype, ranges, thresh, top_k, score_threshold):
+	shm = shared_memory.SharedMemory(name=shm_name)
+	try:
+		dets = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+		kept = _run_nms(dets, ranges, thresh, top_k, score_threshold)
+		del dets  # Release the buffer before closing the shared memory.
+		return kept
+	finally:
+		shm.close()
+
+class ParallelCpuNms(object):
+	"""NMS over the boxes of a batch of images and classes, split across a pool of workers by image and by class.
+
+	The output is the same as vectorized_nms.batched_nms(): a list of the indices of the kept boxes, in descending score order, with tied scores ordered by group and then like vectorized_nms() on the boxes of the group.
+	"""
+
+	def __init__(self, num_workers=None, use_threads=False, min_boxes_per_task=4096):
+		self.num_workers = num_workers if num_workers else os.cpu_count()
+		self.use_threads = use_threads
+		self.min_boxes_per_task = min_boxes_per_task  # Small groups are bundled into a task to amortize the dispatch overhead.
+		self.executor = concurrent.futures.ThreadPoolExecutor(self.num_workers) if use_threads else concurrent.futures.ProcessPoolExecutor(self.num_workers)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def close(self):
+		self.executor.shutdown(wait=True)
+
+	def __call__(self, dets, thresh, image_ids=None, class_ids=None, top_k=None, score_threshold=None):
+		if len(dets) == 0:
+			return list()
+
+		num_boxes = len(dets)
+		image_ids = np.zeros(num_boxes, dtype=np.int64) if image_ids is None else np.asarray(image_ids, dtype=np.int64)
+		class_ids = np.zeros(num_boxes, dtype=np.int64) if class_ids is None else np.asarray(class_ids, dtype=np.int64)
+		group_ids = image_ids * (class_ids.max() + 1) + class_ids
+
+		# Make the boxes of each group contiguous.
+		group_order = np.argsort(group_ids, kind='stable')
+		sorted_group_ids = group_ids[group_order]
+		boundaries = np.flatnonzero(np.diff(sorted_group_ids)) + 1
+		group_ranges = list(zip(np.concatenate([[0], boundaries]).tolist(), np.concatenate([boundaries, [num_boxes]]).tolist()))
+		tasks = self._make_tasks(group_ranges)
+
+		sorted_dets = np.ascontiguousarray(dets[group_order])
+		if self.use_threads:
+			futures = [self.executor.submit(_run_nms, sorted_dets, ranges, thresh, top_k, score_threshold) for ranges in tasks]
+			kept = [future.result() for future in futures]
+		else:
+			shm = shared_memory.SharedMemory(create=True, size=max(sorted_dets.nbytes, 1))
+			try:
+				shared_dets = np.ndarray(sorted_dets.shape, dtype=sorted_dets.dtype, buffer=shm.buf)
+				shared_dets[...] = sorted_dets
+				del shared_dets
+				futures = [self.executor.submit(_shared_memory_worker, shm.name, sorted_dets.shape, sorted_dets.dtype, ranges, thresh, top_k, score_threshold) for ranges in tasks]
+				kept = [future.result() for future in futures]
+			finally:
+				shm.close()
+				shm.unlink()
+
+		# Deterministic merge: sort by score in descending order, ties broken like vectorized_nms.batched_nms(), by group and then by the order in the group.
+		kept, ranks = zip(*kept)
+		kept, ranks = group_order[np.concatenate(kept)], np.concatenate(ranks)
+		return kept[np.lexsort((ranks, group_ids[kept], -dets[kept,4]))].tolist()
+
+	def _make_tasks(self, group_ranges):
+		# Largest groups first for load balancing, with small groups bundled together.
+		group_ranges = sorted(group_ranges, key=lambda rng: rng[0] - rng[1])
+		tasks, task, task_size = list(), list(), 0
+		for start, end in group_ranges:
+			task.append((start, end))
+			task_size += end - start
+			if task_size >= self.min_boxes_per_task:
+				tasks.append(task)
+				task, task_size = list(), 0
+		if task:
+			tasks.append(task)
+		return tasks
@@ -0,0 +1,37 @@
+from distutils.core import setup
+from distutils.extension import Extension
+from Cython.Build import cythonize
+import numpy as np
+
+# CPU-only build of the NMS extensions, which does not need CUDA.
+# REF [site] >>
+#	https://cython.readthedocs.io/en/latest/src/userguide/source_files_and_compilation.html
+
+try:
+	numpy_include = np.get_include()
+except AttributeError:
+	numpy_include = np.get_numpy_include()
+
+ext_modules=[
+	Extension(
+		'cpu_nms',
+		sources=['cpu_nms.pyx'],
+		include_dirs=[numpy_include],
+		language='c++',
+	),
+	Extension(
+		'py_parallel_nms_cpu',
+		sources=['py_parallel_nms_cpu.pyx'],
+		include_dirs=[numpy_include],
+		language='c++',
+	),
+]
+
+# Usage:
+#	REF [site] >> http://docs.cython.org/en/latest/src/tutorial/cython_tutorial.html
+#	python setup_cpu.py build_ext --inplace
+
+setup(
+	name='nms_cpu_test',
+	ext_modules=cythonize(ext_modules, annotate=False, quiet=True),
+)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# NumPy-only NMS with the same output contract as py_cpu_nms.py_cpu_nms().
+#	- dets: (N, 5) array of (x1, y1, x2, y2, score).
+#	- Returns a list of the indices of the kept boxes, in descending score order.
+#	- A box is suppressed if its IoU with a kept box is > thresh.
+#	- Areas use the legacy "+1" pixel convention (offset=1) like py_cpu_nms.
+#
+# The boxes are processed in blocks of block_size boxes in descending score order.
+#	1. The boxes of a block are suppressed by the boxes kept in the previous blocks.
+#	2. The remaining boxes of the block are resolved among themselves by the Cluster-NMS fixed-point iteration.
+# Only the box pairs in neighboring cells of a uniform grid are evaluated.
+# REF [paper] >> "Enhancing Geometric Factors in Model Learning and Inference for Object Detection and Instance Segmentation", arXiv 2020.
+#	Cluster-NMS: the fixed-point iteration over the upper-triangular IoU matrix gives the same result as greedy NMS.
+
+import numpy as np
+
+def _paired_iou(boxes1, boxes2, offset=1):
+	# (N, 4) & (N, 4) -> (N,).
+	area1 = (boxes1[:,2] - boxes1[:,0] + offset) * (boxes1[:,3] - boxes1[:,1] + offset)
+	area2 = (boxes2[:,2] - boxes2[:,0] + offset) * (boxes2[:,3] - boxes2[:,1] + offset)
+
+	w = np.minimum(boxes1[:,2], boxes2[:,2]) - np.maximum(boxes1[:,0], boxes2[:,0]) + offset
+	h = np.minimum(boxes1[:,3], boxes2[:,3]) - np.maximum(boxes1[:,1], boxes2[:,1]) + offset
+	inter = np.maximum(w, 0) * np.maximum(h, 0)
+	return inter / (area1 + area2 - inter)
+
+def _expand_ranges(lo, hi):
+	# Returns all the pairs (i, j) s.t. lo[i] <= j < hi[i].
+	counts = hi - lo
+	starts = np.cumsum(counts) - counts
+	rows = np.repeat(np.arange(len(lo)), counts)
+	cols = np.arange(counts.sum()) - np.repeat(starts - lo, counts)
+	return rows, cols
+
+class _GridIndex(object):
+	# Uniform grid over boxes, which are bucketed into the cell containing their top-left corner.
+	# The cell size is the maximum box size, so a query box only has to visit a few neighboring cells.
+	def __init__(self, boxes):
+		self.boxes = boxes
+		self.cell_size = max((boxes[:,2:4] - boxes[:,0:2]).max(), 1)
+		cells = np.floor(boxes[:,0:2] / self.cell_size).astype(np.int64)
+		self.min_cell, self.max_cell = cells.min(axis=0), cells.max(axis=0)
+		self.num_cols = self.max_cell[0] - self.min_cell[0] + 1
+		keys = (cells[:,1] - self.min_cell[1]) * self.num_cols + (cells[:,0] - self.min_cell[0])
+		self.order = np.argsort(keys, kind='stable')
+		self.keys = keys[self.order]
+
+	def candidate_pairs(self, queries, offset=1, max_pairs=1 << 22):
+		# Yields chunks of (query index, box index) pairs whose boxes may overlap.
+		lo_cells = np.floor((queries[:,0:2] - self.cell_size - offset) / self.cell_size).astype(np.int64)
+		hi_cells = np.floor((queries[:,2:4] + offset) / self.cell_size).astype(np.int64)
+		lo_cells = np.maximum(lo_cells, self.min_cell)
+		hi_cells = np.minimum(hi_cells, self.max_cell)
+		num_rows = np.maximum(hi_cells[:,1] - lo_cells[:,1] + 1, 0) * (hi_cells[:,0] >= lo_cells[:,0])
+
+		# A range of keys per (query, row).
+		query_indices, row_offsets = _expand_ranges(np.zeros_like(num_rows), num_rows)
+		row_keys = (lo_cells[query_indices,1] + row_offsets - self.min_cell[1]) * self.num_cols
+		lo = np.searchsorted(self.keys, row_keys + lo_cells[query_indices,0] - self.min_cell[0], side='left')
+		hi = np.searchsorted(self.keys, row_keys + hi_cells[query_indices,0] - self.min_cell[0], side='right')
+
+		# Split the ranges so that each chunk has at most about max_pairs pairs.
+		cum_counts = np.cumsum(hi - lo)
+		if len(cum_counts) == 0 or cum_counts[-1] == 0:
+			return
+		bounds = np.concatenate([[0], np.searchsorted(cum_counts, np.arange(max_pairs, cum_counts[-1], max_pairs), side='left') + 1, [len(lo)]])
+		for start, end in zip(bounds[:-1], bounds[1:]):
+			if start < end:
+				range_indices, box_indices = _expand_ranges(lo[start:end], hi[start:end])
+				yield query_indices[start + range_indices], self.order[box_indices]
+
+def _prefilter(scores, top_k=None, score_threshold=None):
+	# Returns candidate indices in descending score order.
+	candidates = np.arange(len(scores)) if score_threshold is None else np.flatnonzero(scores > score_threshold)
+	if top_k is None or top_k >= len(candidates):
+		# The same order as scores.argsort()[::-1] in py_cpu_nms, including the order of tied scores, which depends on NumPy's default sort.
+		order = scores.argsort()[::-1]
+		return order if score_threshold is None else order[scores[order] > score_threshold]
+	# O(N) selection instead of a full sort of all the boxes.
+	# Boxes of tied scores are in descending index order, and which of them are kept at the top_k boundary is arbitrary, so the result can differ from py_cpu_nms on ties.
+	candidates = np.sort(candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]])
+	return candidates[np.argsort(scores[candidates], kind='stable')[::-1]]
+
+def _is_suppressed(boxes, kept_indices, thresh, offset=1):
+	# kept_indices: grid indices over the kept boxes of the previous blocks, in descending score order.
+	# The boxes which are already suppressed by higher-scoring kept boxes are not evaluated any more.
+	is_suppressed = np.zeros(len(boxes), dtype=bool)
+	for kept_index in kept_indices:
+		active_indices = np.flatnonzero(~is_suppressed)
+		if len(active_indices) == 0:
+			break
+		for query_indices, box_indices in kept_index.candidate_pairs(boxes[active_indices], offset):
+			is_overlapped = _paired_iou(boxes[active_indices[query_indices]], kept_index.boxes[box_indices], offset) > thresh
+			is_suppressed[active_indices[query_indices[is_overlapped]]] = True
+	return is_suppressed
+
+def _cluster_nms(boxes, thresh, offset=1):
+	# boxes: (N, 4), sorted in descending score order.
+	# Returns a boolean mask of the kept boxes.
+	rows, cols = list(), list()
+	for row_indices, col_indices in _GridIndex(boxes).candidate_pairs(boxes, offset):
+		# Pairs (i, j) where box i has a higher score than box j and IoU(i, j) > thresh.
+		is_valid = row_indices < col_indices
+		row_indices, col_indices = row_indices[is_valid], col_indices[is_valid]
+		is_overlapped = _paired_iou(boxes[row_indices], boxes[col_indices], offset) > thresh
+		rows.append(row_indices[is_overlapped])
+		cols.append(col_indices[is_overlapped])
+	if not rows:
+		return np.ones(len(boxes), dtype=bool)
+	rows, cols = np.concatenate(rows), np.concatenate(cols)
+
+	keep = np.ones(len(boxes), dtype=bool)
+	while True:
+		new_keep = np.ones(len(boxes), dtype=bool)
+		new_keep[cols[keep[rows]]] = False
+		if np.array_equal(new_keep, keep):
+			return keep
+		keep = new_keep
+
+def _blocked_nms(boxes, thresh, block_size=1024, offset=1):
+	# boxes: (N, 4), sorted in descending score order.
+	# Returns a boolean mask of the kept boxes.
+	is_kept = np.zeros(len(boxes), dtype=bool)
+	kept_indices = list()  # Grid indices over the boxes kept in the previous blocks.
+	for start in range(0, len(boxes), block_size):
+		block = boxes[start:start + block_size]
+
+		active_indices = np.flatnonzero(~_is_suppressed(block, kept_indices, thresh, offset))
+		if len(active_indices) == 0:
+			continue
+		active_indices = active_indices[_cluster_nms(block[active_indices], thresh, offset)]
+
+		is_kept[start + active_indices] = True
+		kept_boxes = block[active_indices]
+		# Merge the indices of similar sizes so that there are only O(log N) indices to visit.
+		while kept_indices and len(kept_indices[-1].boxes) <= 2 * len(kept_boxes):
+			kept_boxes = np.concatenate([kept_indices.pop().boxes, kept_boxes], axis=0)
+		kept_indices.append(_GridIndex(kept_boxes))
+	return is_kept
+
+def vectorized_nms(dets, thresh, top_k=None, score_threshold=None, block_size=1024, offset=1):
+	"""Vectorized drop-in replacement for py_cpu_nms.py_cpu_nms().
+
+	top_k keeps only the top_k highest-scoring boxes before NMS, and score_threshold drops the boxes whose score is <= score_threshold.
+	"""
+	if len(dets) == 0:
+		return list()
+
+	order = _prefilter(dets[:,4], top_k, score_threshold)
+	is_kept = _blocked_nms(dets[order,:4].astype(np.float64), thresh, block_size, offset)
+	return order[is_kept].tolist()
+
+def batched_nms(dets, thresh, image_ids=None, class_ids=None, top_k=None, score_threshold=None, block_size=1024, offset=1):
+	"""NMS over the boxes of a batch of images and classes in one call.
+
+	dets: (N, 5) array of (x1, y1, x2, y2, score) of all the images and classes.
+	image_ids, class_ids: (N,) integer arrays. Boxes are only suppressed by boxes of the same image and class.
+	top_k is applied per (image, class) group.
+	Returns a list of the indices of the kept boxes, in descending score order. Tied scores are ordered by group, and then like vectorized_nms() on the boxes of the group.
+	"""
+	if len(dets) == 0:
+		return list()
+
+	num_boxes = len(dets)
+	image_ids = np.zeros(num_boxes, dtype=np.int64) if image_ids is None else np.asarray(image_ids, dtype=np.int64)
+	class_ids = np.zeros(num_boxes, dtype=np.int64) if class_ids is None else np.asarray(class_ids, dtype=np.int64)
+	_, group_ids = np.unique(image_ids * (class_ids.max() + 1) + class_ids, return_inverse=True)
+	group_ids = group_ids.ravel()
+	scores = dets[:,4]
+
+	# The candidates of each group are ordered like vectorized_nms() on the boxes of the group, so that tied scores are ordered like py_cpu_nms for a single group.
+	group_order = np.argsort(group_ids, kind='stable')
+	boundaries = np.flatnonzero(np.diff(group_ids[group_order])) + 1
+	orders, ranks = list(), list()
+	for group_indices in np.split(group_order, boundaries):
+		order = group_indices[_prefilter(scores[group_indices], top_k, score_threshold)]
+		orders.append(order)
+		ranks.append(np.arange(len(order)))
+	order, ranks = np.concatenate(orders), np.concatenate(ranks)
+	if len(order) == 0:
+		return list()
+	# Descending score order, with ties broken by group and then by the order in the group, which is what NMS of a group depends on.
+	order = order[np.lexsort((ranks, group_ids[order], -scores[order]))]
+
+	# Coordinate-offset trick: shift each group to its own region along the x-axis so that boxes of different groups never overlap.
+	boxes = dets[order,:4].astype(np.float64)
+	span = boxes[:,[0, 2]].max() - boxes[:,[0, 2]].min() + offset + 1
+	boxes[:,[0, 2]] += (group_ids[order] * span)[:,None]
+
+	is_kept = _blocked_nms(boxes, thresh, block_size, offset)
+	return order[is_kept].tolist()
+
+# REF [paper] >> "Soft-NMS -- Improving Object Detection With One Line of Code", ICCV 2017.
+def soft_nms(dets, sigma=0.5, iou_threshold=0.3, score_threshold=0.001, method='linear', top_k=None, offset=1):
+	"""Soft-NMS which decays the scores of the overlapping boxes instead of removing them.
+
+	method: 'linear', 'gaussian', or 'hard' (which is equivalent to vectorized_nms()).
+	Returns a list of the indices of the kept boxes and an array of their decayed scores, in selection order.
+	"""
+	if method not in ('linear', 'gaussian', 'hard'):
+		raise ValueError('Invalid Soft-NMS method: {}.'.format(method))
+	if len(dets) == 0:
+		return list(), np.zeros((0,), dtype=dets.dtype)
+
+	indices = _prefilter(dets[:,4], top_k, None)
+	boxes = dets[indices,:4].astype(np.float64)
+	scores = dets[indices,4].astype(np.float64)
+
+	keep, kept_scores = list(), list()
+	while len(indices) > 0:
+		best = np.argmax(scores)
+		if scores[best] <= score_threshold:
+			break
+		keep.append(indices[best])
+		kept_scores.append(scores[best])
+
+		best_box = boxes[best]
+		remaining = np.arange(len(indices)) != best
+		indices, boxes, scores = indices[remaining], boxes[remaining], scores[remaining]
+		if len(indices) == 0:
+			break
+
+		iou = _paired_iou(np.broadcast_to(best_box, boxes.shape), boxes, offset)
+		if 'linear' == method:
+			scores = np.where(iou > iou_threshold, scores * (1 - iou), scores)
+		elif 'gaussian' == method:
+			scores = scores * np.exp(-(iou * iou) / sigma)
+		else:
+			scores = np.where(iou > iou_threshold, 0, scores)
+
+		is_alive = scores > score_threshold
+		indices, boxes, scores = indices[is_alive], boxes[is_alive], scores[is_alive]
+
+	return [int(idx) for idx in keep], np.array(kept_scores, dtype=dets.dtype)